@@ -140,4 +140,42 @@ else:
     # Configuração relaxada para funcionar sem HTTPS
     SESSION_COOKIE_SAMESITE = 'Lax'
     SESSION_COOKIE_SECURE = False
-    CSRF_COOKIE_SECURE = False
\ No newline at end of file
+    CSRF_COOKIE_SECURE = False
+
+# --- RECOMENDAÇÕES ---
+
+# Componente colaborativa do recomendador:
+#   "hybrid" -> utilizadores semelhantes (tabela user_pair_stats)
+#   "item"   -> vizinhos filme-filme pré-calculados (build_item_neighbors)
+#   "mf"     -> fatores latentes treinados offline (train_factors)
+RECOMMENDER_MODE = os.getenv("RECOMMENDER_MODE", "hybrid").lower()
+
+# Debounce do refresh de recomendações: o job só corre depois de X segundos
+# sem novas avaliações do utilizador, e nunca espera mais do que o máximo.
+RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS = int(os.getenv("RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS", "30"))
+RECOMMENDATION_REFRESH_MAX_DELAY_SECONDS = int(os.getenv("RECOMMENDATION_REFRESH_MAX_DELAY_SECONDS", "120"))
+
+# Jobs falhados voltam à fila com backoff exponencial (base * 2^(tentativa-1))
+# até ao máximo de tentativas; um job "running" há mais de TIMEOUT segundos
+# (worker morreu) conta como tentativa falhada e é reposto na fila.
+RECOMMENDATION_JOB_MAX_ATTEMPTS = int(os.getenv("RECOMMENDATION_JOB_MAX_ATTEMPTS", "5"))
+RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS = int(os.getenv("RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS", "30"))
+RECOMMENDATION_JOB_TIMEOUT_SECONDS = int(os.getenv("RECOMMENDATION_JOB_TIMEOUT_SECONDS", "600"))
+
+# Diretório do modelo de fatores (aberto com np.memmap por cada worker gunicorn)
+RECOMMENDER_FACTORS_PATH = os.getenv(
+    "RECOMMENDER_FACTORS_PATH", str(BASE_DIR / "var" / "factors")
+)
+
+# Mínimo de avaliações para um filme entrar no top por média (leaderboard).
+# Com 1, um único voto de 5 estrelas pode liderar a tabela.
+LEADERBOARD_MIN_RATINGS = int(os.getenv("LEADERBOARD_MIN_RATINGS", "1"))
+
+# Os consumidores de RatingEvent param no primeiro buraco na sequência de
+# event_ids (transação ainda por fazer commit). Um buraco que dure mais do que
+# isto (s) é tratado como rollback e saltado.
+RATING_EVENT_GAP_TIMEOUT_SECONDS = float(os.getenv("RATING_EVENT_GAP_TIMEOUT_SECONDS", "30"))
+
+# Intervalo (s) com que o worker de recomendações atualiza o snapshot das
+# estatísticas do admin (totais de avaliações a partir do RatingEvent e tops).
+SYSTEM_STATS_REFRESH_SECONDS = float(os.getenv("SYSTEM_STATS_REFRESH_SECONDS", "60"))
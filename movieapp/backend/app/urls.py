@@ -9,6 +9,8 @@ from movies.views import (
     user_list,
     #user_recommendations,
     create_rating,
+    bulk_create_ratings,
+    upsert_my_rating,
     edit_rating,
     delete_rating,
     get_movie_ratings,
@@ -18,6 +20,7 @@ from movies.views import (
     admin_add_movie,
     admin_edit_movie,
     admin_delete_movie,
+    admin_export,
     system_statistics,
     user_profile,
     user_rating_history,
@@ -25,6 +28,7 @@ from movies.views import (
     movie_list,
     movie_detail,
     movie_search,
+    movie_autocomplete,
     list_my_ratings_details,
 )
 
@@ -41,9 +45,11 @@ urlpatterns = [
     path("api/auth/login/", login_user),
     path("api/auth/logout/", logout_user),
     path("api/ratings/<int:movie_id>/", create_rating),
+    path("api/ratings/bulk/", bulk_create_ratings),
     path("api/ratings/<int:rating_id>/edit/", edit_rating),
     path("api/ratings/<int:rating_id>/delete/", delete_rating),
     path("api/movies/<int:movie_id>/ratings/", get_movie_ratings),
+    path("api/movies/<int:movie_id>/my-rating/", upsert_my_rating),
     path("api/ratings/mine/", list_my_ratings),
     path("api/recommendations/mine/", list_my_recommendations),
     #path('api/movies/<int:movie_id>/', get_movie_details, name='movie_details'),
@@ -51,11 +57,13 @@ urlpatterns = [
     path("api/admin/movies/<int:movie_id>/edit/", admin_edit_movie),
     path("api/admin/movies/<int:movie_id>/delete/", admin_delete_movie),
     path("api/admin/statistics/", system_statistics),
+    path("api/admin/export/<str:dataset>/", admin_export),
     path("api/profile/", user_profile),
     path("api/profile/ratings/", user_rating_history),
     path("api/profile/recommendations/", user_recommendation_history),
     path("api/movies/", movie_list),
     path("api/movies/<int:movie_id>/", movie_detail),
     path("api/movies/search/", movie_search), 
+    path("api/movies/autocomplete/", movie_autocomplete),
     path("api/ratings/mine/details/", list_my_ratings_details),
 ]
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import AppUser, Movie, Rating, Recommendation
+from .models import AppUser, Movie, Rating, Recommendation, RecommendationJob
 
 admin.site.register(AppUser)
 admin.site.register(Movie)
 admin.site.register(Rating)
-admin.site.register(Recommendation)
\ No newline at end of file
+admin.site.register(Recommendation)
+admin.site.register(RecommendationJob)
\ No newline at end of file
@@ -0,0 +1,519 @@
+"""
+Derived data that is kept in sync with the rating table.
+
+Every rating write ends up in apply_rating_change() (see signals.py), which
+updates the aggregates in place instead of recomputing them from scratch.
+The rebuild_* functions recompute everything and are used for backfills.
+"""
+
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, DecimalField, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.utils import timezone
+
+from .events import catch_up, record_rating_events, reset_consumer
+from .models import AppUser, Movie, MovieRatingStats, Rating, RatingEvent, SystemStats, UserPairStats
+
+
+def apply_rating_change(user_id, movie_id, old_score, new_score):
+    """
+    Propagate one rating write to the derived tables.
+    old_score is None for a new rating, new_score is None for a deletion.
+    """
+    apply_rating_changes(user_id, [(movie_id, old_score, new_score)])
+
+
+def apply_rating_changes(user_id, changes):
+    """
+    Propagate several rating writes of one user, as (movie_id, old_score,
+    new_score) tuples, with a fixed number of queries per derived table.
+    Used directly by write paths that bypass model signals (bulk_create).
+    Every change is also appended to the RatingEvent log (see events.py).
+    """
+    changes = [(m, old, new) for m, old, new in changes if old != new]
+    if not changes:
+        return
+
+    # Per movie: (count delta, score sum delta)
+    movie_deltas = defaultdict(lambda: [0, 0.0])
+    for movie_id, old_score, new_score in changes:
+        movie_deltas[movie_id][0] += (new_score is not None) - (old_score is not None)
+        movie_deltas[movie_id][1] += (new_score or 0.0) - (old_score or 0.0)
+
+    movie_ids = sorted(movie_deltas)
+    with transaction.atomic():
+        # The counter UPDATE goes first: it row-locks every changed movie, so
+        # a concurrent writer on the same movie waits for this commit and its
+        # co-rater read below sees our rating (no lost pair overlaps).
+        # Several movies are locked in id order so two writers cannot deadlock.
+        if len(movie_ids) > 1:
+            list(Movie.objects.select_for_update().filter(pk__in=movie_ids).order_by('pk').values_list('pk'))
+        new_count = F('rating_count') + _per_movie(movie_deltas, 0, IntegerField())
+        new_sum = F('rating_sum') + _per_movie(movie_deltas, 1, FloatField())
+        Movie.objects.filter(pk__in=movie_ids).update(
+            rating_count=new_count,
+            rating_sum=new_sum,
+            avg_rating=average_expression(new_count, new_sum),
+        )
+        record_rating_events(user_id, changes)
+        _update_pair_stats(user_id, changes)
+        _update_movie_stats(movie_deltas)
+        # invalidates the user's stored recommendations (see freshness.py)
+        AppUser.objects.filter(pk=user_id).update(rating_version=F('rating_version') + 1)
+
+
+def average_expression(count, total):
+    """
+    SQL for Movie.avg_rating: total / count rounded to 2 decimals like
+    Movie.average_rating, 0 when count is 0.
+    """
+    average = total / NullIf(count, 0)
+    # Postgres only rounds numeric, so round as decimal and hand back a float
+    rounded = Cast(Round(Cast(average, DecimalField(max_digits=16, decimal_places=6)), 2), FloatField())
+    return Coalesce(rounded, Value(0.0))
+
+
+def _per_movie(movie_deltas, position, output_field):
+    """CASE movie_id WHEN ... expression picking each movie's delta."""
+    return Case(
+        *(When(pk=movie_id, then=Value(delta[position])) for movie_id, delta in movie_deltas.items()),
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
+def _insert_or_add(model, unique_fields, add_fields, rows, other_fields=(), other_sql=(), batch_size=500):
+    """
+    INSERT rows (tuples of unique_fields + add_fields + other_fields values);
+    on a unique conflict add the add_fields values onto the existing row
+    instead of failing, so two writers that both create the same row each
+    get their delta applied. other_sql holds one conflict assignment per
+    other_field; {table} in it names the existing row.
+    """
+    meta, quote = model._meta, connection.ops.quote_name
+    table = quote(meta.db_table)
+    keys, added, others = (
+        [quote(meta.get_field(name).column) for name in names]
+        for names in (unique_fields, add_fields, other_fields)
+    )
+    row_sql = '(' + ', '.join(['%s'] * (len(keys) + len(added) + len(others))) + ')'
+    assignments = ', '.join(
+        [f"{column} = {table}.{column} + excluded.{column}" for column in added]
+        + [f"{column} = {sql.format(table=table)}" for column, sql in zip(others, other_sql)]
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(keys + added + others)}) "
+                f"VALUES {', '.join([row_sql] * len(batch))} "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {assignments}",
+                [value for row in batch for value in row],
+            )
+
+
+def _update_pair_stats(user_id, changes):
+    """
+    Adjust sum_abs_diff / overlap_count for every user that also rated the
+    changed movies. Cost is O(raters of those movies), not O(size of the
+    rating table).
+    """
+    scores = {movie_id: (old_score, new_score) for movie_id, old_score, new_score in changes}
+    co_ratings = (
+        Rating.objects.filter(movie_id__in=list(scores))
+        .exclude(user_id=user_id)
+        .values_list('user_id', 'movie_id', 'score')
+    )
+
+    # Per pair: [sum_abs_diff delta, overlap delta]
+    deltas = defaultdict(lambda: [0.0, 0])
+    for other_id, movie_id, other_score in co_ratings:
+        old_score, new_score = scores[movie_id]
+        delta = deltas[(min(user_id, other_id), max(user_id, other_id))]
+        if new_score is not None:
+            delta[0] += abs(new_score - other_score)
+            delta[1] += 1
+        if old_score is not None:
+            delta[0] -= abs(old_score - other_score)
+            delta[1] -= 1
+    if not deltas:
+        return
+
+    lower = [b for a, b in deltas if a == user_id]
+    upper = [a for a, b in deltas if b == user_id]
+    existing = {
+        (p.user_a_id, p.user_b_id): p
+        for p in UserPairStats.objects.select_for_update().filter(
+            Q(user_a_id=user_id, user_b_id__in=lower) | Q(user_b_id=user_id, user_a_id__in=upper)
+        )
+    }
+
+    to_update, to_create, to_delete = [], [], []
+    for (a, b), (diff, overlap_delta) in deltas.items():
+        pair = existing.get((a, b))
+        if pair is None:
+            if overlap_delta > 0:
+                to_create.append((a, b, diff, overlap_delta))
+            continue
+        pair.sum_abs_diff += diff
+        pair.overlap_count += overlap_delta
+        if pair.overlap_count <= 0:
+            to_delete.append(pair.pair_id)
+        else:
+            to_update.append(pair)
+
+    if to_update:
+        UserPairStats.objects.bulk_update(to_update, ['sum_abs_diff', 'overlap_count'])
+    if to_create:
+        # a pair first co-rated through two different movies at once is
+        # created by both writers
+        _insert_or_add(UserPairStats, ['user_a', 'user_b'], ['sum_abs_diff', 'overlap_count'], to_create)
+    if to_delete:
+        UserPairStats.objects.filter(pair_id__in=to_delete).delete()
+
+
+def remove_movie_pair_stats(movie_id):
+    """
+    Subtract a movie's co-ratings from the pair table. Called before the
+    movie is deleted: the cascade removes all its ratings in one statement,
+    so the per-rating post_delete handlers no longer see any co-raters.
+    """
+    rows = list(Rating.objects.filter(movie_id=movie_id).values_list('user_id', 'movie_id', 'score'))
+    pairs = {(a, b): (total, count) for a, b, total, count in compute_pair_stats(rows)}
+    if not pairs:
+        return
+
+    raters = sorted({user_id for user_id, _, _ in rows})
+    to_update, to_delete = [], []
+    for pair in UserPairStats.objects.select_for_update().filter(user_a_id__in=raters, user_b_id__in=raters):
+        delta = pairs.get((pair.user_a_id, pair.user_b_id))
+        if delta is None:
+            continue
+        pair.sum_abs_diff -= delta[0]
+        pair.overlap_count -= delta[1]
+        if pair.overlap_count <= 0:
+            to_delete.append(pair.pair_id)
+        else:
+            to_update.append(pair)
+
+    if to_update:
+        UserPairStats.objects.bulk_update(to_update, ['sum_abs_diff', 'overlap_count'], batch_size=1000)
+    if to_delete:
+        UserPairStats.objects.filter(pair_id__in=to_delete).delete()
+
+
+def _update_movie_stats(movie_deltas):
+    """Apply per-movie (count, sum) deltas to the leaderboard rows."""
+    existing = MovieRatingStats.objects.select_for_update().in_bulk(list(movie_deltas))
+
+    to_update, to_create, to_delete = [], [], []
+    for movie_id, (count_delta, sum_delta) in movie_deltas.items():
+        stats = existing.get(movie_id)
+        if stats is None:
+            if count_delta > 0:
+                to_create.append((movie_id, count_delta, sum_delta, sum_delta / count_delta))
+            continue
+        stats.rating_count += count_delta
+        stats.rating_sum += sum_delta
+        if stats.rating_count <= 0:
+            to_delete.append(movie_id)
+            continue
+        stats.average = stats.rating_sum / stats.rating_count
+        to_update.append(stats)
+
+    if to_update:
+        MovieRatingStats.objects.bulk_update(to_update, ['rating_count', 'rating_sum', 'average'])
+    if to_create:
+        # two first ratings of a movie can both find no row to update
+        _insert_or_add(
+            MovieRatingStats, ['movie'], ['rating_count', 'rating_sum'], to_create,
+            other_fields=['average'],
+            other_sql=['({table}.rating_sum + excluded.rating_sum) / ({table}.rating_count + excluded.rating_count)'],
+        )
+    if to_delete:
+        MovieRatingStats.objects.filter(movie_id__in=to_delete).delete()
+
+
+def leaderboard(min_ratings=None):
+    """
+    MovieRatingStats ordered best average first. Movies with fewer than
+    min_ratings ratings (default settings.LEADERBOARD_MIN_RATINGS) are left out.
+    """
+    if min_ratings is None:
+        min_ratings = settings.LEADERBOARD_MIN_RATINGS
+    return (
+        MovieRatingStats.objects.filter(rating_count__gte=max(min_ratings, 1))
+        .order_by('-average', '-rating_count', 'movie_id')
+    )
+
+
+def neighbor_similarities(user_id):
+    """
+    Return {other_user_id: similarity} for every user sharing at least one
+    rated movie with user_id, read from the pair table in O(neighbors).
+    """
+    rows = UserPairStats.objects.filter(
+        Q(user_a_id=user_id) | Q(user_b_id=user_id),
+        overlap_count__gt=0,
+    ).values_list('user_a_id', 'user_b_id', 'sum_abs_diff', 'overlap_count')
+
+    return {
+        (b if a == user_id else a): 1 / (1 + total / count)
+        for a, b, total, count in rows
+    }
+
+
+def compute_pair_stats(rows):
+    """
+    Compute (user_a, user_b, sum_abs_diff, overlap_count) for every co-rating
+    pair from an iterable of (user_id, movie_id, score) tuples.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+
+    users, movies, scores = (np.asarray(col) for col in zip(*rows))
+    users = users.astype(np.int64)
+    scores = scores.astype(np.float64)
+    order = np.lexsort((users, movies))
+    users, movies, scores = users[order], movies[order], scores[order]
+    bounds = np.flatnonzero(np.diff(movies)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(movies)]))
+
+    key_base = int(users.max()) + 1
+    keys, diffs = [], []
+    for start, end in zip(starts, ends):
+        if end - start < 2:
+            continue
+        i, j = np.triu_indices(end - start, 1)
+        u, s = users[start:end], scores[start:end]
+        distinct = u[i] != u[j]
+        i, j = i[distinct], j[distinct]
+        keys.append(u[i] * key_base + u[j])
+        diffs.append(np.abs(s[i] - s[j]))
+
+    if not keys:
+        return []
+
+    unique_keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    sums = np.bincount(inverse, weights=np.concatenate(diffs))
+    counts = np.bincount(inverse)
+    return list(zip(
+        (unique_keys // key_base).tolist(),
+        (unique_keys % key_base).tolist(),
+        sums.tolist(),
+        counts.tolist(),
+    ))
+
+
+def rebuild_user_pair_stats(batch_size=1000, rating_model=Rating, stats_model=UserPairStats):
+    """
+    Recompute the whole pair table from the rating table.
+    The model arguments allow data migrations to pass historical models.
+    """
+    pairs = compute_pair_stats(
+        rating_model.objects.values_list('user_id', 'movie_id', 'score')
+    )
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        stats_model.objects.bulk_create(
+            (
+                stats_model(user_a_id=a, user_b_id=b, sum_abs_diff=total, overlap_count=count)
+                for a, b, total, count in pairs
+            ),
+            batch_size=batch_size,
+        )
+    return len(pairs)
+
+
+def rebuild_movie_rating_stats(batch_size=1000, rating_model=Rating, stats_model=MovieRatingStats):
+    """
+    Recompute the leaderboard from the rating table with one GROUP BY.
+    The model arguments allow data migrations to pass historical models.
+    """
+    rows = (
+        rating_model.objects.values('movie_id')
+        .annotate(num=Count('rating_id'), total=Sum('score'))
+        .values_list('movie_id', 'num', 'total')
+    )
+    stats = [
+        stats_model(movie_id=movie_id, rating_count=num, rating_sum=total, average=total / num)
+        for movie_id, num, total in rows
+    ]
+    with transaction.atomic():
+        stats_model.objects.all().delete()
+        stats_model.objects.bulk_create(stats, batch_size=batch_size)
+    return len(stats)
+
+
+def _rating_totals(rating_model):
+    """{movie_id: (count, sum)} straight from the rating table."""
+    return {
+        movie_id: (num, total)
+        for movie_id, num, total in rating_model.objects.values('movie_id')
+        .annotate(num=Count('rating_id'), total=Sum('score'))
+        .values_list('movie_id', 'num', 'total')
+    }
+
+
+def find_movie_counter_drift(tolerance=1e-6):
+    """
+    Compare Movie.rating_count / rating_sum with the rating table.
+    Returns [(movie_id, stored_count, stored_sum, actual_count, actual_sum)]
+    for every movie whose counters are off.
+    """
+    totals = _rating_totals(Rating)
+    drift = []
+    for movie_id, count, total in Movie.objects.values_list('movie_id', 'rating_count', 'rating_sum').iterator():
+        actual_count, actual_sum = totals.get(movie_id, (0, 0.0))
+        if count != actual_count or abs(total - actual_sum) > tolerance:
+            drift.append((movie_id, count, total, actual_count, actual_sum))
+    return drift
+
+
+def find_leaderboard_drift(tolerance=1e-6):
+    """
+    Compare movie_rating_stats (the second copy of the per-movie totals)
+    with the rating table, in the same format as find_movie_counter_drift.
+    Covers stale rows, a wrong average, rows left for movies that lost all
+    their ratings and rated movies without a row.
+    """
+    totals = _rating_totals(Rating)
+    drift = []
+    seen = set()
+    rows = MovieRatingStats.objects.values_list('movie_id', 'rating_count', 'rating_sum', 'average')
+    for movie_id, count, total, average in rows.iterator():
+        seen.add(movie_id)
+        actual_count, actual_sum = totals.get(movie_id, (0, 0.0))
+        if (count != actual_count or abs(total - actual_sum) > tolerance
+                or abs(average - actual_sum / max(actual_count, 1)) > tolerance):
+            drift.append((movie_id, count, total, actual_count, actual_sum))
+    for movie_id in totals.keys() - seen:
+        drift.append((movie_id, 0, 0.0, *totals[movie_id]))
+    return drift
+
+
+def rebuild_movie_counters(batch_size=1000, rating_model=Rating, movie_model=Movie):
+    """
+    Recompute Movie.rating_count / rating_sum / avg_rating from the rating table.
+    The model arguments allow data migrations to pass historical models.
+    """
+    totals = _rating_totals(rating_model)
+    with transaction.atomic():
+        movie_model.objects.update(rating_count=0, rating_sum=0.0)
+        movie_model.objects.bulk_update(
+            [
+                movie_model(movie_id=movie_id, rating_count=num, rating_sum=total)
+                for movie_id, (num, total) in totals.items()
+            ],
+            ['rating_count', 'rating_sum'],
+            batch_size=batch_size,
+        )
+        movie_model.objects.update(avg_rating=average_expression(F('rating_count'), F('rating_sum')))
+    return len(totals)
+
+
+TOP_MOVIES_LIMIT = 5
+
+
+def _top_movies():
+    """Top movies by rating count and by average, read from the leaderboard."""
+    most_ratings = MovieRatingStats.objects.select_related('movie').order_by('-rating_count', 'movie_id')
+    highest_avg = leaderboard().select_related('movie')
+    return (
+        [
+            {
+                'movie_id': stats.movie_id,
+                'title': stats.movie.title,
+                'genre': stats.movie.genre,
+                'description': stats.movie.description,
+                'num_ratings': stats.rating_count,
+            }
+            for stats in most_ratings[:TOP_MOVIES_LIMIT]
+        ],
+        [
+            {
+                'movie_id': stats.movie_id,
+                'title': stats.movie.title,
+                'genre': stats.movie.genre,
+                'description': stats.movie.description,
+                'avg_rating': stats.average,
+            }
+            for stats in highest_avg[:TOP_MOVIES_LIMIT]
+        ],
+    )
+
+
+# RatingEvent consumer that folds rating writes into SystemStats.total_ratings
+SYSTEM_STATS_CONSUMER = 'system-stats'
+
+
+def refresh_system_stats():
+    """Recompute the SystemStats snapshot from scratch and return it."""
+    most_ratings, highest_avg = _top_movies()
+    now = timezone.now()
+    with transaction.atomic():
+        # the count below already includes every logged event
+        last_event = RatingEvent.objects.order_by('-event_id').values_list('event_id', flat=True).first()
+        reset_consumer(SYSTEM_STATS_CONSUMER, last_event or 0)
+        stats, _ = SystemStats.objects.update_or_create(
+            pk=1,
+            defaults={
+                'total_users': AppUser.objects.count(),
+                'total_movies': Movie.objects.count(),
+                'total_ratings': Rating.objects.count(),
+                'top_movies_most_ratings': most_ratings,
+                'top_movies_highest_avg': highest_avg,
+                'refreshed_at': now,
+                'updated_at': now,
+            },
+        )
+    return stats
+
+
+def catch_up_system_stats():
+    """
+    Periodic, incremental refresh (run by the recommendation worker): fold
+    the rating events since the last run into total_ratings, one UPDATE per
+    batch, and recompute the top-5 lists. Rating writes themselves never
+    touch the SystemStats row, so they do not contend on it.
+    Returns the number of events consumed.
+    """
+    if not SystemStats.objects.filter(pk=1).exists():
+        refresh_system_stats()
+        return 0
+
+    def fold(batch):
+        created = sum(1 for e in batch if e.kind == RatingEvent.KIND_CREATE)
+        deleted = sum(1 for e in batch if e.kind == RatingEvent.KIND_DELETE)
+        if created != deleted:
+            update_system_stats(ratings=created - deleted)
+
+    consumed = catch_up(SYSTEM_STATS_CONSUMER, fold)
+    update_system_stats(refresh_top=True)
+    return consumed
+
+
+def update_system_stats(users=0, movies=0, ratings=0, refresh_top=False):
+    """
+    Adjust the snapshot totals in place (one UPDATE), optionally recomputing
+    the top-5 lists. No-op until the snapshot has been built once.
+    Used by the (rare) movie and user writes and by catch_up_system_stats.
+    """
+    updated = SystemStats.objects.filter(pk=1).update(
+        total_users=F('total_users') + users,
+        total_movies=F('total_movies') + movies,
+        total_ratings=F('total_ratings') + ratings,
+        updated_at=timezone.now(),
+    )
+    if updated and refresh_top:
+        most_ratings, highest_avg = _top_movies()
+        SystemStats.objects.filter(pk=1).update(
+            top_movies_most_ratings=most_ratings,
+            top_movies_highest_avg=highest_avg,
+        )
@@ -0,0 +1,100 @@
+"""
+Title autocomplete served from memory.
+
+Every normalised title (and every word suffix of it, so "matrix" finds
+"The Matrix") is kept in one sorted list; a prefix lookup is two bisects
+plus a walk over the matches. One and two character prefixes, which match
+most of the catalog, have their top results precomputed.
+
+The index is per process and rebuilt lazily when the catalog version
+changes (any movie added, edited or deleted) or when it is older than
+MAX_AGE_SECONDS, which keeps the rating-count ranking reasonably current.
+"""
+
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from .freshness import current_catalog_version
+from .models import Movie
+
+MAX_RESULTS = 50
+PRECOMPUTED_PREFIX_LENGTH = 2
+MAX_AGE_SECONDS = 300
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def normalize(text):
+    """'Amélie: Part II' -> 'amelie part ii'"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+class TitleIndex:
+    def __init__(self, rows):
+        """rows: (movie_id, title, year, rating_count)"""
+        self.movies = {}
+        keyed = []
+        for movie_id, title, year, rating_count in rows:
+            self.movies[movie_id] = (title, year, rating_count)
+            words = normalize(title).split()
+            for start in range(len(words)):
+                keyed.append((' '.join(words[start:]), movie_id))
+        keyed.sort()
+        self.keys = [key for key, _ in keyed]
+        self.ids = [movie_id for _, movie_id in keyed]
+
+        # Short prefixes: best MAX_RESULTS movies, already ranked
+        self.short = {}
+        for key, movie_id in sorted(keyed, key=lambda kv: self._rank(kv[1])):
+            for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+                if len(key) < length:
+                    break
+                bucket = self.short.setdefault(key[:length], [])
+                if len(bucket) < MAX_RESULTS and movie_id not in bucket:
+                    bucket.append(movie_id)
+
+    def _rank(self, movie_id):
+        title, _, rating_count = self.movies[movie_id]
+        return (-rating_count, title, movie_id)
+
+    def complete(self, prefix, limit=10):
+        """Movie ids whose title (or a word of it onwards) starts with prefix."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        limit = min(limit, MAX_RESULTS)
+        if len(prefix) <= PRECOMPUTED_PREFIX_LENGTH:
+            return self.short.get(prefix, [])[:limit]
+
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\U0010ffff', lo)
+        matches = set(self.ids[lo:hi])
+        return heapq.nsmallest(limit, matches, key=self._rank)
+
+    def describe(self, movie_id):
+        title, year, rating_count = self.movies[movie_id]
+        return {'id': movie_id, 'title': title, 'year': year, 'rating_count': rating_count}
+
+
+_cache = {'index': None, 'version': None, 'built_at': 0.0}
+_cache_lock = threading.Lock()
+
+
+def get_title_index():
+    """Per-process TitleIndex, rebuilt when the catalog changes."""
+    version = current_catalog_version()
+    with _cache_lock:
+        stale = time.monotonic() - _cache['built_at'] > MAX_AGE_SECONDS
+        if _cache['version'] != version or stale:
+            _cache['index'] = TitleIndex(
+                Movie.objects.values_list('movie_id', 'title', 'year', 'rating_count')
+            )
+            _cache['version'] = version
+            _cache['built_at'] = time.monotonic()
+        return _cache['index']
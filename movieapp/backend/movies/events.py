@@ -0,0 +1,130 @@
+"""
+Change feed over rating writes.
+
+apply_rating_changes() appends one RatingEvent per created, updated or
+deleted rating in the same transaction as the write, so the log never
+disagrees with the rating table. Aggregate builders register as named
+consumers and catch up by reading only the events after their stored
+position:
+
+    def handler(events):
+        ...  # fold the events into some derived table
+
+    events.consume('my-aggregate', handler)
+
+The handler runs in the transaction that advances the position, so a
+handler that only writes to the database sees every event exactly once.
+
+Event ids are handed out before commit (a PostgreSQL sequence), so a slow
+transaction can commit a lower id after a higher one became visible.
+Consumers therefore only read up to the first gap in the id sequence: the
+missing id is either still in flight or was rolled back. A consumer held at
+the same gap for RATING_EVENT_GAP_TIMEOUT_SECONDS (timed on the consumer
+row, not on event timestamps) treats it as rolled back and skips it.
+
+Bulk imports (load_movielens) do not write events: consumers must be
+rebuilt and moved to the end of the log (reset_consumer) after an import.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import RatingEvent, RatingEventConsumer
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _kind(old_score, new_score):
+    if old_score is None:
+        return RatingEvent.KIND_CREATE
+    if new_score is None:
+        return RatingEvent.KIND_DELETE
+    return RatingEvent.KIND_UPDATE
+
+
+def record_rating_events(user_id, changes):
+    """Append events for (movie_id, old_score, new_score) tuples of one user."""
+    RatingEvent.objects.bulk_create([
+        RatingEvent(
+            kind=_kind(old_score, new_score),
+            user_id=user_id,
+            movie_id=movie_id,
+            old_score=old_score,
+            new_score=new_score,
+        )
+        for movie_id, old_score, new_score in changes
+    ])
+
+
+def _contiguous(after, events):
+    """The leading events of `events` whose ids follow `after` without a gap."""
+    expected = after + 1
+    for count, event in enumerate(events):
+        if event.event_id != expected:
+            return events[:count]
+        expected += 1
+    return events
+
+
+def read_events(after=0, limit=DEFAULT_BATCH_SIZE):
+    """
+    Up to `limit` events with event_id > after, oldest first, stopping at the
+    first gap in the id sequence (a transaction that may still commit).
+    """
+    events = list(RatingEvent.objects.filter(event_id__gt=after).order_by('event_id')[:limit])
+    return _contiguous(after, events)
+
+
+def consumer_position(name):
+    return RatingEventConsumer.objects.filter(pk=name).values_list('position', flat=True).first() or 0
+
+
+def reset_consumer(name, position=0):
+    """Move a consumer back (full rebuild) or forward (skip history)."""
+    RatingEventConsumer.objects.update_or_create(name=name, defaults={'position': position, 'blocked_since': None})
+
+
+def consume(name, handler, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Hand the next batch of events after the consumer's position to
+    handler(events) and advance the position past them. The consumer row is
+    locked, so two workers never process the same batch.
+    Returns the number of events consumed (0 while waiting on a gap).
+    """
+    with transaction.atomic():
+        RatingEventConsumer.objects.get_or_create(name=name)
+        consumer = RatingEventConsumer.objects.select_for_update().get(pk=name)
+        pending = list(
+            RatingEvent.objects.filter(event_id__gt=consumer.position).order_by('event_id')[:batch_size]
+        )
+        events = _contiguous(consumer.position, pending)
+        if pending and not events:
+            # the next id is missing: wait for it, up to the gap timeout
+            now = timezone.now()
+            if consumer.blocked_since is None:
+                consumer.blocked_since = now
+                consumer.save(update_fields=['blocked_since', 'updated_at'])
+                return 0
+            if now - consumer.blocked_since < timedelta(seconds=settings.RATING_EVENT_GAP_TIMEOUT_SECONDS):
+                return 0
+            events = _contiguous(pending[0].event_id - 1, pending)
+        if not events:
+            return 0
+        handler(events)
+        consumer.position = events[-1].event_id
+        consumer.blocked_since = None
+        consumer.save(update_fields=['position', 'blocked_since', 'updated_at'])
+    return len(events)
+
+
+def catch_up(name, handler, batch_size=DEFAULT_BATCH_SIZE):
+    """Consume batches until the consumer reaches the end of the log."""
+    total = 0
+    while True:
+        consumed = consume(name, handler, batch_size)
+        total += consumed
+        if consumed < batch_size:
+            return total
@@ -0,0 +1,60 @@
+"""
+NDJSON exports of the rating table, the catalog and the user list.
+
+Rows are read with .values_list().iterator(chunk_size=...), which uses a
+server-side cursor on PostgreSQL, and serialised one JSON object per line
+as they arrive, so memory stays constant and the first bytes go out
+before the query has finished.
+
+`since` makes exports incremental: an id returns only rows with a larger
+primary key (rows come in id order, so a job resumes from the last id it
+saw); for ratings an ISO date returns the ratings created on or after it.
+"""
+
+import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import AppUser, Movie, Rating
+
+EXPORT_CHUNK_SIZE = 2000
+
+# dataset -> (model, exported fields); the first field is the primary key
+DATASETS = {
+    'ratings': (Rating, ('rating_id', 'user_id', 'movie_id', 'score', 'created_at')),
+    'movies': (Movie, ('movie_id', 'title', 'director', 'genre', 'year', 'rating_count', 'rating_sum')),
+    'users': (AppUser, ('user_id', 'username', 'email', 'is_admin')),
+}
+
+
+def export_queryset(dataset, since=None):
+    """
+    values_list() queryset for a dataset, filtered by `since`.
+    Raises KeyError for an unknown dataset and ValueError for a bad `since`.
+    """
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.order_by(fields[0])
+    if since:
+        if since.isdigit():
+            queryset = queryset.filter(pk__gt=int(since))
+        elif model is Rating:
+            queryset = queryset.filter(created_at__gte=datetime.date.fromisoformat(since))
+        else:
+            raise ValueError(since)
+    return queryset.values_list(*fields)
+
+
+def stream_ndjson(dataset, since=None, chunk_size=None):
+    """Yield NDJSON text, one chunk of rows at a time."""
+    chunk_size = chunk_size or EXPORT_CHUNK_SIZE
+    _, fields = DATASETS[dataset]
+    queryset = export_queryset(dataset, since)
+    encoder = DjangoJSONEncoder()
+    lines = []
+    for row in queryset.iterator(chunk_size=chunk_size):
+        lines.append(encoder.encode(dict(zip(fields, row))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,59 @@
+"""
+Search facets (genre, decade, rating bucket) for a filtered movie queryset.
+
+All three come from one GROUP BY over (genre_mask, decade, rating bucket);
+the handful of resulting groups are rolled up per facet in Python, with the
+genre bits of each mask mapped back to names through the Genre vocabulary.
+"""
+
+from collections import Counter
+
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Floor
+
+from .genres import bits_of
+from .models import Genre
+
+# Rating buckets 0-1, 1-2, 2-3, 3-4 and 4-5 (a 5.0 average falls in 4-5)
+TOP_BUCKET = 4
+
+
+def compute_facets(movies):
+    groups = (
+        movies
+        .order_by()
+        .annotate(
+            decade=F('year') / 10 * 10,
+            bucket=Case(
+                When(rating_count=0, then=Value(None)),
+                default=Cast(Floor('avg_rating'), IntegerField()),
+            ),
+        )
+        .values('genre_mask', 'decade', 'bucket')
+        .annotate(n=Count('movie_id'))
+    )
+
+    genres, decades, buckets = Counter(), Counter(), Counter()
+    for row in groups:
+        n = row['n']
+        for bit in bits_of(row['genre_mask']):
+            genres[bit] += n
+        decades[row['decade']] += n
+        bucket = row['bucket']
+        buckets[None if bucket is None else min(bucket, TOP_BUCKET)] += n
+
+    names = dict(Genre.objects.filter(bit__in=list(genres)).values_list('bit', 'name')) if genres else {}
+    return {
+        'genres': [
+            {'name': names.get(bit, str(bit)), 'count': n}
+            for bit, n in sorted(genres.items(), key=lambda item: (-item[1], names.get(item[0], '')))
+        ],
+        'decades': [
+            {'decade': decade, 'count': n}
+            for decade, n in sorted(decades.items(), key=lambda item: (item[0] is None, item[0] or 0))
+        ],
+        'ratings': [
+            {'bucket': 'unrated' if bucket is None else f'{bucket}-{bucket + 1}', 'count': n}
+            for bucket, n in sorted(buckets.items(), key=lambda item: (item[0] is None, -(item[0] or 0)))
+        ],
+    }
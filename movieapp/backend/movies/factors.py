@@ -0,0 +1,214 @@
+"""
+Offline matrix factorisation for the recommender.
+
+`train_factors` fits latent factors with alternating least squares and
+writes them as plain .npy files. Web workers open those files with
+np.load(mmap_mode='r'), so every gunicorn process maps the same pages from
+the OS page cache instead of holding its own copy of the model, and scoring
+a user is a single matrix-vector product over the mapped movie factors.
+
+Artifact layout (one directory):
+    meta.json          global mean, score range, factor count, version
+    user_ids.npy       sorted user ids   (row i of user_factors)
+    movie_ids.npy      sorted movie ids  (row j of movie_factors)
+    user_factors.npy   float32 [n_users x k]
+    movie_factors.npy  float32 [n_movies x k]
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+ARTIFACT_FILES = ('user_ids', 'movie_ids', 'user_factors', 'movie_factors')
+
+
+def _solve_side(indptr, indices, values, fixed, reg):
+    """
+    One ALS half-step: for every row, solve the regularised least squares
+    problem against the fixed factor matrix.
+    """
+    n_rows, k = len(indptr) - 1, fixed.shape[1]
+    out = np.zeros((n_rows, k), dtype=np.float64)
+    eye = np.eye(k)
+    for row in range(n_rows):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        f = fixed[indices[start:end]]
+        lhs = f.T @ f + reg * (end - start) * eye
+        out[row] = np.linalg.solve(lhs, f.T @ values[start:end])
+    return out
+
+
+def train_als(matrix, factors=32, reg=0.1, iterations=10, seed=42):
+    """
+    Fit mu + U.V^T to the ratings of a RatingMatrix.
+    Returns (mu, user_factors, movie_factors).
+    """
+    mu = float(matrix.data.mean()) if len(matrix.data) else 0.0
+    centered = matrix.data - mu
+
+    rng = np.random.default_rng(seed)
+    n_users, n_movies = matrix.shape
+    user_factors = rng.normal(scale=0.1, size=(n_users, factors))
+    movie_factors = rng.normal(scale=0.1, size=(n_movies, factors))
+
+    col_indptr, col_rows, _ = matrix.columns()
+    col_order = np.argsort(matrix.indices, kind="stable")
+    col_values = centered[col_order]
+
+    for _ in range(iterations):
+        user_factors = _solve_side(matrix.indptr, matrix.indices, centered, movie_factors, reg)
+        movie_factors = _solve_side(col_indptr, col_rows, col_values, user_factors, reg)
+
+    return mu, user_factors, movie_factors
+
+
+def save_factor_model(path, matrix, mu, user_factors, movie_factors):
+    """
+    Write the artifact into a temporary sibling directory and swap it in,
+    so readers never see a half-written model.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(prefix=path.name + '.', dir=path.parent))
+
+    arrays = {
+        'user_ids': matrix.user_ids.astype(np.int64),
+        'movie_ids': matrix.movie_ids.astype(np.int64),
+        'user_factors': user_factors.astype(np.float32),
+        'movie_factors': movie_factors.astype(np.float32),
+    }
+    for name, array in arrays.items():
+        np.save(tmp_dir / f'{name}.npy', array)
+
+    scores = matrix.data
+    meta = {
+        # distinct per training run: it is part of the recommendation watermark
+        'version': time.time_ns(),
+        'mu': mu,
+        'factors': int(user_factors.shape[1]),
+        'min_score': float(scores.min()) if len(scores) else 1.0,
+        'max_score': float(scores.max()) if len(scores) else 5.0,
+    }
+    (tmp_dir / 'meta.json').write_text(json.dumps(meta))
+
+    old_dir = None
+    if path.exists():
+        old_dir = path.with_name(path.name + '.old')
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(path, old_dir)
+    os.replace(tmp_dir, path)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class FactorScores(Mapping):
+    """
+    Predicted scores of one user, kept as the model's arrays: a read-only
+    {movie_id: score} mapping over the unseen movies that never builds a
+    dict. top() selects the best ids with np.argpartition and get() is a
+    binary search over the sorted movie ids, so a caller that only needs a
+    candidate pool and that pool's scores stays O(n_movies) in NumPy.
+    """
+
+    def __init__(self, movie_ids, scores, keep):
+        self.movie_ids = movie_ids
+        self.scores = np.where(keep, scores, -np.inf)
+        self._size = int(keep.sum())
+
+    def _position(self, movie_id):
+        pos = int(np.searchsorted(self.movie_ids, movie_id))
+        if pos < len(self.movie_ids) and self.movie_ids[pos] == movie_id and self.scores[pos] != -np.inf:
+            return pos
+        return None
+
+    def __getitem__(self, movie_id):
+        pos = self._position(movie_id)
+        if pos is None:
+            raise KeyError(movie_id)
+        return float(self.scores[pos])
+
+    def __contains__(self, movie_id):
+        return self._position(movie_id) is not None
+
+    def __iter__(self):
+        return iter(self.movie_ids[self.scores != -np.inf].tolist())
+
+    def __len__(self):
+        return self._size
+
+    def top(self, limit):
+        """The `limit` movie ids with the highest score, best first."""
+        limit = min(limit, self._size)
+        if limit <= 0:
+            return []
+        best = np.argpartition(-self.scores, limit - 1)[:limit]
+        best = best[np.lexsort((self.movie_ids[best], -self.scores[best]))]
+        return self.movie_ids[best].tolist()
+
+
+class FactorModel:
+    """Read-only view over a memory-mapped factor artifact."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / 'meta.json').read_text())
+        for name in ARTIFACT_FILES:
+            setattr(self, name, np.load(self.path / f'{name}.npy', mmap_mode='r'))
+
+    def _row(self, ids, value):
+        pos = int(np.searchsorted(ids, value))
+        if pos < len(ids) and ids[pos] == value:
+            return pos
+        return None
+
+    def score_unseen(self, user_id, exclude_movie_ids=()):
+        """
+        Predicted score for every movie in the model the user has not rated,
+        as FactorScores. Returns {} if the user was not part of the training
+        data.
+        """
+        row = self._row(self.user_ids, user_id)
+        if row is None:
+            return {}
+
+        scores = self.movie_factors @ self.user_factors[row] + self.meta['mu']
+        np.clip(scores, self.meta['min_score'], self.meta['max_score'], out=scores)
+
+        keep = np.ones(len(self.movie_ids), dtype=bool)
+        if exclude_movie_ids:
+            excluded = np.fromiter(exclude_movie_ids, dtype=np.int64)
+            keep &= ~np.isin(self.movie_ids, excluded)
+        return FactorScores(self.movie_ids, scores, keep)
+
+
+_cache = {'model': None, 'key': None}
+_cache_lock = threading.Lock()
+
+
+def get_factor_model():
+    """
+    Per-process cached FactorModel, reopened when a new artifact is trained.
+    Returns None if no artifact exists yet.
+    """
+    meta_path = Path(settings.RECOMMENDER_FACTORS_PATH) / 'meta.json'
+    try:
+        mtime = meta_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    key = (str(meta_path), mtime)
+    with _cache_lock:
+        if _cache['key'] != key:
+            _cache['model'] = FactorModel(meta_path.parent)
+            _cache['key'] = key
+        return _cache['model']
@@ -0,0 +1,115 @@
+"""
+Watermarks that tell whether a user's stored recommendations are still
+up to date.
+
+A list is built from (user's rating_version, catalog version, algorithm
+version). If none of them moved since, regenerating would produce the
+same list, so it is skipped. The algorithm version includes the offline
+artifact the current RECOMMENDER_MODE scores with (the factor model's
+meta version, or the MovieNeighbor build), so train_factors and
+build_item_neighbors make every stored list stale.
+"""
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .factors import get_factor_model
+from .models import AppUser, CatalogState, MovieNeighborBuild, RecommendationState
+
+# Bump when the scoring logic changes so every stored list becomes stale
+ALGORITHM_VERSION = '4'
+
+
+def artifact_version(mode=None):
+    """
+    Version of the offline artifact behind `mode`: the factor model's meta
+    version for 'mf', the latest MovieNeighborBuild for 'item', and '' when
+    the mode uses none (or it was not built yet).
+    """
+    mode = mode or settings.RECOMMENDER_MODE
+    if mode == 'mf':
+        model = get_factor_model()
+        return str(model.meta['version']) if model is not None else ''
+    if mode == 'item':
+        build_id = MovieNeighborBuild.objects.order_by('-build_id').values_list('build_id', flat=True).first()
+        return str(build_id or '')
+    return ''
+
+
+def algorithm_version():
+    mode = settings.RECOMMENDER_MODE
+    return f"{ALGORITHM_VERSION}:{mode}:{artifact_version(mode)}"
+
+
+def current_catalog_version():
+    return CatalogState.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def bump_catalog_version():
+    if CatalogState.objects.filter(pk=1).update(version=F('version') + 1):
+        return
+    try:
+        with transaction.atomic():
+            CatalogState.objects.create(pk=1, version=1)
+    except IntegrityError:
+        CatalogState.objects.filter(pk=1).update(version=F('version') + 1)
+
+
+def bump_rating_version(user_id):
+    AppUser.objects.filter(pk=user_id).update(rating_version=F('rating_version') + 1)
+
+
+def current_watermark(user_id, catalog_version=None):
+    """(rating_version, catalog_version, algorithm_version) right now."""
+    rating_version = AppUser.objects.filter(pk=user_id).values_list('rating_version', flat=True).first()
+    if catalog_version is None:
+        catalog_version = current_catalog_version()
+    return rating_version or 0, catalog_version, algorithm_version()
+
+
+def is_fresh(state, watermark):
+    if state is None:
+        return False
+    return (state.rating_version, state.catalog_version, state.algorithm_version) == watermark
+
+
+def record_generation(watermarks):
+    """
+    Upsert RecommendationState rows. `watermarks` maps user_id -> watermark
+    captured before the lists were computed.
+    """
+    now = timezone.now()
+    RecommendationState.objects.bulk_create(
+        [
+            RecommendationState(
+                user_id=user_id,
+                generated_at=now,
+                rating_version=rating_version,
+                catalog_version=catalog_version,
+                algorithm_version=algo,
+            )
+            for user_id, (rating_version, catalog_version, algo) in watermarks.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['generated_at', 'rating_version', 'catalog_version', 'algorithm_version'],
+    )
+
+
+def describe_freshness(state, watermark):
+    """Staleness info exposed by the recommendations API."""
+    if state is None:
+        return {
+            'generated_at': None,
+            'age_seconds': None,
+            'algorithm_version': None,
+            'is_stale': True,
+        }
+    return {
+        'generated_at': state.generated_at,
+        'age_seconds': int((timezone.now() - state.generated_at).total_seconds()),
+        'algorithm_version': state.algorithm_version,
+        'is_stale': not is_fresh(state, watermark),
+    }
@@ -0,0 +1,90 @@
+"""
+Multi-genre token index.
+
+Movie.genre is free text such as "Action, Comedy". It is split into
+normalised tokens, each token gets a row in the Genre vocabulary with a
+fixed bit position, and every movie stores the OR of its genre bits in
+Movie.genre_mask (plus the movie_genre join table for indexed lookups).
+Content scoring then works on dense NumPy vectors indexed by bit.
+"""
+
+import re
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+
+from .models import Genre, Movie
+
+# Bits 0..62 of a signed 64-bit column; genres beyond that are not indexed
+MAX_GENRES = 63
+
+_SEPARATORS = re.compile(r"[,|/;]")
+
+
+def tokenize_genres(value):
+    """'Action, Comedy' -> ['action', 'comedy'] (order kept, duplicates dropped)."""
+    tokens = []
+    for token in _SEPARATORS.split(value or ""):
+        token = token.strip().lower()
+        if token and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def resolve_genres(names, genre_model=Genre):
+    """
+    Return {name: Genre} for the given tokens, adding missing ones to the
+    vocabulary with the next free bit.
+    """
+    genres = {g.name: g for g in genre_model.objects.filter(name__in=names)}
+    for name in names:
+        if name in genres:
+            continue
+        highest = genre_model.objects.aggregate(m=Max('bit'))['m']
+        next_bit = 0 if highest is None else highest + 1
+        if next_bit >= MAX_GENRES:
+            continue
+        try:
+            with transaction.atomic():
+                genres[name] = genre_model.objects.create(name=name, bit=next_bit)
+        except IntegrityError:
+            # Another writer added the same name (or took the bit) first
+            existing = genre_model.objects.filter(name=name).first()
+            if existing is not None:
+                genres[name] = existing
+    return genres
+
+
+def mask_for(genres):
+    mask = 0
+    for genre in genres:
+        mask |= 1 << genre.bit
+    return mask
+
+
+def mask_to_bits(masks):
+    """(n,) array of genre masks -> (n, MAX_GENRES) float matrix of 0/1."""
+    masks = np.asarray(masks, dtype=np.int64).reshape(-1)
+    return ((masks[:, None] >> np.arange(MAX_GENRES, dtype=np.int64)) & 1).astype(np.float64)
+
+
+def bits_of(mask):
+    return [bit for bit in range(MAX_GENRES) if mask >> bit & 1]
+
+
+def rebuild_genre_index(movie_model=Movie, genre_model=Genre):
+    """
+    Tokenise every movie and refresh genre_mask and the movie_genre table.
+    The model arguments allow data migrations to pass historical models.
+    """
+    through = movie_model.genres.through
+    links = []
+    with transaction.atomic():
+        for movie in movie_model.objects.only('movie_id', 'genre').iterator():
+            genres = resolve_genres(tokenize_genres(movie.genre), genre_model).values()
+            movie_model.objects.filter(pk=movie.pk).update(genre_mask=mask_for(genres))
+            links.extend(through(movie_id=movie.pk, genre_id=g.genre_id) for g in genres)
+        through.objects.all().delete()
+        through.objects.bulk_create(links, batch_size=1000)
+    return len(links)
@@ -0,0 +1,173 @@
+"""
+DB-backed queue for recommendation regeneration.
+
+Rating writes only mark the user as dirty (enqueue_recommendation_refresh);
+the `process_recommendation_jobs` management command consumes the queue and
+rebuilds the Recommendation rows outside the request path.
+
+Refreshes are debounced: a job only becomes due
+RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS after the user's last rating write,
+so a burst of ratings collapses into one recomputation. A job that keeps
+being pushed back still runs once it has waited
+RECOMMENDATION_REFRESH_MAX_DELAY_SECONDS.
+
+Failed jobs are retried up to RECOMMENDATION_JOB_MAX_ATTEMPTS times with
+exponential backoff (RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS, doubled per
+attempt) and then kept as 'failed' with the last error. A job left
+'running' for longer than RECOMMENDATION_JOB_TIMEOUT_SECONDS (its worker
+crashed or was killed) counts as a failed attempt and is requeued.
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RecommendationJob
+from .recommender import generate_recommendations
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_recommendation_refresh(user_id):
+    """
+    Ask the worker to rebuild recommendations for a user.
+    If the user already has a pending job its run_after is pushed back
+    instead (one UPDATE, plus one INSERT for the first request).
+    """
+    run_after = timezone.now() + timedelta(seconds=settings.RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS)
+    pending = RecommendationJob.objects.filter(user_id=user_id, status=RecommendationJob.STATUS_PENDING)
+    if pending.update(run_after=run_after):
+        return
+    try:
+        with transaction.atomic():
+            RecommendationJob.objects.create(user_id=user_id, run_after=run_after)
+    except IntegrityError:
+        # Partial unique index: another request created the pending job
+        pending.update(run_after=run_after)
+
+
+def _due(now):
+    # the max delay only caps debouncing: retries wait for their backoff
+    max_delay = timedelta(seconds=settings.RECOMMENDATION_REFRESH_MAX_DELAY_SECONDS)
+    return Q(run_after__lte=now) | Q(created_at__lte=now - max_delay, attempts=0)
+
+
+def pending_refresh(user_id):
+    """
+    The user's queued or running refresh as {'status', 'due_at'}, or None.
+    """
+    job = (
+        RecommendationJob.objects.filter(
+            user_id=user_id,
+            status__in=[RecommendationJob.STATUS_PENDING, RecommendationJob.STATUS_RUNNING],
+        )
+        .order_by('created_at')
+        .first()
+    )
+    if job is None:
+        return None
+    if job.attempts:
+        return {'status': job.status, 'due_at': job.run_after}
+    max_delay = timedelta(seconds=settings.RECOMMENDATION_REFRESH_MAX_DELAY_SECONDS)
+    return {'status': job.status, 'due_at': min(job.run_after, job.created_at + max_delay)}
+
+
+def claim_jobs(batch_size=50):
+    """
+    Atomically move up to `batch_size` due pending jobs to 'running' and
+    return them. Uses SKIP LOCKED where supported so several workers can
+    share the queue.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            RecommendationJob.objects.select_for_update(skip_locked=True)
+            .filter(_due(now), status=RecommendationJob.STATUS_PENDING)
+            .order_by('created_at')[:batch_size]
+        )
+        if not jobs:
+            return []
+
+        RecommendationJob.objects.filter(job_id__in=[j.job_id for j in jobs]).update(
+            status=RecommendationJob.STATUS_RUNNING,
+            started_at=now,
+        )
+    return jobs
+
+
+def _retry_or_fail(job, error, now):
+    """
+    Record a failed attempt of a running job: back to 'pending' after the
+    backoff while attempts remain, 'failed' for good otherwise. If a newer
+    pending job exists for the user, that one covers the retry.
+    """
+    attempts = job.attempts + 1
+    running = RecommendationJob.objects.filter(job_id=job.job_id, status=RecommendationJob.STATUS_RUNNING)
+    if attempts >= settings.RECOMMENDATION_JOB_MAX_ATTEMPTS:
+        running.update(status=RecommendationJob.STATUS_FAILED, attempts=attempts, error=error)
+        return
+
+    backoff = settings.RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    try:
+        with transaction.atomic():
+            running.update(
+                status=RecommendationJob.STATUS_PENDING,
+                attempts=attempts,
+                error=error,
+                run_after=now + timedelta(seconds=backoff),
+                started_at=None,
+            )
+    except IntegrityError:
+        # Partial unique index: the user was queued again meanwhile
+        running.delete()
+
+
+def requeue_stale_jobs():
+    """
+    Treat jobs stuck in 'running' past RECOMMENDATION_JOB_TIMEOUT_SECONDS
+    as failed attempts (their worker died). Returns how many were found.
+    """
+    now = timezone.now()
+    timeout = timedelta(seconds=settings.RECOMMENDATION_JOB_TIMEOUT_SECONDS)
+    with transaction.atomic():
+        stale = list(
+            RecommendationJob.objects.select_for_update(skip_locked=True)
+            .filter(status=RecommendationJob.STATUS_RUNNING, started_at__lt=now - timeout)
+        )
+        for job in stale:
+            logger.warning("Recommendation job %s timed out, requeueing", job.job_id)
+            _retry_or_fail(job, f"timed out after {timeout.total_seconds():.0f}s", now)
+    return len(stale)
+
+
+def run_job(job):
+    """
+    Rebuild recommendations for one claimed job.
+    Successful jobs are deleted; failures are retried or kept with the error message.
+    """
+    try:
+        generate_recommendations(job.user)
+    except Exception as exc:  # keep the worker alive, record the failure
+        logger.exception("Recommendation job %s failed", job.job_id)
+        _retry_or_fail(job, str(exc), timezone.now())
+        return False
+
+    RecommendationJob.objects.filter(job_id=job.job_id, status=RecommendationJob.STATUS_RUNNING).delete()
+    return True
+
+
+def process_pending_jobs(batch_size=50):
+    """
+    Requeue stale jobs, then claim and run one batch. Returns (processed, failed).
+    """
+    requeue_stale_jobs()
+    jobs = claim_jobs(batch_size)
+    failed = 0
+    for job in jobs:
+        if not run_job(job):
+            failed += 1
+    return len(jobs), failed
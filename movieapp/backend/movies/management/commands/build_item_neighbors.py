@@ -0,0 +1,76 @@
+import os
+import time
+import multiprocessing
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from movies.models import MovieNeighbor, MovieNeighborBuild
+from movies.recommender import RatingMatrix
+
+# Set in every pool worker by _init_worker (the matrix is shipped once per process)
+_worker_matrix = None
+_worker_norms = None
+
+
+def _init_worker(user_ids, movie_ids, indptr, indices, data):
+    global _worker_matrix, _worker_norms
+    _worker_matrix = RatingMatrix(user_ids, movie_ids, indptr, indices, data)
+    _worker_norms = _worker_matrix.column_norms()
+
+
+def _neighbors_for_chunk(args):
+    cols, k = args
+    return _worker_matrix.top_item_neighbors(cols, k, norms=_worker_norms)
+
+
+class Command(BaseCommand):
+    help = "Compute the top-K most similar movies for every movie (item-item cosine)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20, help='Neighbours kept per movie.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Movies per task sent to a worker process.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        matrix = RatingMatrix.from_db()
+        n_movies = matrix.shape[1]
+        self.stdout.write(f"Loaded {len(matrix.data)} ratings ({matrix.shape[0]} users x {n_movies} movies)")
+
+        chunk_size = options['chunk_size']
+        tasks = [
+            (np.arange(start, min(start + chunk_size, n_movies)), options['k'])
+            for start in range(0, n_movies, chunk_size)
+        ]
+
+        arrays = (matrix.user_ids, matrix.movie_ids, matrix.indptr, matrix.indices, matrix.data)
+        # Workers are forked so they inherit the configured Django app registry
+        can_fork = 'fork' in multiprocessing.get_all_start_methods()
+        if options['workers'] > 1 and len(tasks) > 1 and can_fork:
+            ctx = multiprocessing.get_context('fork')
+            with ctx.Pool(options['workers'], initializer=_init_worker, initargs=arrays) as pool:
+                chunks = pool.imap_unordered(_neighbors_for_chunk, tasks)
+                rows = [row for chunk in chunks for row in chunk]
+        else:
+            _init_worker(*arrays)
+            rows = [row for task in tasks for row in _neighbors_for_chunk(task)]
+
+        with transaction.atomic():
+            MovieNeighbor.objects.all().delete()
+            MovieNeighbor.objects.bulk_create(
+                (
+                    MovieNeighbor(movie_id=movie_id, neighbor_id=neighbor_id, similarity=sim)
+                    for movie_id, neighbor_id, sim in rows
+                ),
+                batch_size=options['batch_size'],
+            )
+            MovieNeighborBuild.objects.create(row_count=len(rows))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(rows)} neighbour rows for {n_movies} movies in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies.aggregates import (
+    find_leaderboard_drift,
+    find_movie_counter_drift,
+    rebuild_movie_counters,
+    rebuild_movie_rating_stats,
+)
+
+# Both copies of the per-movie totals: (name, drift check, rebuild)
+CHECKS = [
+    ('Movie rating counters', find_movie_counter_drift, rebuild_movie_counters),
+    ('Leaderboard (movie_rating_stats)', find_leaderboard_drift, rebuild_movie_rating_stats),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify Movie.rating_count / rating_sum and the movie_rating_stats "
+        "leaderboard against the rating table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Recompute the drifted totals from the rating table when drift is found.')
+
+    def handle(self, *args, **options):
+        unfixed = 0
+        for name, find_drift, rebuild in CHECKS:
+            drift = find_drift()
+            for movie_id, count, total, actual_count, actual_sum in drift[:20]:
+                self.stdout.write(
+                    f"movie {movie_id}: stored {count} / {total:g}, actual {actual_count} / {actual_sum:g}"
+                )
+            if not drift:
+                self.stdout.write(self.style.SUCCESS(f"{name} are consistent"))
+            elif options['fix']:
+                rebuild()
+                self.stdout.write(self.style.SUCCESS(f"Fixed {name} ({len(drift)} movie(s) had drifted)"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{name}: {len(drift)} movie(s) drifted"))
+                unfixed += len(drift)
+        if unfixed:
+            raise CommandError(f"{unfixed} inconsistent movie rating total(s) (run with --fix)")
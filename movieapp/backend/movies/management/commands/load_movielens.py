@@ -0,0 +1,85 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import movielens
+from movies.aggregates import (
+    SYSTEM_STATS_CONSUMER, rebuild_movie_counters, rebuild_movie_rating_stats, rebuild_user_pair_stats,
+    refresh_system_stats,
+)
+from movies.freshness import bump_catalog_version
+from movies.genres import rebuild_genre_index
+from movies.models import RatingEventConsumer
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a MovieLens-format dump (movies.csv, ratings.csv) into the database "
+        "and rebuild the derived tables once at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory containing movies.csv and/or ratings.csv.')
+        parser.add_argument('--chunk-size', type=int, default=movielens.DEFAULT_CHUNK_SIZE,
+                            help='Rows read and written per transaction.')
+        parser.add_argument('--source', default=movielens.DEFAULT_SOURCE,
+                            help='Dataset label: external ids are mapped per source, and imported '
+                                 'users are named <source>_<userId>.')
+        parser.add_argument('--rebuild-pairs', action='store_true',
+                            help='Also rebuild user_pair_stats. It loads every rating and is quadratic in '
+                                 'raters per movie, so by default run rebuild_user_pair_stats separately.')
+
+    def handle(self, *args, **options):
+        movies_path = os.path.join(options['directory'], 'movies.csv')
+        ratings_path = os.path.join(options['directory'], 'ratings.csv')
+        has_movies, has_ratings = os.path.exists(movies_path), os.path.exists(ratings_path)
+        if not (has_movies or has_ratings):
+            raise CommandError(f"No movies.csv or ratings.csv in {options['directory']}")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        chunk_size, source = options['chunk_size'], options['source']
+        if has_movies:
+            total = movielens.load_movies(
+                movies_path, chunk_size, source, report=self._reporter('movies'),
+            )
+            self.stdout.write(self.style.SUCCESS(f"Loaded {total} movie(s)"))
+
+        if has_ratings:
+            indexes = movielens.deferred_rating_indexes()
+            movielens.drop_indexes(indexes)
+            try:
+                total = movielens.load_ratings(
+                    ratings_path, chunk_size, source, report=self._reporter('ratings'),
+                )
+            finally:
+                movielens.create_indexes(indexes)
+            self.stdout.write(self.style.SUCCESS(f"Loaded {total} rating(s)"))
+
+        self.stdout.write("Rebuilding derived tables...")
+        if has_movies:
+            rebuild_genre_index()
+        rebuild_movie_counters()
+        rebuild_movie_rating_stats()
+        if options['rebuild_pairs']:
+            rebuild_user_pair_stats()
+        else:
+            self.stdout.write(self.style.WARNING(
+                "user_pair_stats not rebuilt: run rebuild_user_pair_stats (or pass --rebuild-pairs)"
+            ))
+        refresh_system_stats()
+        # imported ratings bypass the RatingEvent log (see movielens.py)
+        consumers = RatingEventConsumer.objects.exclude(name=SYSTEM_STATS_CONSUMER).values_list('name', flat=True)
+        if has_ratings and consumers:
+            self.stdout.write(self.style.WARNING(
+                f"Imported ratings are not in the event log: rebuild and reset_consumer() {', '.join(consumers)}"
+            ))
+        # new movies and ratings make every stored recommendation list stale
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    def _reporter(self, label):
+        def report(rows, elapsed):
+            rate = rows / elapsed if elapsed else 0.0
+            self.stdout.write(f"{label}: {rows} rows ({rate:,.0f} rows/s)")
+        return report
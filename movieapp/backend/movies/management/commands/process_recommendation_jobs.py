@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from movies.aggregates import catch_up_system_stats
+from movies.jobs import process_pending_jobs
+
+
+class Command(BaseCommand):
+    help = ("Worker that rebuilds recommendations for users queued by rating writes "
+            "and periodically refreshes the admin statistics snapshot.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the queue once and exit instead of polling forever.')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stats_due = None
+
+        while True:
+            if stats_due is None or time.monotonic() >= stats_due:
+                catch_up_system_stats()
+                stats_due = time.monotonic() + settings.SYSTEM_STATS_REFRESH_SECONDS
+
+            processed, failed = process_pending_jobs(batch_size)
+            if processed:
+                self.stdout.write(f"Processed {processed} job(s), {failed} failed")
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movies.genres import rebuild_genre_index
+
+
+class Command(BaseCommand):
+    help = "Re-tokenise Movie.genre for every movie and refresh the genre vocabulary and bitsets."
+
+    def handle(self, *args, **options):
+        links = rebuild_genre_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {links} movie/genre link(s)"))
@@ -0,0 +1,131 @@
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from movies.freshness import algorithm_version, current_catalog_version, is_fresh
+from movies.models import AppUser, RecommendationState
+from movies.recommender import CatalogSnapshot, compute_recommendations, save_recommendations_bulk
+
+# Loaded once in the parent; forked workers inherit them copy-on-write
+_snapshot = None
+_watermarks = {}
+
+
+def _rebuild_shard(task):
+    """Recompute one shard of users, writing one bulk_create per chunk."""
+    index, user_ids, chunk_size = task
+    written = 0
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        results = {
+            user_id: compute_recommendations(_snapshot.for_user(user_id))
+            for user_id in chunk
+        }
+        written += save_recommendations_bulk(
+            results, {user_id: _watermarks[user_id] for user_id in chunk}
+        )
+    return index, user_ids[0], user_ids[-1], len(user_ids), written
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as fh:
+            return [tuple(r) for r in json.load(fh).get('done', [])]
+    except FileNotFoundError:
+        return []
+
+
+def _save_checkpoint(path, done):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as fh:
+        json.dump({'done': sorted(done)}, fh)
+    os.replace(tmp_path, path)
+
+
+class Command(BaseCommand):
+    help = "Recompute the Recommendation rows of every user in parallel user-id shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--shard-size', type=int, default=500,
+                            help='Users per shard (unit of work and of checkpointing).')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Users per bulk_create inside a shard.')
+        parser.add_argument('--checkpoint', default='rebuild_recommendations.checkpoint.json',
+                            help='File recording the user-id ranges already rebuilt.')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the user-id ranges recorded in the checkpoint file.')
+        parser.add_argument('--force', action='store_true',
+                            help='Also rebuild users whose recommendations are still fresh.')
+
+    def handle(self, *args, **options):
+        global _snapshot, _watermarks
+
+        checkpoint = options['checkpoint']
+        done = _load_checkpoint(checkpoint) if options['resume'] else []
+
+        # Watermarks are read before the snapshot so later writes leave users stale
+        catalog_version = current_catalog_version()
+        algorithm = algorithm_version()
+        _watermarks = {
+            user_id: (rating_version, catalog_version, algorithm)
+            for user_id, rating_version in AppUser.objects.values_list('user_id', 'rating_version')
+        }
+        states = {} if options['force'] else RecommendationState.objects.in_bulk()
+
+        user_ids = [
+            user_id for user_id in sorted(_watermarks)
+            if not any(lo <= user_id <= hi for lo, hi in done)
+            and not is_fresh(states.get(user_id), _watermarks[user_id])
+        ]
+        if not user_ids:
+            self.stdout.write("Nothing to rebuild")
+            return
+
+        started = time.monotonic()
+        _snapshot = CatalogSnapshot()
+        self.stdout.write(
+            f"Loaded {len(_snapshot.matrix.data)} ratings and {len(_snapshot.genre_masks)} movies "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+
+        shard_size = options['shard_size']
+        tasks = [
+            (index, user_ids[start:start + shard_size], options['chunk_size'])
+            for index, start in enumerate(range(0, len(user_ids), shard_size))
+        ]
+
+        can_fork = 'fork' in multiprocessing.get_all_start_methods()
+        if options['workers'] > 1 and len(tasks) > 1 and can_fork:
+            # Children must open their own database connections
+            connections.close_all()
+            pool_context = multiprocessing.get_context('fork').Pool(options['workers'])
+        else:
+            pool_context = contextlib.nullcontext()
+
+        users_done = written = 0
+        with pool_context as pool:
+            results = pool.imap_unordered(_rebuild_shard, tasks) if pool else map(_rebuild_shard, tasks)
+            for shards_done, (index, first_id, last_id, n_users, n_rows) in enumerate(results, 1):
+                users_done += n_users
+                written += n_rows
+                done.append((first_id, last_id))
+                _save_checkpoint(checkpoint, done)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"[{shards_done}/{len(tasks)}] shard {index} (users {first_id}-{last_id}) done - "
+                    f"{users_done}/{len(user_ids)} users, {users_done / max(elapsed, 1e-9):.1f} users/s"
+                )
+
+        os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {written} recommendations for {users_done} users in {elapsed:.1f}s "
+            f"({users_done / max(elapsed, 1e-9):.1f} users/s)"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movies.aggregates import rebuild_user_pair_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the user co-rating pair table from scratch (backfill / repair)."
+
+    def handle(self, *args, **options):
+        total = rebuild_user_pair_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} user pair(s)"))
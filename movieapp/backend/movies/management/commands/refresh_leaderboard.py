@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from movies.aggregates import rebuild_movie_rating_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the movie leaderboard (rating count / average) from scratch."
+
+    def handle(self, *args, **options):
+        total = rebuild_movie_rating_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt leaderboard for {total} movie(s)"))
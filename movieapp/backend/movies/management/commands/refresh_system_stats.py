@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from movies.aggregates import refresh_system_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the admin statistics snapshot (totals and top-5 lists) from scratch."
+
+    def handle(self, *args, **options):
+        stats = refresh_system_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"System stats refreshed: {stats.total_users} user(s), {stats.total_movies} movie(s), "
+            f"{stats.total_ratings} rating(s)"
+        ))
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from movies.factors import save_factor_model, train_als
+from movies.recommender import RatingMatrix
+
+
+class Command(BaseCommand):
+    help = "Train the matrix factorisation model (ALS) and write the memory-mappable artifact."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=32)
+        parser.add_argument('--reg', type=float, default=0.1)
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=None,
+                            help='Artifact directory (defaults to RECOMMENDER_FACTORS_PATH).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        matrix = RatingMatrix.from_db()
+        if not len(matrix.data):
+            self.stdout.write(self.style.WARNING("No ratings to train on"))
+            return
+
+        mu, user_factors, movie_factors = train_als(
+            matrix,
+            factors=options['factors'],
+            reg=options['reg'],
+            iterations=options['iterations'],
+            seed=options['seed'],
+        )
+        output = options['output'] or settings.RECOMMENDER_FACTORS_PATH
+        save_factor_model(output, matrix, mu, user_factors, movie_factors)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained {options['factors']} factors for {matrix.shape[0]} users x "
+            f"{matrix.shape[1]} movies in {time.monotonic() - started:.1f}s -> {output}"
+        ))
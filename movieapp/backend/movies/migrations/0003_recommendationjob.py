@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_movie_director_movie_poster_url_movie_year_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationJob',
+            fields=[
+                ('job_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(db_column='appuser_user_id', on_delete=django.db.models.deletion.CASCADE, related_name='recommendation_jobs', to='movies.appuser')),
+            ],
+            options={
+                'db_table': 'recommendation_job',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='rec_job_status_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recommendationjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'pending')), fields=('user',), name='rec_job_one_pending_per_user'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._backfill import rebuild_pair_stats
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_recommendationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserPairStats',
+            fields=[
+                ('pair_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('sum_abs_diff', models.FloatField(default=0.0)),
+                ('overlap_count', models.IntegerField(default=0)),
+                ('user_a', models.ForeignKey(db_column='user_a_id', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.appuser')),
+                ('user_b', models.ForeignKey(db_column='user_b_id', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.appuser')),
+            ],
+            options={
+                'db_table': 'user_pair_stats',
+                'indexes': [models.Index(fields=['user_b'], name='user_pair_stats_user_b_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='userpairstats',
+            constraint=models.UniqueConstraint(fields=('user_a', 'user_b'), name='user_pair_stats_unique_pair'),
+        ),
+        migrations.RunPython(rebuild_pair_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 06:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_userpairstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieNeighbor',
+            fields=[
+                ('neighbor_row_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('similarity', models.FloatField()),
+                ('movie', models.ForeignKey(db_column='movie_movie_id', on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='movies.movie')),
+                ('neighbor', models.ForeignKey(db_column='neighbor_movie_id', on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.movie')),
+            ],
+            options={
+                'db_table': 'movie_neighbor',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='movieneighbor',
+            constraint=models.UniqueConstraint(fields=('movie', 'neighbor'), name='movie_neighbor_unique_pair'),
+        ),
+    ]
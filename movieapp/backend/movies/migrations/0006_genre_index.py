@@ -0,0 +1,64 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:00
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of the tokenizer in genres.py at the time of this migration
+MAX_GENRES = 63
+_SEPARATORS = re.compile(r"[,|/;]")
+
+
+def build_genre_index(apps, schema_editor):
+    """Tokenise every movie into the (new, empty) Genre vocabulary and set genre_mask."""
+    Movie = apps.get_model('movies', 'Movie')
+    Genre = apps.get_model('movies', 'Genre')
+    through = Movie.genres.through
+
+    vocabulary, links = {}, []
+    for movie in Movie.objects.only('movie_id', 'genre').iterator():
+        mask = 0
+        for token in dict.fromkeys(t.strip().lower() for t in _SEPARATORS.split(movie.genre or '')):
+            if not token:
+                continue
+            if token not in vocabulary:
+                if len(vocabulary) >= MAX_GENRES:
+                    continue
+                vocabulary[token] = Genre.objects.create(name=token, bit=len(vocabulary))
+            genre = vocabulary[token]
+            mask |= 1 << genre.bit
+            links.append(through(movie_id=movie.pk, genre_id=genre.genre_id))
+        Movie.objects.filter(pk=movie.pk).update(genre_mask=mask)
+    through.objects.bulk_create(links, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_movieneighbor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Genre',
+            fields=[
+                ('genre_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=128, unique=True)),
+                ('bit', models.PositiveSmallIntegerField(unique=True)),
+            ],
+            options={
+                'db_table': 'genre',
+            },
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genre_mask',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='genres',
+            field=models.ManyToManyField(blank=True, db_table='movie_genre', related_name='movies', to='movies.genre'),
+        ),
+        migrations.RunPython(build_genre_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_genre_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogState',
+            fields=[
+                ('state_id', models.SmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'catalog_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationState',
+            fields=[
+                ('user', models.OneToOneField(db_column='appuser_user_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation_state', serialize=False, to='movies.appuser')),
+                ('generated_at', models.DateTimeField()),
+                ('algorithm_version', models.CharField(max_length=64)),
+                ('rating_version', models.BigIntegerField()),
+                ('catalog_version', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'recommendation_state',
+            },
+        ),
+        migrations.AddField(
+            model_name='appuser',
+            name='rating_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
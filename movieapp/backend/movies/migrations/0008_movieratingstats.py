@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from ._backfill import rebuild_rating_stats
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_recommendation_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieRatingStats',
+            fields=[
+                ('movie', models.OneToOneField(db_column='movie_movie_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_stats', serialize=False, to='movies.movie')),
+                ('rating_count', models.IntegerField(default=0)),
+                ('rating_sum', models.FloatField(default=0.0)),
+                ('average', models.FloatField(default=0.0)),
+            ],
+            options={
+                'db_table': 'movie_rating_stats',
+                'indexes': [models.Index(fields=['-average', '-rating_count'], name='leaderboard_avg_idx'), models.Index(fields=['-rating_count'], name='leaderboard_count_idx')],
+            },
+        ),
+        migrations.RunPython(rebuild_rating_stats, migrations.RunPython.noop),
+    ]
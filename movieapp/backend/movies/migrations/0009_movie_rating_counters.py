@@ -0,0 +1,26 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:05
+
+from django.db import migrations, models
+
+from ._backfill import rebuild_movie_counters
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0008_movieratingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='rating_sum',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.RunPython(rebuild_movie_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_movie_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['title', 'movie_id'], name='movie_title_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['year', 'movie_id'], name='movie_year_keyset_idx'),
+        ),
+    ]
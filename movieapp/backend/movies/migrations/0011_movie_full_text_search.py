@@ -0,0 +1,76 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:07
+
+from django.db import migrations
+
+from ._fts import SQLITE_FTS_TRIGGERS
+
+# Weights: title A, director B, genre C, description D (see search.py)
+PG_VECTOR = """
+    setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.director, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(NEW.genre, '')), 'C') ||
+    setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'D')
+"""
+
+PG_FORWARD = [
+    "ALTER TABLE movie ADD COLUMN search_vector tsvector",
+    f"""
+    CREATE FUNCTION movie_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {PG_VECTOR};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    # Only text edits touch the vector; rating counter updates do not
+    """
+    CREATE TRIGGER movie_search_vector_trg
+    BEFORE INSERT OR UPDATE OF title, director, genre, description ON movie
+    FOR EACH ROW EXECUTE FUNCTION movie_search_vector_update()
+    """,
+    "UPDATE movie SET search_vector = " + PG_VECTOR.replace("NEW.", ""),
+    "CREATE INDEX movie_search_vector_idx ON movie USING GIN (search_vector)",
+]
+
+PG_REVERSE = [
+    "DROP TRIGGER IF EXISTS movie_search_vector_trg ON movie",
+    "DROP FUNCTION IF EXISTS movie_search_vector_update()",
+    "ALTER TABLE movie DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE movie_fts USING fts5(
+        title, director, genre, description,
+        content='movie', content_rowid='movie_id'
+    )
+    """,
+] + SQLITE_FTS_TRIGGERS
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS movie_fts_ai",
+    "DROP TRIGGER IF EXISTS movie_fts_ad",
+    "DROP TRIGGER IF EXISTS movie_fts_au",
+    "DROP TABLE IF EXISTS movie_fts",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for sql in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_movie_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': PG_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': PG_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:09
+
+from django.db import migrations
+
+PG_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX movie_title_trgm_idx ON movie USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX movie_director_trgm_idx ON movie USING GIN (director gin_trgm_ops)",
+]
+
+PG_REVERSE = [
+    "DROP INDEX IF EXISTS movie_title_trgm_idx",
+    "DROP INDEX IF EXISTS movie_director_trgm_idx",
+]
+
+
+def forward(apps, schema_editor):
+    # SQLite uses the in-process index in trigrams.py instead
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in PG_FORWARD:
+            schema_editor.execute(sql)
+
+
+def reverse(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in PG_REVERSE:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0011_movie_full_text_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, reverse),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:12
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+from ._backfill import rebuild_movie_counters, rebuild_pair_stats, rebuild_rating_stats
+
+
+def drop_duplicate_ratings(apps, schema_editor):
+    """Keep the newest rating of every (user, movie) pair, then resync derived tables."""
+    Rating = apps.get_model('movies', 'Rating')
+    duplicates = (
+        Rating.objects.values('user_id', 'movie_id')
+        .annotate(n=Count('rating_id'), keep=Max('rating_id'))
+        .filter(n__gt=1)
+    )
+    removed = 0
+    for row in duplicates.iterator():
+        removed += Rating.objects.filter(
+            user_id=row['user_id'], movie_id=row['movie_id'], rating_id__lt=row['keep'],
+        ).delete()[0]
+    if not removed:
+        return
+
+    # Historical models send no signals, so the incremental aggregates missed the deletes
+    rebuild_pair_stats(apps, schema_editor)
+    rebuild_rating_stats(apps, schema_editor)
+    rebuild_movie_counters(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0012_movie_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['movie', 'score'], name='rating_movie_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rating',
+            index=models.Index(fields=['user', '-created_at'], name='rating_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('user', 'movie'), name='rating_unique_user_movie'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0013_rating_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingEvent',
+            fields=[
+                ('event_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete')], max_length=8)),
+                ('user_id', models.BigIntegerField()),
+                ('movie_id', models.BigIntegerField()),
+                ('old_score', models.FloatField(blank=True, null=True)),
+                ('new_score', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'rating_event',
+            },
+        ),
+        migrations.CreateModel(
+            name='RatingEventConsumer',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'rating_event_consumer',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0014_rating_event_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationjob',
+            name='run_after',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='recommendationjob',
+            index=models.Index(fields=['status', 'run_after'], name='rec_job_status_run_after_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0015_recommendation_job_run_after'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SystemStats',
+            fields=[
+                ('state_id', models.SmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('total_users', models.BigIntegerField(default=0)),
+                ('total_movies', models.BigIntegerField(default=0)),
+                ('total_ratings', models.BigIntegerField(default=0)),
+                ('top_movies_most_ratings', models.JSONField(default=list)),
+                ('top_movies_highest_avg', models.JSONField(default=list)),
+                ('refreshed_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'system_stats',
+            },
+        ),
+    ]
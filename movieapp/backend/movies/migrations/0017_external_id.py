@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0016_system_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalId',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=32)),
+                ('kind', models.CharField(choices=[('movie', 'Movie'), ('user', 'User')], max_length=8)),
+                ('external_id', models.BigIntegerField()),
+                ('internal_id', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'external_id',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='externalid',
+            constraint=models.UniqueConstraint(fields=('source', 'kind', 'external_id'), name='external_id_unique'),
+        ),
+    ]
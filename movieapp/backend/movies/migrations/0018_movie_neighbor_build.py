@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0017_external_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieNeighborBuild',
+            fields=[
+                ('build_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('built_at', models.DateTimeField(auto_now_add=True)),
+                ('row_count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'movie_neighbor_build',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0018_movie_neighbor_build'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ratingeventconsumer',
+            name='blocked_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
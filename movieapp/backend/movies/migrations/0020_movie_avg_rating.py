@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:45
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+
+from ._fts import recreate_fts_triggers
+
+
+def backfill_avg_rating(apps, schema_editor):
+    # same expression as aggregates.average_expression, inlined for the historical model
+    average = F('rating_sum') / NullIf('rating_count', 0)
+    rounded = Cast(Round(Cast(average, DecimalField(max_digits=16, decimal_places=6)), 2), FloatField())
+    apps.get_model('movies', 'Movie').objects.update(avg_rating=Coalesce(rounded, Value(0.0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0019_rating_event_consumer_blocked_since'),
+    ]
+
+    operations = [
+        # AddField / RemoveField remake the movie table on SQLite
+        recreate_fts_triggers(reverse=True),
+        migrations.AddField(
+            model_name='movie',
+            name='avg_rating',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-avg_rating', 'movie_id'], name='movie_rating_keyset_idx'),
+        ),
+        recreate_fts_triggers(),
+        migrations.RunPython(backfill_avg_rating, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+"""
+Backfills shared by data migrations.
+
+These are frozen copies of the rebuild_* routines in aggregates.py: they
+only touch the historical models handed to them by the migration, never
+the live app modules, so later changes to the app (new columns, new
+signals) cannot change what an old migration does. Do not edit a function
+once a released migration uses it; add a new one instead.
+"""
+
+from django.db.models import Count, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def rebuild_pair_stats(apps, schema_editor):
+    """user_pair_stats from one self-join of the rating table."""
+    Rating = apps.get_model('movies', 'Rating')
+    UserPairStats = apps.get_model('movies', 'UserPairStats')
+    quote = schema_editor.quote_name
+    rating = quote(Rating._meta.db_table)
+    user = quote(Rating._meta.get_field('user').column)
+    movie = quote(Rating._meta.get_field('movie').column)
+    score = quote(Rating._meta.get_field('score').column)
+    stats = UserPairStats._meta
+    columns = ', '.join(
+        quote(stats.get_field(name).column) for name in ('user_a', 'user_b', 'sum_abs_diff', 'overlap_count')
+    )
+
+    UserPairStats.objects.all().delete()
+    schema_editor.execute(
+        f"INSERT INTO {quote(stats.db_table)} ({columns}) "
+        f"SELECT r1.{user}, r2.{user}, SUM(ABS(r1.{score} - r2.{score})), COUNT(*) "
+        f"FROM {rating} r1 JOIN {rating} r2 ON r1.{movie} = r2.{movie} AND r1.{user} < r2.{user} "
+        f"GROUP BY r1.{user}, r2.{user}"
+    )
+
+
+def rebuild_rating_stats(apps, schema_editor):
+    """movie_rating_stats (the leaderboard) from one GROUP BY."""
+    Rating = apps.get_model('movies', 'Rating')
+    MovieRatingStats = apps.get_model('movies', 'MovieRatingStats')
+    rows = (
+        Rating.objects.values('movie_id')
+        .annotate(num=Count('rating_id'), total=Sum('score'))
+        .values_list('movie_id', 'num', 'total')
+    )
+    MovieRatingStats.objects.all().delete()
+    MovieRatingStats.objects.bulk_create(
+        (
+            MovieRatingStats(movie_id=movie_id, rating_count=num, rating_sum=total, average=total / num)
+            for movie_id, num, total in rows
+        ),
+        batch_size=1000,
+    )
+
+
+def rebuild_movie_counters(apps, schema_editor):
+    """Movie.rating_count / rating_sum with one correlated UPDATE."""
+    Movie = apps.get_model('movies', 'Movie')
+    Rating = apps.get_model('movies', 'Rating')
+    per_movie = Rating.objects.filter(movie_id=OuterRef('pk')).order_by().values('movie_id')
+    Movie.objects.update(
+        rating_count=Coalesce(
+            Subquery(per_movie.annotate(n=Count('pk')).values('n'), output_field=IntegerField()), Value(0),
+        ),
+        rating_sum=Coalesce(
+            Subquery(per_movie.annotate(total=Sum('score')).values('total'), output_field=FloatField()), Value(0.0),
+        ),
+    )
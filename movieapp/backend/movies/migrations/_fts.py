@@ -0,0 +1,53 @@
+"""
+SQLite FTS5 index over the movie table (see 0011_movie_full_text_search).
+
+The triggers that keep movie_fts in sync live on the movie table, and
+SQLite drops them silently whenever Django remakes that table (most
+AddField / AlterField / RemoveField operations on Movie). A migration that
+changes Movie must therefore end with
+
+    recreate_fts_triggers(),
+
+and, so the reverse run repairs them too, start with
+recreate_fts_triggers(reverse=True). No-ops on other backends.
+"""
+
+from django.db import migrations
+
+SQLITE_FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_ai AFTER INSERT ON movie BEGIN
+        INSERT INTO movie_fts(rowid, title, director, genre, description)
+        VALUES (new.movie_id, new.title, new.director, new.genre, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_ad AFTER DELETE ON movie BEGIN
+        INSERT INTO movie_fts(movie_fts, rowid, title, director, genre, description)
+        VALUES ('delete', old.movie_id, old.title, old.director, old.genre, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movie_fts_au AFTER UPDATE OF title, director, genre, description ON movie BEGIN
+        INSERT INTO movie_fts(movie_fts, rowid, title, director, genre, description)
+        VALUES ('delete', old.movie_id, old.title, old.director, old.genre, old.description);
+        INSERT INTO movie_fts(rowid, title, director, genre, description)
+        VALUES (new.movie_id, new.title, new.director, new.genre, new.description);
+    END
+    """,
+    # rows written while the triggers were missing
+    "INSERT INTO movie_fts(movie_fts) VALUES ('rebuild')",
+]
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_FTS_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def recreate_fts_triggers(reverse=False):
+    """RunPython operation restoring the triggers, forwards or (reverse=True) backwards."""
+    if reverse:
+        return migrations.RunPython(migrations.RunPython.noop, create_triggers)
+    return migrations.RunPython(create_triggers, migrations.RunPython.noop)
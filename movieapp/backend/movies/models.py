@@ -1,5 +1,5 @@
 from django.db import models
-from django.db.models import Avg, Count
+from django.utils import timezone
 
 class AppUser(models.Model):
     user_id = models.BigAutoField(primary_key=True)
@@ -7,6 +7,8 @@ class AppUser(models.Model):
     email = models.EmailField(max_length=512, unique=True)
     password = models.CharField(max_length=512)
     is_admin = models.BooleanField(default=False)
+    # Bumped on every rating write by this user (recommendation watermark)
+    rating_version = models.BigIntegerField(default=0)
 
     class Meta:
         db_table = 'appuser'
@@ -15,6 +17,23 @@ class AppUser(models.Model):
         return self.username
 
 
+class Genre(models.Model):
+    """
+    Genre vocabulary built from the tokens of Movie.genre
+    ("Action, Comedy" -> action, comedy). `bit` is the genre's position
+    in Movie.genre_mask.
+    """
+    genre_id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=128, unique=True)
+    bit = models.PositiveSmallIntegerField(unique=True)
+
+    class Meta:
+        db_table = 'genre'
+
+    def __str__(self):
+        return self.name
+
+
 class Movie(models.Model):
     movie_id = models.BigAutoField(primary_key=True)
     title = models.CharField(max_length=512)
@@ -24,8 +43,26 @@ class Movie(models.Model):
     description = models.TextField()
     poster_url = models.URLField(max_length=512, null=True, blank=True)
 
+    # Genre token index, kept in sync by signals (see genres.py)
+    genre_mask = models.BigIntegerField(default=0)
+    genres = models.ManyToManyField(Genre, related_name='movies', blank=True, db_table='movie_genre')
+
+    # Denormalised rating counters, kept in sync with F() updates by
+    # apply_rating_change() (see aggregates.py)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0.0)
+    # rating_sum / rating_count rounded to 2 decimals (0 when unrated), stored
+    # in the same UPDATE so the 'rating' sort can walk an index
+    avg_rating = models.FloatField(default=0.0)
+
     class Meta:
         db_table = 'movie'
+        indexes = [
+            # keyset pagination orders (see pagination.py)
+            models.Index(fields=['title', 'movie_id'], name='movie_title_keyset_idx'),
+            models.Index(fields=['year', 'movie_id'], name='movie_year_keyset_idx'),
+            models.Index(fields=['-avg_rating', 'movie_id'], name='movie_rating_keyset_idx'),
+        ]
      
 
     def __str__(self):
@@ -33,14 +70,10 @@ class Movie(models.Model):
     
     @property
     def average_rating(self):
-        """Calculate average rating from user ratings"""
-        result = self.ratings.aggregate(avg=Avg('score'))
-        return round(result['avg'], 2) if result['avg'] is not None else 0.0
-    
-    @property
-    def rating_count(self):
-        """Get total number of ratings"""
-        return self.ratings.count()
+        """Average user rating, read from the stored counters (no query)"""
+        if not self.rating_count:
+            return 0.0
+        return round(self.rating_sum / self.rating_count, 2)
 
 
 
@@ -65,6 +98,13 @@ class Rating(models.Model):
 
     class Meta:
         db_table = 'rating'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'movie'], name='rating_unique_user_movie'),
+        ]
+        indexes = [
+            models.Index(fields=['movie', 'score'], name='rating_movie_score_idx'),
+            models.Index(fields=['user', '-created_at'], name='rating_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} rated {self.movie.title}: {self.score}"
@@ -92,4 +132,309 @@ class Recommendation(models.Model):
         db_table = 'recommendation'
 
     def __str__(self):
-        return f"Rec: {self.movie.title} for {self.user.username}"
\ No newline at end of file
+        return f"Rec: {self.movie.title} for {self.user.username}"
+
+class RecommendationJob(models.Model):
+    """
+    Queue entry asking the background worker to rebuild a user's
+    recommendations. At most one pending job exists per user; every new
+    request for that user pushes run_after back (see jobs.py).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.BigAutoField(primary_key=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+
+    user = models.ForeignKey(
+        AppUser,
+        on_delete=models.CASCADE,
+        related_name='recommendation_jobs',
+        db_column='appuser_user_id'
+    )
+
+    class Meta:
+        db_table = 'recommendation_job'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='rec_job_status_created_idx'),
+            models.Index(fields=['status', 'run_after'], name='rec_job_status_run_after_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(status='pending'),
+                name='rec_job_one_pending_per_user',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Job {self.job_id} ({self.status}) for user {self.user_id}"
+
+
+class UserPairStats(models.Model):
+    """
+    Co-rating statistics for a pair of users (user_a < user_b), maintained
+    incrementally on every rating write. The collaborative similarity is
+    1 / (1 + sum_abs_diff / overlap_count).
+    """
+    pair_id = models.BigAutoField(primary_key=True)
+    sum_abs_diff = models.FloatField(default=0.0)
+    overlap_count = models.IntegerField(default=0)
+
+    user_a = models.ForeignKey(
+        AppUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_column='user_a_id'
+    )
+    user_b = models.ForeignKey(
+        AppUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_column='user_b_id'
+    )
+
+    class Meta:
+        db_table = 'user_pair_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['user_a', 'user_b'], name='user_pair_stats_unique_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user_b'], name='user_pair_stats_user_b_idx'),
+        ]
+
+    @property
+    def similarity(self):
+        if self.overlap_count <= 0:
+            return 0.0
+        return 1 / (1 + self.sum_abs_diff / self.overlap_count)
+
+    def __str__(self):
+        return f"Pair {self.user_a_id}/{self.user_b_id}: {self.overlap_count} co-rated"
+
+
+class MovieNeighbor(models.Model):
+    """
+    Precomputed item-item similarity: the top-K most similar movies of each
+    movie, built offline by the `build_item_neighbors` command.
+    """
+    neighbor_row_id = models.BigAutoField(primary_key=True)
+    similarity = models.FloatField()
+
+    movie = models.ForeignKey(
+        Movie,
+        on_delete=models.CASCADE,
+        related_name='neighbors',
+        db_column='movie_movie_id'
+    )
+    neighbor = models.ForeignKey(
+        Movie,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_column='neighbor_movie_id'
+    )
+
+    class Meta:
+        db_table = 'movie_neighbor'
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'neighbor'], name='movie_neighbor_unique_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id} ~ {self.neighbor_id}: {self.similarity:.3f}"
+
+
+class MovieNeighborBuild(models.Model):
+    """
+    One row per `build_item_neighbors` run, written in the transaction that
+    swaps the MovieNeighbor table. The latest build_id is part of the 'item'
+    mode recommendation watermark (see freshness.py).
+    """
+    build_id = models.BigAutoField(primary_key=True)
+    built_at = models.DateTimeField(auto_now_add=True)
+    row_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'movie_neighbor_build'
+
+    def __str__(self):
+        return f"Neighbour build {self.build_id} ({self.row_count} rows)"
+
+
+class MovieRatingStats(models.Model):
+    """
+    Materialised leaderboard: rating count, sum and average per movie.
+    Kept up to date by apply_rating_change(); rebuilt by `refresh_leaderboard`.
+    Movies without ratings have no row.
+    """
+    movie = models.OneToOneField(
+        Movie,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rating_stats',
+        db_column='movie_movie_id'
+    )
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0.0)
+    average = models.FloatField(default=0.0)
+
+    class Meta:
+        db_table = 'movie_rating_stats'
+        indexes = [
+            models.Index(fields=['-average', '-rating_count'], name='leaderboard_avg_idx'),
+            models.Index(fields=['-rating_count'], name='leaderboard_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movie_id}: {self.average:.2f} ({self.rating_count})"
+
+
+class RatingEvent(models.Model):
+    """
+    Append-only log of rating writes, written in the same transaction as the
+    write itself (see apply_rating_changes). Consumers read it in event_id
+    order from their stored RatingEventConsumer position.
+    user_id / movie_id are plain columns so the log outlives deleted rows.
+    """
+    KIND_CREATE = 'create'
+    KIND_UPDATE = 'update'
+    KIND_DELETE = 'delete'
+    KIND_CHOICES = [
+        (KIND_CREATE, 'Create'),
+        (KIND_UPDATE, 'Update'),
+        (KIND_DELETE, 'Delete'),
+    ]
+
+    event_id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    user_id = models.BigIntegerField()
+    movie_id = models.BigIntegerField()
+    old_score = models.FloatField(null=True, blank=True)
+    new_score = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'rating_event'
+
+    def __str__(self):
+        return f"#{self.event_id} {self.kind} user {self.user_id} movie {self.movie_id}"
+
+
+class RatingEventConsumer(models.Model):
+    """
+    Durable read position of one RatingEvent consumer. blocked_since is set
+    while the consumer waits on a gap right after its position.
+    """
+    name = models.CharField(max_length=64, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    blocked_since = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'rating_event_consumer'
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class ExternalId(models.Model):
+    """
+    Maps ids of an imported dataset (e.g. MovieLens movieId / userId) to our
+    movie_id / user_id, so imports never reuse or overwrite existing rows and
+    re-imports update the rows they created (see movielens.py).
+    """
+    KIND_MOVIE = 'movie'
+    KIND_USER = 'user'
+    KIND_CHOICES = [
+        (KIND_MOVIE, 'Movie'),
+        (KIND_USER, 'User'),
+    ]
+
+    source = models.CharField(max_length=32)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    external_id = models.BigIntegerField()
+    internal_id = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'external_id'
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'kind', 'external_id'], name='external_id_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.kind} {self.external_id} -> {self.internal_id}"
+
+
+class CatalogState(models.Model):
+    """
+    Single-row table holding the global catalog version, bumped whenever a
+    movie is added, edited or deleted.
+    """
+    state_id = models.SmallIntegerField(primary_key=True, default=1)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'catalog_state'
+
+    def __str__(self):
+        return f"Catalog v{self.version}"
+
+
+class SystemStats(models.Model):
+    """
+    Single-row snapshot behind the admin statistics endpoint.
+    User and movie totals are adjusted in place by their write paths; rating
+    totals and the top-5 lists are folded in periodically from the RatingEvent
+    log by the worker (`catch_up_system_stats`, see aggregates.py).
+    """
+    state_id = models.SmallIntegerField(primary_key=True, default=1)
+    total_users = models.BigIntegerField(default=0)
+    total_movies = models.BigIntegerField(default=0)
+    total_ratings = models.BigIntegerField(default=0)
+    top_movies_most_ratings = models.JSONField(default=list)
+    top_movies_highest_avg = models.JSONField(default=list)
+    # last full recomputation / last change of any kind
+    refreshed_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'system_stats'
+
+    def __str__(self):
+        return f"Stats as of {self.refreshed_at:%Y-%m-%d %H:%M}"
+
+
+class RecommendationState(models.Model):
+    """
+    When and from which inputs a user's Recommendation rows were built.
+    The list is fresh while the watermarks still match the current
+    AppUser.rating_version, catalog version and algorithm version.
+    """
+    user = models.OneToOneField(
+        AppUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='recommendation_state',
+        db_column='appuser_user_id'
+    )
+    generated_at = models.DateTimeField()
+    algorithm_version = models.CharField(max_length=64)
+    rating_version = models.BigIntegerField()
+    catalog_version = models.BigIntegerField()
+
+    class Meta:
+        db_table = 'recommendation_state'
+
+    def __str__(self):
+        return f"Recs for {self.user_id} @ {self.generated_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,277 @@
+"""
+Streaming loader for MovieLens-format dumps (movies.csv, ratings.csv).
+
+The CSVs are read in fixed-size chunks, so memory stays flat whatever the
+file size. Each chunk is written in its own transaction:
+
+PostgreSQL: COPY (psycopg3) into a temporary staging table, then set-based
+INSERT / UPDATE statements from the staging table into the real tables.
+Other backends (SQLite): bulk_create / bulk_update.
+
+External ids never become primary keys. movieId / userId are mapped through
+the ExternalId table (per `source`): ids seen for the first time get fresh
+movie_id / user_id values from the table's own sequence, ids seen before
+update the rows created by the earlier import. Existing movies and accounts
+are never touched. Users are created as "<source>_<userId>" with an
+unusable password; ratings of movies missing from the mapping are skipped.
+
+Bulk writes bypass the model signals, so the genre index, rating counters,
+leaderboard and system statistics are rebuilt once at the end (see
+load_movielens; the pair stats only with --rebuild-pairs). Imported
+ratings are not written to the RatingEvent log: reset every event consumer
+after an import (events.reset_consumer).
+"""
+
+import csv
+import datetime
+import re
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.db import connection, transaction
+
+from .models import AppUser, ExternalId, Movie, Rating
+
+DEFAULT_CHUNK_SIZE = 50000
+DEFAULT_SOURCE = 'ml'
+
+_TITLE_YEAR = re.compile(r"^(.*?)\s*\((\d{4})\)\s*$")
+_NO_GENRES = '(no genres listed)'
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def split_title(value):
+    """'Toy Story (1995)' -> ('Toy Story', 1995)"""
+    value = value.strip()
+    match = _TITLE_YEAR.match(value)
+    if match is None:
+        return value, None
+    return match.group(1), int(match.group(2))
+
+
+def parse_movies(rows):
+    """movies.csv rows -> (external movie id, title, genre, year)"""
+    for row in rows:
+        title, year = split_title(row['title'])
+        genres = row['genres'] if row['genres'] != _NO_GENRES else ''
+        yield int(row['movieId']), title, genres.replace('|', ', '), year
+
+
+def parse_ratings(rows):
+    """ratings.csv rows -> (score, created_at, external movie id, external user id)"""
+    for row in rows:
+        created_at = datetime.datetime.fromtimestamp(int(row['timestamp']), tz=datetime.timezone.utc).date()
+        yield float(row['rating']), created_at, int(row['movieId']), int(row['userId'])
+
+
+def _user_fields(source, external_id):
+    return f"{source}_{external_id}", f"{source}_{external_id}@movielens.invalid"
+
+
+# --- PostgreSQL: COPY into staging, merge from staging ---
+
+_STAGE_MOVIES = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS movie_import (
+        external_id bigint, title text, genre text, year integer
+    )
+"""
+# the last row of a movie in the chunk wins
+_LATEST_MOVIES = """
+    SELECT DISTINCT ON (external_id) external_id, title, genre, year
+    FROM (SELECT *, row_number() OVER () AS line FROM movie_import) staged
+    ORDER BY external_id, line DESC
+"""
+_UPDATE_MOVIES = f"""
+    UPDATE movie m
+    SET title = i.title, genre = i.genre, year = i.year
+    FROM ({_LATEST_MOVIES}) i
+    JOIN external_id x ON x.source = %s AND x.kind = 'movie' AND x.external_id = i.external_id
+    WHERE m.movie_id = x.internal_id
+"""
+# new ids come from the movie sequence; the CTE is evaluated once per row
+_INSERT_MOVIES = f"""
+    WITH new AS (
+        SELECT i.*, nextval(pg_get_serial_sequence('movie', 'movie_id')) AS movie_id
+        FROM ({_LATEST_MOVIES}) i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM external_id x
+            WHERE x.source = %s AND x.kind = 'movie' AND x.external_id = i.external_id
+        )
+    ), mapped AS (
+        INSERT INTO external_id (source, kind, external_id, internal_id)
+        SELECT %s, 'movie', external_id, movie_id FROM new
+    )
+    INSERT INTO movie (movie_id, title, genre, year, description, genre_mask, rating_count, rating_sum, avg_rating)
+    SELECT movie_id, title, genre, year, '', 0, 0, 0, 0 FROM new
+"""
+_STAGE_RATINGS = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS rating_import (
+        score double precision, created_at date, movie_external_id bigint, user_external_id bigint
+    )
+"""
+_INSERT_USERS = """
+    WITH new AS (
+        SELECT ext, nextval(pg_get_serial_sequence('appuser', 'user_id')) AS user_id
+        FROM (SELECT DISTINCT user_external_id AS ext FROM rating_import) i
+        WHERE NOT EXISTS (
+            SELECT 1 FROM external_id x
+            WHERE x.source = %s AND x.kind = 'user' AND x.external_id = i.ext
+        )
+    ), mapped AS (
+        INSERT INTO external_id (source, kind, external_id, internal_id)
+        SELECT %s, 'user', ext, user_id FROM new
+    )
+    INSERT INTO appuser (user_id, username, email, password, is_admin, rating_version)
+    SELECT user_id, %s || '_' || ext, %s || '_' || ext || '@movielens.invalid', %s, false, 0 FROM new
+"""
+# the last row of a user/movie pair in the chunk wins
+_MERGE_RATINGS = """
+    INSERT INTO rating (score, created_at, movie_movie_id, appuser_user_id)
+    SELECT DISTINCT ON (xu.internal_id, xm.internal_id) staged.score, staged.created_at, xm.internal_id, xu.internal_id
+    FROM (SELECT *, row_number() OVER () AS line FROM rating_import) staged
+    JOIN external_id xm
+        ON xm.source = %s AND xm.kind = 'movie' AND xm.external_id = staged.movie_external_id
+    JOIN external_id xu
+        ON xu.source = %s AND xu.kind = 'user' AND xu.external_id = staged.user_external_id
+    ORDER BY xu.internal_id, xm.internal_id, staged.line DESC
+    ON CONFLICT (appuser_user_id, movie_movie_id) DO UPDATE SET score = excluded.score
+"""
+
+
+def _copy_chunk(cursor, stage_sql, table, columns, rows, merge_sqls):
+    cursor.execute(stage_sql)
+    with cursor.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+    for sql, params in merge_sqls:
+        cursor.execute(sql, params)
+    cursor.execute(f"TRUNCATE {table}")
+
+
+def _write_movies_copy(rows, source):
+    with transaction.atomic(), connection.cursor() as cursor:
+        _copy_chunk(cursor, _STAGE_MOVIES, 'movie_import', ['external_id', 'title', 'genre', 'year'], rows, [
+            (_UPDATE_MOVIES, [source]),
+            (_INSERT_MOVIES, [source, source]),
+        ])
+
+
+def _write_ratings_copy(rows, source):
+    columns = ['score', 'created_at', 'movie_external_id', 'user_external_id']
+    with transaction.atomic(), connection.cursor() as cursor:
+        _copy_chunk(cursor, _STAGE_RATINGS, 'rating_import', columns, rows, [
+            (_INSERT_USERS, [source, source, source, source, UNUSABLE_PASSWORD_PREFIX]),
+            (_MERGE_RATINGS, [source, source]),
+        ])
+
+
+# --- Other backends: ORM bulk operations ---
+
+def _mapped(source, kind, external_ids):
+    """{external_id: internal_id} for the ids already imported from `source`."""
+    return dict(
+        ExternalId.objects.filter(source=source, kind=kind, external_id__in=list(external_ids))
+        .values_list('external_id', 'internal_id')
+    )
+
+
+def _write_movies_orm(rows, source):
+    latest = {external_id: (title, genre, year) for external_id, title, genre, year in rows}
+    with transaction.atomic():
+        mapped = _mapped(source, ExternalId.KIND_MOVIE, latest)
+        Movie.objects.bulk_update(
+            [Movie(movie_id=mapped[ext], title=title, genre=genre, year=year)
+             for ext, (title, genre, year) in latest.items() if ext in mapped],
+            ['title', 'genre', 'year'],
+        )
+        new = [ext for ext in latest if ext not in mapped]
+        movies = Movie.objects.bulk_create(
+            [Movie(title=latest[ext][0], genre=latest[ext][1], year=latest[ext][2], description='') for ext in new]
+        )
+        ExternalId.objects.bulk_create([
+            ExternalId(source=source, kind=ExternalId.KIND_MOVIE, external_id=ext, internal_id=movie.movie_id)
+            for ext, movie in zip(new, movies)
+        ])
+
+
+def _write_ratings_orm(rows, source):
+    with transaction.atomic():
+        users = _mapped(source, ExternalId.KIND_USER, {user for _, _, _, user in rows})
+        new = sorted({user for _, _, _, user in rows} - set(users))
+        created = AppUser.objects.bulk_create([
+            AppUser(username=username, email=email, password=UNUSABLE_PASSWORD_PREFIX)
+            for username, email in (_user_fields(source, ext) for ext in new)
+        ])
+        ExternalId.objects.bulk_create([
+            ExternalId(source=source, kind=ExternalId.KIND_USER, external_id=ext, internal_id=user.user_id)
+            for ext, user in zip(new, created)
+        ])
+        users.update((ext, user.user_id) for ext, user in zip(new, created))
+
+        movies = _mapped(source, ExternalId.KIND_MOVIE, {movie for _, _, movie, _ in rows})
+        Rating.objects.bulk_create(
+            [Rating(score=score, created_at=created_at, movie_id=movies[movie], user_id=users[user])
+             for score, created_at, movie, user in rows if movie in movies],
+            update_conflicts=True,
+            unique_fields=['user', 'movie'],
+            update_fields=['score'],
+        )
+
+
+def _load(path, parse, write, chunk_size, report):
+    started = time.monotonic()
+    total = 0
+    with open(path, newline='', encoding='utf-8') as handle:
+        for chunk in chunked(parse(csv.DictReader(handle)), chunk_size):
+            write(chunk)
+            total += len(chunk)
+            if report:
+                report(total, time.monotonic() - started)
+    return total
+
+
+def load_movies(path, chunk_size=DEFAULT_CHUNK_SIZE, source=DEFAULT_SOURCE, report=None):
+    """Import movies.csv; returns the number of rows read."""
+    write = _write_movies_copy if connection.vendor == 'postgresql' else _write_movies_orm
+    return _load(path, parse_movies, lambda rows: write(rows, source), chunk_size, report)
+
+
+def load_ratings(path, chunk_size=DEFAULT_CHUNK_SIZE, source=DEFAULT_SOURCE, report=None):
+    """Import ratings.csv (creating missing users); returns the number of rows read."""
+    write = _write_ratings_copy if connection.vendor == 'postgresql' else _write_ratings_orm
+    return _load(path, parse_ratings, lambda rows: write(rows, source), chunk_size, report)
+
+
+def deferred_rating_indexes():
+    """
+    Secondary rating indexes that are dropped during a PostgreSQL load and
+    rebuilt once at the end (the unique constraint stays: the upsert needs it).
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    return list(Rating._meta.indexes)
+
+
+def drop_indexes(indexes):
+    if not indexes:
+        return
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.execute(f"DROP INDEX IF EXISTS {editor.quote_name(index.name)}")
+
+
+def create_indexes(indexes):
+    if not indexes:
+        return
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.add_index(Rating, index)
@@ -0,0 +1,132 @@
+"""
+Keyset (cursor) pagination for the movie catalog endpoints.
+
+Pages are fetched with `WHERE (key, movie_id) > (last_key, last_id)` instead
+of OFFSET, so page 1000 costs the same as page 1. Cursors are opaque
+base64 tokens holding the sort, the direction and the boundary row's key.
+"""
+
+import base64
+import binascii
+import json
+
+from django.db.models import F, Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# sort name -> (key field, descending, nullable); movie_id asc breaks ties.
+# Every key is a stored Movie column with a (key, movie_id) index.
+SORTS = {
+    'title': ('title', False, False),
+    'year': ('year', True, True),
+    'rating': ('avg_rating', True, False),
+    # only on querysets annotated by search.apply_text_search
+    'relevance': ('search_rank', True, False),
+}
+CATALOG_SORTS = ('title', 'year', 'rating')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def wants_page(params):
+    return 'cursor' in params or 'limit' in params
+
+
+def page_size(params):
+    raw = params.get('limit')
+    if raw in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        raise InvalidCursor('limit must be an integer')
+    if size < 1:
+        raise InvalidCursor('limit must be positive')
+    return min(size, MAX_PAGE_SIZE)
+
+
+def encode_cursor(sort, direction, key, movie_id):
+    payload = json.dumps({'s': sort, 'd': direction, 'k': key, 'id': movie_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction, key, movie_id = data['d'], data['k'], int(data['id'])
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor')
+    if data.get('s') != sort or direction not in ('next', 'prev'):
+        raise InvalidCursor('Cursor does not match this query')
+    return direction, key, movie_id
+
+
+def _after(field, descending, nullable, key, movie_id):
+    """Rows strictly after (key, movie_id) in page order (NULL keys last)."""
+    if key is None:
+        return Q(**{f'{field}__isnull': True, 'movie_id__gt': movie_id})
+    beyond = Q(**{f'{field}__lt' if descending else f'{field}__gt': key})
+    cond = beyond | Q(**{field: key, 'movie_id__gt': movie_id})
+    if nullable:
+        cond |= Q(**{f'{field}__isnull': True})
+    return cond
+
+
+def _before(field, descending, nullable, key, movie_id):
+    """Rows strictly before (key, movie_id) in page order (NULL keys last)."""
+    if key is None:
+        return Q(**{f'{field}__isnull': False}) | Q(**{f'{field}__isnull': True, 'movie_id__lt': movie_id})
+    before = Q(**{f'{field}__gt' if descending else f'{field}__lt': key})
+    return before | Q(**{field: key, 'movie_id__lt': movie_id})
+
+
+def _ordering(field, descending, nullable, reverse=False):
+    # NULL keys come last in page order, so first when walking backwards.
+    # NOT NULL keys get a plain ORDER BY, so it matches their index.
+    nulls = {}
+    if nullable:
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+    expr = F(field).desc(**nulls) if descending != reverse else F(field).asc(**nulls)
+    return [expr, '-movie_id' if reverse else 'movie_id']
+
+
+def order_for(queryset, sort):
+    """Full (unpaginated) ordering identical to the paginated one."""
+    field, descending, nullable = SORTS[sort]
+    return queryset.order_by(*_ordering(field, descending, nullable))
+
+
+def paginate(queryset, sort, params):
+    """
+    Return (rows, next_cursor, prev_cursor) for the page described by
+    ?cursor=&limit=. Raises InvalidCursor on malformed input.
+    """
+    field, descending, nullable = SORTS[sort]
+    limit = page_size(params)
+
+    token = params.get('cursor')
+    direction, key, movie_id = decode_cursor(token, sort) if token else ('next', None, None)
+    backwards = direction == 'prev'
+
+    if movie_id is not None:
+        bound = _before if backwards else _after
+        queryset = queryset.filter(bound(field, descending, nullable, key, movie_id))
+
+    rows = list(queryset.order_by(*_ordering(field, descending, nullable, reverse=backwards))[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+    if not rows:
+        return rows, None, None
+
+    first, last = rows[0], rows[-1]
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else movie_id is not None
+    next_cursor = encode_cursor(sort, 'next', getattr(last, field), last.movie_id) if has_next else None
+    prev_cursor = encode_cursor(sort, 'prev', getattr(first, field), first.movie_id) if has_prev else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,93 @@
+"""
+Single-statement rating upsert.
+
+The rating row is written with one INSERT ... ON CONFLICT (user, movie)
+DO UPDATE ... RETURNING (PostgreSQL, SQLite >= 3.35), so duplicate
+submissions can no longer race between an exists() check and the insert.
+Raw SQL bypasses the Rating signals, so the derived tables are updated
+explicitly through apply_rating_changes().
+
+Every rating write path (this upsert, the Rating pre_save signal, the
+delete and bulk endpoints) first takes lock_user_ratings(), so one user's
+writes run one at a time and each reads the old score the previous one
+committed.
+"""
+
+import datetime
+
+from django.db import connection, transaction
+
+from .aggregates import apply_rating_changes
+from .models import AppUser, Rating
+
+# One read that checks the movie and fetches the previous score. Run after
+# lock_user_ratings() as its own statement, so on PostgreSQL it sees rows
+# committed by the writer it waited for.
+_LOOKUP_SQL = """
+    SELECT m.movie_id, r.score
+    FROM appuser u
+    JOIN movie m ON m.movie_id = %s
+    LEFT JOIN rating r ON r.movie_movie_id = m.movie_id AND r.appuser_user_id = u.user_id
+    WHERE u.user_id = %s
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO rating (score, created_at, movie_movie_id, appuser_user_id)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (appuser_user_id, movie_movie_id) DO UPDATE SET score = excluded.score
+    RETURNING rating_id, created_at
+"""
+
+
+def lock_user_ratings(user_id):
+    """
+    Lock the user row (SELECT ... FOR UPDATE, a no-op on SQLite, which
+    locks the whole database on write) until the transaction ends.
+    Returns False if the user does not exist.
+    """
+    return bool(list(AppUser.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True)))
+
+
+def is_duplicate_rating(error):
+    """
+    True if an IntegrityError is the rating_unique_user_movie violation (the
+    user already rated the movie), not some other constraint hit while the
+    derived tables were updated.
+    """
+    cause = error.__cause__
+    diag = getattr(cause, 'diag', None)
+    if diag is not None:  # psycopg
+        return diag.constraint_name == 'rating_unique_user_movie'
+    # SQLite only names the columns
+    meta = Rating._meta
+    columns = ', '.join(f"{meta.db_table}.{meta.get_field(name).column}" for name in ('user', 'movie'))
+    return f"UNIQUE constraint failed: {columns}" in str(error)
+
+
+def upsert_rating(user_id, movie_id, score):
+    """
+    Create or replace the user's rating of a movie.
+    Returns (rating_id, created_at, old_score), old_score None if the rating
+    is new, or None if the user or movie does not exist.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if not lock_user_ratings(user_id):
+            return None
+        cursor.execute(_LOOKUP_SQL, [movie_id, user_id])
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        old_score = row[1]
+
+        created_field = Rating._meta.get_field('created_at')
+        cursor.execute(_UPSERT_SQL, [
+            score,
+            connection.ops.adapt_datefield_value(datetime.date.today()),
+            movie_id,
+            user_id,
+        ])
+        rating_id, created_at = cursor.fetchone()
+
+        apply_rating_changes(user_id, [(movie_id, old_score, score)])
+
+    return rating_id, created_field.to_python(created_at), old_score
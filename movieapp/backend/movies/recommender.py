@@ -0,0 +1,674 @@
+"""
+Recommendation engine used by the API views and the background worker.
+
+The user x movie score matrix is stored in CSR form (indptr / indices / data)
+so that similarity and weighted score sums for one user can be computed with
+a handful of NumPy operations instead of nested Python loops.
+"""
+
+import heapq
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from .aggregates import leaderboard, neighbor_similarities
+from .factors import FactorScores, get_factor_model
+from .freshness import current_watermark, is_fresh, record_generation
+from .genres import MAX_GENRES, bits_of, mask_to_bits
+from .models import Movie, MovieNeighbor, MovieRatingStats, Rating, Recommendation, RecommendationState
+
+
+class RatingMatrix:
+    """
+    Sparse user x movie score matrix in CSR layout.
+
+    Rows are users (``user_ids[row]``), columns are movies
+    (``movie_ids[col]``). The scores of row ``r`` live in
+    ``data[indptr[r]:indptr[r + 1]]`` with their column numbers in
+    ``indices`` at the same positions.
+    """
+
+    def __init__(self, user_ids, movie_ids, indptr, indices, data):
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        # Row number of every stored score, handy for np.bincount reductions
+        self.rows = np.repeat(
+            np.arange(len(user_ids), dtype=np.int64), np.diff(indptr)
+        )
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build the matrix from an iterable of (user_id, movie_id, score) tuples.
+        """
+        rows = list(rows)
+        if not rows:
+            empty = np.array([], dtype=np.int64)
+            return cls(empty, empty, np.zeros(1, dtype=np.int64), empty,
+                       np.array([], dtype=np.float64))
+
+        user_col, movie_col, score_col = zip(*rows)
+        raw_users = np.fromiter(user_col, dtype=np.int64, count=len(rows))
+        raw_movies = np.fromiter(movie_col, dtype=np.int64, count=len(rows))
+        scores = np.fromiter(score_col, dtype=np.float64, count=len(rows))
+
+        user_ids, row_idx = np.unique(raw_users, return_inverse=True)
+        movie_ids, col_idx = np.unique(raw_movies, return_inverse=True)
+
+        # Stable sort keeps the original order of scores within each user
+        order = np.argsort(row_idx, kind="stable")
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_idx, minlength=len(user_ids)), out=indptr[1:])
+
+        return cls(user_ids, movie_ids, indptr, col_idx[order], scores[order])
+
+    @classmethod
+    def from_db(cls, exclude_user_id=None, user_ids=None):
+        """
+        Load the matrix straight from the ``rating`` table using a
+        values_list projection (no model instances are built).
+        """
+        qs = Rating.objects.all()
+        if exclude_user_id is not None:
+            qs = qs.exclude(user_id=exclude_user_id)
+        if user_ids is not None:
+            qs = qs.filter(user_id__in=user_ids)
+        return cls.from_rows(qs.values_list("user_id", "movie_id", "score"))
+
+    @property
+    def shape(self):
+        return len(self.user_ids), len(self.movie_ids)
+
+    def _target_vector(self, user_ratings_map):
+        """
+        Project a {movie_id: score} map onto the matrix columns.
+        Returns (scores, mask) where mask[col] is True for rated columns.
+        """
+        scores = np.zeros(len(self.movie_ids), dtype=np.float64)
+        mask = np.zeros(len(self.movie_ids), dtype=bool)
+        if not user_ratings_map or not len(self.movie_ids):
+            return scores, mask
+
+        ids = np.fromiter(user_ratings_map.keys(), dtype=np.int64,
+                          count=len(user_ratings_map))
+        values = np.fromiter(user_ratings_map.values(), dtype=np.float64,
+                             count=len(user_ratings_map))
+        pos = np.searchsorted(self.movie_ids, ids)
+        pos_clipped = np.minimum(pos, len(self.movie_ids) - 1)
+        found = self.movie_ids[pos_clipped] == ids
+        scores[pos_clipped[found]] = values[found]
+        mask[pos_clipped[found]] = True
+        return scores, mask
+
+    def similarities(self, user_ratings_map):
+        """
+        Similarity of every row to the target ratings, using
+        ``1 / (1 + mean(|score - target_score|))`` over co-rated movies.
+        Rows without co-rated movies get a similarity of 0.
+        """
+        n_users = len(self.user_ids)
+        target, mask = self._target_vector(user_ratings_map)
+        co_rated = mask[self.indices]
+
+        diffs = np.abs(self.data - target[self.indices])
+        sum_diff = np.bincount(self.rows[co_rated], weights=diffs[co_rated],
+                               minlength=n_users)
+        overlap = np.bincount(self.rows[co_rated], minlength=n_users)
+
+        sims = np.zeros(n_users, dtype=np.float64)
+        has_overlap = overlap > 0
+        sims[has_overlap] = 1 / (1 + sum_diff[has_overlap] / overlap[has_overlap])
+        return sims
+
+    def weighted_scores(self, similarities, user_ratings_map):
+        """
+        Similarity-weighted mean score of every movie the target has not
+        rated. ``similarities`` is a per-row array aligned with ``user_ids``.
+        Returns {movie_id: score} for movies with a positive total weight.
+        """
+        _, mask = self._target_vector(user_ratings_map)
+        weights = similarities[self.rows]
+        keep = (~mask[self.indices]) & (weights > 0)
+
+        cols = self.indices[keep]
+        n_movies = len(self.movie_ids)
+        total = np.bincount(cols, weights=weights[keep] * self.data[keep],
+                            minlength=n_movies)
+        weight = np.bincount(cols, weights=weights[keep], minlength=n_movies)
+
+        scored = np.flatnonzero(weight > 0)
+        return dict(zip(
+            self.movie_ids[scored].tolist(),
+            (total[scored] / weight[scored]).tolist(),
+        ))
+
+    def column_norms(self):
+        """Euclidean norm of every movie column."""
+        return np.sqrt(np.bincount(self.indices, weights=self.data ** 2,
+                                   minlength=len(self.movie_ids)))
+
+    def columns(self):
+        """
+        CSC view of the matrix: (col_indptr, col_rows, col_data).
+        Built lazily the first time item-oriented code needs it.
+        """
+        if getattr(self, '_csc', None) is None:
+            order = np.argsort(self.indices, kind="stable")
+            col_indptr = np.zeros(len(self.movie_ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=len(self.movie_ids)),
+                      out=col_indptr[1:])
+            self._csc = (col_indptr, self.rows[order], self.data[order])
+        return self._csc
+
+    def item_dot_products(self, col):
+        """
+        Dot product of movie column `col` with every movie column, computed
+        by walking the rows of the users that rated `col`.
+        """
+        col_indptr, col_rows, col_data = self.columns()
+        raters = col_rows[col_indptr[col]:col_indptr[col + 1]]
+        rater_scores = col_data[col_indptr[col]:col_indptr[col + 1]]
+
+        starts = self.indptr[raters]
+        lengths = self.indptr[raters + 1] - starts
+        # Positions of every score belonging to those raters, without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(lengths.sum())
+        weights = np.repeat(rater_scores, lengths) * self.data[positions]
+        return np.bincount(self.indices[positions], weights=weights,
+                           minlength=len(self.movie_ids))
+
+    def top_item_neighbors(self, cols, k, norms=None):
+        """
+        Cosine top-K neighbours for each movie column in `cols`.
+        Returns a list of (movie_id, neighbor_movie_id, similarity).
+        """
+        if norms is None:
+            norms = self.column_norms()
+
+        results = []
+        for col in cols:
+            if norms[col] == 0:
+                continue
+            dots = self.item_dot_products(col)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sims = np.where(norms > 0, dots / (norms[col] * norms), 0.0)
+            sims[col] = 0.0
+
+            candidates = np.flatnonzero(sims > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-sims[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-sims[candidates], kind="stable")]
+
+            movie_id = int(self.movie_ids[col])
+            results.extend(
+                (movie_id, int(self.movie_ids[other]), float(sims[other]))
+                for other in candidates
+            )
+        return results
+
+    def collaborative_scores(self, user_ratings_map, exclude_user_id=None):
+        """
+        User-based collaborative filter for one target user in a single
+        batched pass: similarities first, then weighted score sums.
+        """
+        sims = self.similarities(user_ratings_map)
+        if exclude_user_id is not None:
+            sims[self.user_ids == exclude_user_id] = 0.0
+        return self.weighted_scores(sims, user_ratings_map)
+
+
+def _calculate_genre_preferences(user_ratings):
+    """
+    Build a per-genre preference profile using the user's historical ratings.
+    `user_ratings` is an iterable of (movie_id, score, genre_mask) tuples.
+    Returns a dense vector indexed by genre bit (mean score per genre) and
+    the matching boolean vector of genres the user has rated.
+    """
+    user_ratings = list(user_ratings)
+    if not user_ratings:
+        return np.zeros(MAX_GENRES), np.zeros(MAX_GENRES, dtype=bool)
+
+    bits = mask_to_bits([mask for _, _, mask in user_ratings])
+    scores = np.array([score for _, score, _ in user_ratings], dtype=np.float64)
+    sums = scores @ bits
+    counts = bits.sum(axis=0)
+
+    has_pref = counts > 0
+    prefs = np.zeros(MAX_GENRES)
+    prefs[has_pref] = sums[has_pref] / counts[has_pref]
+    return prefs, has_pref
+
+
+def _predict_content_scores(candidates, genre_preferences):
+    """
+    Apply the genre profile to unseen movies to estimate a score: the mean
+    preference over the candidate's genres the user has an opinion on.
+    `candidates` is a list of (movie_id, genre_mask) tuples; all of them are
+    scored with one pair of matrix-vector products.
+    """
+    prefs, has_pref = genre_preferences
+    if not candidates or not has_pref.any():
+        return {}
+
+    bits = mask_to_bits([mask for _, mask in candidates])
+    weights = has_pref.astype(np.float64)
+    numerator = bits @ (prefs * weights)
+    denominator = bits @ weights
+
+    scored = np.flatnonzero(denominator > 0)
+    movie_ids = [candidates[i][0] for i in scored.tolist()]
+    return dict(zip(movie_ids, (numerator[scored] / denominator[scored]).tolist()))
+
+
+def _favourite_genres(genre_preferences, limit):
+    """Bits of the user's `limit` best-rated genres."""
+    prefs, has_pref = genre_preferences
+    rated = np.flatnonzero(has_pref)
+    order = np.argsort(-prefs[rated], kind="stable")
+    return rated[order][:limit].tolist()
+
+
+def _predict_collaborative_scores(user_id, user_ratings_map):
+    """
+    Estimate scores using a lightweight user-based collaborative filter.
+    Similarities come from the incrementally maintained pair table, so only
+    the neighbours' ratings are loaded into the sparse matrix.
+    """
+    similarities = neighbor_similarities(user_id)
+    if not similarities:
+        return {}
+
+    matrix = RatingMatrix.from_db(user_ids=list(similarities))
+    weights = np.array(
+        [similarities[uid] for uid in matrix.user_ids.tolist()], dtype=np.float64
+    )
+    return matrix.weighted_scores(weights, user_ratings_map)
+
+
+def _predict_item_neighbor_scores(user_ratings_map):
+    """
+    Item-based prediction from the precomputed MovieNeighbor table:
+    similarity-weighted mean of the user's scores over the rated movies that
+    list the candidate as a neighbour. Cost is O(history x K).
+    Returns None when the table has nothing for the user's movies (e.g. it
+    was never built), so the caller can fall back to the user-based filter.
+    """
+    rated_ids = list(user_ratings_map)
+    rows = (
+        MovieNeighbor.objects.filter(movie_id__in=rated_ids)
+        .exclude(neighbor_id__in=rated_ids)
+        .values_list('movie_id', 'neighbor_id', 'similarity')
+    )
+
+    totals = defaultdict(lambda: {"total": 0.0, "weight": 0.0})
+    for movie_id, neighbor_id, similarity in rows:
+        bucket = totals[neighbor_id]
+        bucket["total"] += similarity * user_ratings_map[movie_id]
+        bucket["weight"] += similarity
+
+    return {
+        movie_id: bucket["total"] / bucket["weight"]
+        for movie_id, bucket in totals.items()
+        if bucket["weight"] > 0
+    } or None
+
+
+def _predict_factor_scores(user_id, watched_ids):
+    """
+    Scores from the memory-mapped matrix factorisation model (train_factors).
+    Returns None when there is no model or the user is not part of it yet,
+    so the caller can fall back to the user-based filter.
+    """
+    model = get_factor_model()
+    if model is None:
+        return None
+    return model.score_unseen(user_id, watched_ids) or None
+
+
+# Tamanho máximo de cada fonte do pool de candidatos (fase de retrieval)
+CANDIDATES_FROM_NEIGHBORS = 200
+CANDIDATES_PER_GENRE = 50
+CANDIDATE_GENRES = 5
+CANDIDATES_POPULAR = 100
+
+RECOMMENDATIONS_PER_USER = 10
+
+
+def _top_predictions(predictions, limit):
+    """The `limit` movie ids with the highest predicted score."""
+    if isinstance(predictions, FactorScores):
+        return predictions.top(limit)
+    return heapq.nlargest(limit, predictions, key=predictions.get)
+
+
+class DatabaseSource:
+    """
+    Data access for recommending to one user straight from the database.
+    Used on the request path and by the background worker.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def user_ratings(self):
+        """(movie_id, score, genre_mask) for every movie the user rated."""
+        return list(
+            Rating.objects.filter(user_id=self.user_id)
+            .values_list('movie_id', 'score', 'movie__genre_mask')
+        )
+
+    def collaborative_scores(self, user_ratings_map):
+        return _predict_collaborative_scores(self.user_id, user_ratings_map)
+
+    def genre_candidates(self, genre_bits, watched_ids):
+        """
+        Best-rated unseen movies of the given genres (via movie_genre).
+        Walks the leaderboard index (leaderboard_avg_idx) and stops after
+        CANDIDATES_PER_GENRE rows instead of sorting the whole genre; only a
+        genre with fewer rated movies than that is topped up with its
+        unrated ones.
+        """
+        movie_ids = []
+        for bit in genre_bits:
+            # EXISTS, not a join, so the planner keeps the index order
+            in_genre = Movie.genres.through.objects.filter(movie_id=OuterRef('movie_id'), genre__bit=bit)
+            rated = list(
+                MovieRatingStats.objects.filter(Exists(in_genre))
+                .exclude(movie_id__in=watched_ids)
+                .order_by('-average', '-rating_count', 'movie_id')
+                .values_list('movie_id', flat=True)[:CANDIDATES_PER_GENRE]
+            )
+            if len(rated) < CANDIDATES_PER_GENRE:
+                rated.extend(
+                    Movie.objects.filter(genres__bit=bit, rating_stats__isnull=True)
+                    .exclude(movie_id__in=watched_ids)
+                    .order_by('movie_id')
+                    .values_list('movie_id', flat=True)[:CANDIDATES_PER_GENRE - len(rated)]
+                )
+            movie_ids.extend(rated)
+        return movie_ids
+
+    def popular_candidates(self, watched_ids):
+        """Most rated movies the user has not seen yet."""
+        return list(
+            MovieRatingStats.objects.exclude(movie_id__in=watched_ids)
+            .order_by('-rating_count', 'movie_id')
+            .values_list('movie_id', flat=True)[:CANDIDATES_POPULAR]
+        )
+
+    def movie_genres(self, movie_ids):
+        return list(Movie.objects.filter(movie_id__in=movie_ids).values_list('movie_id', 'genre_mask'))
+
+    def top_rated(self, exclude_ids, limit):
+        """(movie_id, average) of the best-rated movies not in exclude_ids."""
+        # Lido da leaderboard materializada (só filmes com LEADERBOARD_MIN_RATINGS)
+        return list(
+            leaderboard().exclude(movie_id__in=exclude_ids)
+            .values_list('movie_id', 'average')[:limit]
+        )
+
+    def fillers(self, exclude_ids, limit):
+        return list(
+            Movie.objects.exclude(movie_id__in=exclude_ids)
+            .values_list('movie_id', flat=True)[:limit]
+        )
+
+
+class CatalogSnapshot:
+    """
+    The whole rating matrix and catalog loaded once, for batch rebuilds.
+    Serves the same questions as DatabaseSource from memory (see for_user).
+    """
+
+    def __init__(self):
+        self.matrix = RatingMatrix.from_db()
+        self.genre_masks = dict(Movie.objects.values_list('movie_id', 'genre_mask'))
+        self.all_movie_ids = sorted(self.genre_masks)
+
+        matrix = self.matrix
+        n_movies = len(matrix.movie_ids)
+        counts = np.bincount(matrix.indices, minlength=n_movies)
+        sums = np.bincount(matrix.indices, weights=matrix.data, minlength=n_movies)
+        rated_ids = matrix.movie_ids.tolist()
+        self.average = dict(zip(rated_ids, (sums / np.maximum(counts, 1)).tolist()))
+        self.count = dict(zip(rated_ids, counts.tolist()))
+
+        self.popular = sorted(self.count, key=lambda m: (-self.count[m], m))
+        min_ratings = max(settings.LEADERBOARD_MIN_RATINGS, 1)
+        self.top_global = sorted(
+            (m for m in self.average if self.count[m] >= min_ratings),
+            key=lambda m: (-self.average[m], -self.count[m], m),
+        )
+
+        # Per-genre lists ordered like DatabaseSource.genre_candidates
+        by_genre = defaultdict(list)
+        for movie_id, mask in self.genre_masks.items():
+            for bit in bits_of(mask):
+                by_genre[bit].append(movie_id)
+        self.by_genre = {
+            bit: sorted(ids, key=lambda m: (
+                m not in self.average, -self.average.get(m, 0.0), -self.count.get(m, 0), m,
+            ))
+            for bit, ids in by_genre.items()
+        }
+
+    def for_user(self, user_id):
+        return SnapshotSource(self, user_id)
+
+
+def _first_unseen(ordered_ids, exclude_ids, limit):
+    result = []
+    for movie_id in ordered_ids:
+        if len(result) >= limit:
+            break
+        if movie_id not in exclude_ids:
+            result.append(movie_id)
+    return result
+
+
+class SnapshotSource:
+    """In-memory counterpart of DatabaseSource backed by a CatalogSnapshot."""
+
+    def __init__(self, snapshot, user_id):
+        self.snapshot = snapshot
+        self.user_id = user_id
+
+    def user_ratings(self):
+        matrix = self.snapshot.matrix
+        row = int(np.searchsorted(matrix.user_ids, self.user_id))
+        if row >= len(matrix.user_ids) or matrix.user_ids[row] != self.user_id:
+            return []
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        movie_ids = matrix.movie_ids[matrix.indices[start:end]].tolist()
+        scores = matrix.data[start:end].tolist()
+        return [
+            (movie_id, score, self.snapshot.genre_masks.get(movie_id, 0))
+            for movie_id, score in zip(movie_ids, scores)
+        ]
+
+    def collaborative_scores(self, user_ratings_map):
+        return self.snapshot.matrix.collaborative_scores(
+            user_ratings_map, exclude_user_id=self.user_id
+        )
+
+    def genre_candidates(self, genre_bits, watched_ids):
+        movie_ids = []
+        for bit in genre_bits:
+            ordered = self.snapshot.by_genre.get(bit, [])
+            movie_ids.extend(_first_unseen(ordered, watched_ids, CANDIDATES_PER_GENRE))
+        return movie_ids
+
+    def popular_candidates(self, watched_ids):
+        return _first_unseen(self.snapshot.popular, watched_ids, CANDIDATES_POPULAR)
+
+    def movie_genres(self, movie_ids):
+        masks = self.snapshot.genre_masks
+        return [(movie_id, masks[movie_id]) for movie_id in movie_ids if movie_id in masks]
+
+    def top_rated(self, exclude_ids, limit):
+        average = self.snapshot.average
+        return [
+            (movie_id, average[movie_id])
+            for movie_id in _first_unseen(self.snapshot.top_global, exclude_ids, limit)
+        ]
+
+    def fillers(self, exclude_ids, limit):
+        return _first_unseen(self.snapshot.all_movie_ids, exclude_ids, limit)
+
+
+def compute_recommendations(source):
+    """
+    Gera recomendações com 3 níveis de tentativa:
+    1. Híbrido (Se tiver histórico e matches). A parte colaborativa usa
+       utilizadores semelhantes ou, conforme RECOMMENDER_MODE, a tabela de
+       vizinhos filme-filme ('item') ou o modelo de fatores latentes ('mf').
+       Só é pontuado um pool limitado de candidatos (top dos vizinhos, top
+       dos géneros favoritos e filmes populares), nunca o catálogo inteiro.
+    2. Top Global (Se for user novo ou algoritmo falhar)
+    3. Aleatório (Se o sistema estiver vazio de ratings e precisar de encher chouriços)
+
+    `source` é um DatabaseSource ou SnapshotSource.
+    Devolve uma lista de {'movie_id', 'predicted_score'}.
+    """
+    
+    # Busca histórico do user: (movie_id, score, genre_mask)
+    user_ratings = source.user_ratings()
+    
+    # Lista de IDs que o user já viu (para não recomendar repetidos)
+    watched_ids = {movie_id for movie_id, _, _ in user_ratings}
+    
+    top_entries = []
+    limit = RECOMMENDATIONS_PER_USER
+
+    # --- FASE 1: Tentar Algoritmo Personalizado (Só se o user tiver histórico) ---
+    if user_ratings:
+        user_ratings_map = {movie_id: score for movie_id, score, _ in user_ratings}
+
+        collaborative_predictions = None
+        if settings.RECOMMENDER_MODE == 'item':
+            collaborative_predictions = _predict_item_neighbor_scores(user_ratings_map)
+        elif settings.RECOMMENDER_MODE == 'mf':
+            collaborative_predictions = _predict_factor_scores(source.user_id, watched_ids)
+        if collaborative_predictions is None:
+            collaborative_predictions = source.collaborative_scores(user_ratings_map)
+        genre_preferences = _calculate_genre_preferences(user_ratings)
+
+        # Retrieval: pool limitado de candidatos
+        pool = set(_top_predictions(collaborative_predictions, CANDIDATES_FROM_NEIGHBORS))
+        pool.update(source.genre_candidates(
+            _favourite_genres(genre_preferences, CANDIDATE_GENRES), watched_ids
+        ))
+        pool.update(source.popular_candidates(watched_ids))
+        pool -= watched_ids
+        candidates = source.movie_genres(pool)
+        
+        if candidates:
+            content_predictions = _predict_content_scores(candidates, genre_preferences)
+
+            combined = []
+            for movie_id, _ in candidates:
+                collab = collaborative_predictions.get(movie_id)
+                content = content_predictions.get(movie_id)
+                
+                if collab is None and content is None:
+                    continue
+                
+                if collab is None: score = content
+                elif content is None: score = collab
+                else: score = (0.6 * collab) + (0.4 * content)
+
+                combined.append({'movie_id': movie_id, 'predicted_score': score})
+            
+            combined.sort(key=lambda x: (-x['predicted_score'], x['movie_id']))
+            top_entries = combined[:limit]
+
+    # --- FASE 2: Fallback para Top Global (Se Fase 1 falhou ou User é Novo) ---
+    # Se ainda não temos 10 filmes, vamos buscar os melhores da BD
+    if len(top_entries) < limit:
+        current_ids = {e['movie_id'] for e in top_entries}
+        needed = limit - len(top_entries)
+        
+        for movie_id, avg in source.top_rated(watched_ids.union(current_ids), needed):
+            # Já sabemos que tem avg, mas por segurança fazemos cast
+            top_entries.append({'movie_id': movie_id, 'predicted_score': float(avg) if avg else 0.0})
+
+    # --- FASE 3: Fallback Final (Se Fase 2 não chegou - BD com poucos ratings) ---
+    # Se mesmo assim não temos 10 filmes (ex: BD nova, ninguém avaliou nada),
+    # enchemos com filmes aleatórios para não mostrar ecrã vazio.
+    if len(top_entries) < limit:
+        current_ids = {e['movie_id'] for e in top_entries}
+        exclude_ids = watched_ids.union(current_ids)
+        
+        needed = limit - len(top_entries)
+        # Traz quaisquer filmes que faltem
+        for movie_id in source.fillers(exclude_ids, needed):
+            # Score 0 porque são fillers
+            top_entries.append({'movie_id': movie_id, 'predicted_score': 0})
+
+    return top_entries
+
+
+def _build_recommendation_rows(user_id, entries):
+    return [
+        Recommendation(
+            user_id=user_id,
+            movie_id=entry['movie_id'],
+            predicted_score=round(entry['predicted_score'], 2),
+        )
+        for entry in entries
+    ]
+
+
+def save_recommendations_bulk(results, watermarks=None):
+    """
+    Replace the lists of several users with one DELETE and one bulk_create.
+    `results` maps user_id -> entries from compute_recommendations.
+    `watermarks` maps user_id -> the freshness watermark read before the
+    entries were computed; those users get their RecommendationState
+    updated in the same transaction, even if there was nothing to store.
+    """
+    written = {user_id: entries for user_id, entries in results.items() if entries}
+    if not written and not watermarks:
+        return 0
+    rows = [
+        row
+        for user_id, entries in written.items()
+        for row in _build_recommendation_rows(user_id, entries)
+    ]
+    with transaction.atomic():
+        if written:
+            Recommendation.objects.filter(user_id__in=list(written)).delete()
+            Recommendation.objects.bulk_create(rows)
+        if watermarks:
+            record_generation(watermarks)
+    return len(rows)
+
+
+def generate_recommendations(user, force=False):
+    """
+    Recompute and store the recommendations of one user from the database.
+    Skipped when the stored list is still fresh (no rating, catalog or
+    algorithm change since it was built) unless force=True.
+    Returns True if a new list was stored.
+    """
+    # Watermark lido antes de calcular: escritas concorrentes deixam a lista stale
+    watermark = current_watermark(user.user_id)
+    if not force:
+        state = RecommendationState.objects.filter(user_id=user.user_id).first()
+        if is_fresh(state, watermark):
+            return False
+
+    top_entries = compute_recommendations(DatabaseSource(user.user_id))
+
+    # --- SALVAR ---
+    # Troca atómica: quem lê continua a ver a lista antiga até ao commit
+    return save_recommendations_bulk(
+        {user.user_id: top_entries}, {user.user_id: watermark}
+    ) > 0
@@ -0,0 +1,74 @@
+"""
+Full-text search over movie title, director, genre and description.
+
+PostgreSQL: movie.search_vector is a tsvector kept up to date by a trigger
+and indexed with GIN; matches are ranked with ts_rank.
+SQLite: movie_fts is an FTS5 external-content table kept up to date by
+triggers; matches are ranked with bm25.
+Both are created by migration 0011. Other backends fall back to icontains.
+
+Every word of the query must match (as a prefix, so partially typed words
+still find results).
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+_WORDS = re.compile(r"\w+")
+
+# FTS5 bm25 column weights, in movie_fts column order
+_FTS5_WEIGHTS = "10.0, 5.0, 2.0, 1.0"
+
+
+def search_terms(query):
+    """'The Dark-Knight!' -> ['the', 'dark', 'knight']"""
+    return _WORDS.findall(query.lower())
+
+
+def no_matches(queryset):
+    """Empty result that can still be ordered by search_rank."""
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField())).none()
+
+
+def apply_text_search(queryset, query):
+    """
+    Filter a Movie queryset to the rows matching `query` and annotate them
+    with `search_rank` (higher is more relevant).
+    """
+    terms = search_terms(query)
+    if not terms:
+        return no_matches(queryset)
+
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        return queryset.filter(
+            RawSQL("movie.search_vector @@ to_tsquery('simple', %s)", [tsquery], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(
+                "ts_rank(movie.search_vector, to_tsquery('simple', %s))", [tsquery], output_field=FloatField()
+            )
+        )
+
+    if connection.vendor == 'sqlite':
+        # Quoted terms cannot be parsed as FTS5 operators
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.filter(
+            movie_id__in=RawSQL("SELECT rowid FROM movie_fts WHERE movie_fts MATCH %s", [match])
+        ).annotate(
+            search_rank=RawSQL(
+                f"(SELECT -bm25(movie_fts, {_FTS5_WEIGHTS}) FROM movie_fts "
+                "WHERE movie_fts MATCH %s AND movie_fts.rowid = movie.movie_id)",
+                [match],
+                output_field=FloatField(),
+            )
+        )
+
+    for term in terms:
+        queryset = queryset.filter(
+            Q(title__icontains=term) | Q(director__icontains=term)
+            | Q(genre__icontains=term) | Q(description__icontains=term)
+        )
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,95 @@
+"""
+Model signal handlers that keep derived data in sync with rating, movie and
+user writes.
+Connected in MoviesConfig.ready().
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .aggregates import apply_rating_change, remove_movie_pair_stats, update_system_stats
+from .freshness import bump_catalog_version
+from .genres import mask_for, resolve_genres, tokenize_genres
+from .models import AppUser, Movie, Rating
+from .ratings import lock_user_ratings
+
+
+@receiver(pre_save, sender=Rating)
+def remember_previous_score(sender, instance, **kwargs):
+    """
+    Keep the stored score around so post_save can compute the delta.
+    Inside a transaction the user's rating writes are serialised first (see
+    ratings.lock_user_ratings), so concurrent writes cannot both compute
+    their delta from the same old score.
+    """
+    instance._previous_score = None
+    in_transaction = transaction.get_connection().in_atomic_block
+    if in_transaction:
+        lock_user_ratings(instance.user_id)
+    if not instance._state.adding and instance.pk is not None:
+        previous = Rating.objects.filter(pk=instance.pk)
+        if in_transaction:
+            previous = previous.select_for_update()
+        instance._previous_score = previous.values_list('score', flat=True).first()
+
+
+@receiver(post_save, sender=Rating)
+def rating_saved(sender, instance, created, **kwargs):
+    old_score = None if created else getattr(instance, '_previous_score', None)
+    apply_rating_change(instance.user_id, instance.movie_id, old_score, instance.score)
+
+
+@receiver(post_delete, sender=Rating)
+def rating_deleted(sender, instance, **kwargs):
+    apply_rating_change(instance.user_id, instance.movie_id, instance.score, None)
+
+
+@receiver(pre_delete, sender=Movie)
+def movie_deleting(sender, instance, **kwargs):
+    """Pair stats must lose the movie's co-ratings while they are still readable."""
+    remove_movie_pair_stats(instance.pk)
+
+
+@receiver(pre_save, sender=Movie)
+def index_movie_genres(sender, instance, **kwargs):
+    """Refresh the genre vocabulary and the movie's genre bitset on every save."""
+    genres = list(resolve_genres(tokenize_genres(instance.genre)).values())
+    instance.genre_mask = mask_for(genres)
+    instance._indexed_genres = genres
+
+
+@receiver(post_save, sender=Movie)
+def link_movie_genres(sender, instance, **kwargs):
+    genres = getattr(instance, '_indexed_genres', None)
+    if genres is not None:
+        instance.genres.set(genres)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def movie_changed(sender, instance, **kwargs):
+    """Any catalog change makes every stored recommendation list stale."""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved_stats(sender, instance, created, **kwargs):
+    # titles in the top-5 lists may have changed
+    update_system_stats(movies=1 if created else 0, refresh_top=True)
+
+
+@receiver(post_delete, sender=Movie)
+def movie_deleted_stats(sender, instance, **kwargs):
+    update_system_stats(movies=-1, refresh_top=True)
+
+
+@receiver(post_save, sender=AppUser)
+def user_saved_stats(sender, instance, created, **kwargs):
+    if created:
+        update_system_stats(users=1)
+
+
+@receiver(post_delete, sender=AppUser)
+def user_deleted_stats(sender, instance, **kwargs):
+    update_system_stats(users=-1)
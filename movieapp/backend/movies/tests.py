@@ -3,7 +3,39 @@ from django.contrib.auth.hashers import make_password
 from rest_framework.test import APIClient
 from django.utils import timezone
 from datetime import timedelta
-from .models import AppUser, Movie, Rating, Recommendation
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import tempfile
+from collections import defaultdict
+from io import StringIO
+from unittest import mock
+
+import numpy as np
+
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .aggregates import (
+    catch_up_system_stats, leaderboard, rebuild_movie_counters, rebuild_movie_rating_stats, rebuild_user_pair_stats,
+)
+from .factors import get_factor_model
+from .genres import tokenize_genres
+from .jobs import claim_jobs, enqueue_recommendation_refresh, process_pending_jobs, run_job
+from . import autocomplete, events, exports, trigrams
+from .trigrams import TrigramIndex
+from .models import (
+    AppUser, ExternalId, Genre, Movie, MovieNeighbor, MovieRatingStats, Rating, Recommendation,
+    RatingEvent, RatingEventConsumer, RecommendationJob, RecommendationState, SystemStats, UserPairStats,
+)
+from .recommender import (
+    DatabaseSource, RatingMatrix, _calculate_genre_preferences, _predict_collaborative_scores,
+    _predict_content_scores, _predict_item_neighbor_scores, generate_recommendations,
+)
 SQLITE_DB = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": ":memory:"}}
 
 
@@ -353,6 +385,21 @@ class ItemRatingTests(TestCase):
         # Duplicate check
         self.assertEqual(self.client.post(url, {'rating': 4}).status_code, 400)
 
+    def test_only_the_duplicate_rating_violation_is_a_400(self):
+        url = f'/api/ratings/{self.m1.movie_id}/'
+        self._login(self.user)
+        Rating.objects.create(user=self.other, movie=self.m1, score=2)
+
+        pair_clash = IntegrityError('UNIQUE constraint failed: user_pair_stats.user_a_id, user_pair_stats.user_b_id')
+        with mock.patch('movies.signals.apply_rating_change', side_effect=pair_clash):
+            with self.assertRaises(IntegrityError):
+                self.client.post(url, {'rating': 5})
+
+        Rating.objects.create(user=self.user, movie=self.m1, score=3)
+        # the duplicate slips past the exists() check, as under a race
+        with mock.patch('django.db.models.query.QuerySet.exists', side_effect=[True, False]):
+            self.assertEqual(self.client.post(url, {'rating': 4}).status_code, 400)
+
     def test_edit_delete_permissions_and_logic(self):
         rating = Rating.objects.create(user=self.user, movie=self.m1, score=3)
         url_edit = f'/api/ratings/{rating.rating_id}/edit/'
@@ -540,4 +587,1680 @@ class SystemAdministrationTests(TestCase):
         self.assertEqual(data['total_ratings'], 2)
         
         self.assertEqual(data['top_movies_highest_avg'][0]['title'], self.m1.title)
-        self.assertEqual(data['top_movies_highest_avg'][0]['avg_rating'], 5.0)
\ No newline at end of file
+        self.assertEqual(data['top_movies_highest_avg'][0]['avg_rating'], 5.0)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class RecommenderEngineTests(TestCase):
+    """Sparse matrix engine must reproduce the original loop-based filter"""
+
+    @staticmethod
+    def _reference_scores(rows, user_ratings_map):
+        # Original nested-loop implementation, kept here as the oracle
+        ratings_by_user = defaultdict(list)
+        for user_id, movie_id, score in rows:
+            ratings_by_user[user_id].append((movie_id, score))
+
+        similarities = {}
+        for other_id, ratings in ratings_by_user.items():
+            diffs = [abs(s - user_ratings_map[m]) for m, s in ratings if m in user_ratings_map]
+            if diffs:
+                similarities[other_id] = 1 / (1 + sum(diffs) / len(diffs))
+
+        totals = defaultdict(lambda: [0.0, 0.0])
+        for other_id, ratings in ratings_by_user.items():
+            sim = similarities.get(other_id)
+            if not sim:
+                continue
+            for m, s in ratings:
+                if m not in user_ratings_map:
+                    totals[m][0] += sim * s
+                    totals[m][1] += sim
+        return {m: t / w for m, (t, w) in totals.items() if w > 0}
+
+    def test_matches_reference_implementation(self):
+        rng = random.Random(7)
+        rows = [
+            (u, m, float(rng.randint(1, 5)))
+            for u in range(1, 30)
+            for m in rng.sample(range(1, 40), rng.randint(0, 12))
+        ]
+        target = {m: float(rng.randint(1, 5)) for m in rng.sample(range(1, 40), 6)}
+
+        expected = self._reference_scores(rows, target)
+        actual = RatingMatrix.from_rows(rows).collaborative_scores(target)
+
+        self.assertEqual(set(actual), set(expected))
+        for movie_id, score in expected.items():
+            self.assertAlmostEqual(actual[movie_id], score, places=9)
+
+    def test_empty_matrix(self):
+        self.assertEqual(RatingMatrix.from_rows([]).collaborative_scores({1: 5.0}), {})
+
+
+@override_settings(DATABASES=SQLITE_DB, RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS=0)
+class RecommendationQueueTests(TestCase):
+    """Rating writes enqueue a refresh job; the worker rebuilds the list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="q", email="q@e.com", password="p")
+        cls.other = AppUser.objects.create(username="o", email="o@e.com", password="p")
+        cls.m1 = Movie.objects.create(title="M1", genre="Drama", description="D")
+        cls.m2 = Movie.objects.create(title="M2", genre="Drama", description="D")
+        Rating.objects.create(user=cls.other, movie=cls.m2, score=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        s = self.client.session
+        s['user_id'] = self.user.user_id
+        s.save()
+
+    def test_write_enqueues_and_worker_refreshes(self):
+        stale = Recommendation.objects.create(user=self.user, movie=self.m1, predicted_score=1.0)
+
+        self.assertEqual(self.client.post(f'/api/ratings/{self.m1.movie_id}/', {'rating': 4}).status_code, 201)
+        self.assertEqual(RecommendationJob.objects.filter(user=self.user, status='pending').count(), 1)
+
+        # Second write coalesces into the same pending job
+        rating = Rating.objects.get(user=self.user, movie=self.m1)
+        self.client.put(f'/api/ratings/{rating.rating_id}/edit/', {'rating': 5})
+        self.assertEqual(RecommendationJob.objects.filter(user=self.user).count(), 1)
+
+        # Until the worker runs, the last good list is still served
+        data = self.client.get('/api/recommendations/mine/').json()
+        self.assertEqual([r['rec_id'] for r in data['recommendations']], [stale.rec_id])
+
+        call_command('process_recommendation_jobs', '--once', stdout=StringIO())
+        self.assertFalse(RecommendationJob.objects.exists())
+        recs = Recommendation.objects.filter(user=self.user)
+        self.assertFalse(recs.filter(rec_id=stale.rec_id).exists())
+        self.assertIn(self.m2.movie_id, recs.values_list('movie_id', flat=True))
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class UserPairStatsTests(TestCase):
+    """Pair table is kept in sync incrementally and matches a full rebuild"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            AppUser.objects.create(username=f"p{i}", email=f"p{i}@e.com", password="p")
+            for i in range(4)
+        ]
+        cls.movies = [
+            Movie.objects.create(title=f"P{i}", genre="G", description="D")
+            for i in range(5)
+        ]
+
+    def _snapshot(self):
+        return {
+            (p.user_a_id, p.user_b_id): (round(p.sum_abs_diff, 9), p.overlap_count)
+            for p in UserPairStats.objects.all()
+        }
+
+    def test_incremental_updates_match_rebuild(self):
+        u, m = self.users, self.movies
+        Rating.objects.create(user=u[0], movie=m[0], score=5)
+        Rating.objects.create(user=u[1], movie=m[0], score=2)
+        Rating.objects.create(user=u[2], movie=m[0], score=4)
+        r = Rating.objects.create(user=u[0], movie=m[1], score=1)
+        Rating.objects.create(user=u[1], movie=m[1], score=3)
+        Rating.objects.create(user=u[3], movie=m[2], score=3)
+
+        r.score = 4
+        r.save()
+        Rating.objects.filter(user=u[2], movie=m[0]).delete()
+
+        incremental = self._snapshot()
+        self.assertEqual(incremental[(u[0].user_id, u[1].user_id)], (4.0, 2))
+        self.assertNotIn((u[0].user_id, u[2].user_id), incremental)
+
+        rebuild_user_pair_stats()
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_movie_delete_matches_rebuild(self):
+        u, m = self.users, self.movies
+        for user, movie, score in [(0, 0, 5), (1, 0, 2), (2, 0, 4), (0, 1, 1), (1, 1, 3)]:
+            Rating.objects.create(user=u[user], movie=m[movie], score=score)
+
+        m[0].delete()
+
+        incremental = self._snapshot()
+        self.assertEqual(incremental[(u[0].user_id, u[1].user_id)], (2.0, 1))
+        self.assertNotIn((u[0].user_id, u[2].user_id), incremental)
+        rebuild_user_pair_stats()
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_pair_created_concurrently_is_added_to(self):
+        u, m = self.users, self.movies
+        Rating.objects.create(user=u[0], movie=m[0], score=5)
+        Rating.objects.create(user=u[1], movie=m[0], score=2)
+        Rating.objects.create(user=u[0], movie=m[1], score=1)
+        # another writer committed the pair after this one read it
+        with mock.patch.object(UserPairStats.objects, 'select_for_update',
+                               return_value=UserPairStats.objects.none()):
+            Rating.objects.create(user=u[1], movie=m[1], score=3)
+
+        self.assertEqual(self._snapshot()[(u[0].user_id, u[1].user_id)], (5.0, 2))
+        rebuild_user_pair_stats()
+        self.assertEqual(self._snapshot()[(u[0].user_id, u[1].user_id)], (5.0, 2))
+
+    def test_movie_row_locked_before_co_raters_are_read(self):
+        u, m = self.users, self.movies
+        Rating.objects.create(user=u[0], movie=m[0], score=5)
+        with CaptureQueriesContext(connection) as ctx:
+            Rating.objects.create(user=u[1], movie=m[0], score=2)
+        sql = [q['sql'] for q in ctx.captured_queries]
+        movie_update = next(i for i, q in enumerate(sql) if q.startswith('UPDATE "movie"'))
+        co_raters = next(i for i, q in enumerate(sql) if q.startswith('SELECT') and 'FROM "rating"' in q
+                         and 'NOT ("rating"."appuser_user_id"' in q)
+        self.assertLess(movie_update, co_raters)
+
+    def test_collaborative_scores_match_full_scan(self):
+        u, m = self.users, self.movies
+        for user, movie, score in [(0, 0, 5), (0, 1, 2), (1, 0, 4), (1, 2, 5),
+                                   (2, 1, 2), (2, 3, 1), (3, 4, 4)]:
+            Rating.objects.create(user=u[user], movie=m[movie], score=score)
+
+        target_map = dict(Rating.objects.filter(user=u[0]).values_list('movie_id', 'score'))
+        expected = RatingMatrix.from_db(exclude_user_id=u[0].user_id).collaborative_scores(target_map)
+        self.assertEqual(_predict_collaborative_scores(u[0].user_id, target_map), expected)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class ItemNeighborTests(TestCase):
+    """Offline item-item neighbour table and the 'item' recommender mode"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            AppUser.objects.create(username=f"n{i}", email=f"n{i}@e.com", password="p")
+            for i in range(3)
+        ]
+        cls.m1 = Movie.objects.create(title="Alien", genre="Horror", description="D")
+        cls.m2 = Movie.objects.create(title="Aliens", genre="Action", description="D")
+        cls.m3 = Movie.objects.create(title="Notting Hill", genre="Romance", description="D")
+        for user, movie, score in [(0, cls.m1, 5), (0, cls.m2, 5), (1, cls.m1, 4),
+                                   (1, cls.m2, 4), (2, cls.m3, 5), (2, cls.m2, 1)]:
+            Rating.objects.create(user=cls.users[user], movie=movie, score=score)
+
+    def _neighbors(self):
+        return sorted(
+            (n.movie_id, n.neighbor_id, round(n.similarity, 9))
+            for n in MovieNeighbor.objects.all()
+        )
+
+    def test_parallel_build_matches_serial(self):
+        call_command('build_item_neighbors', '--workers', '1', stdout=StringIO())
+        serial = self._neighbors()
+        call_command('build_item_neighbors', '--workers', '2', '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual(self._neighbors(), serial)
+
+        top = MovieNeighbor.objects.filter(movie=self.m1).order_by('-similarity').first()
+        self.assertEqual(top.neighbor_id, self.m2.movie_id)
+        self.assertAlmostEqual(top.similarity, 41 / (41 ** 0.5 * 42 ** 0.5))
+        self.assertFalse(MovieNeighbor.objects.filter(movie=self.m1, neighbor=self.m3).exists())
+
+    @override_settings(RECOMMENDER_MODE='item')
+    def test_item_mode_recommendations(self):
+        call_command('build_item_neighbors', '--workers', '1', stdout=StringIO())
+        viewer = AppUser.objects.create(username="v", email="v@e.com", password="p")
+        Rating.objects.create(user=viewer, movie=self.m1, score=5)
+
+        generate_recommendations(viewer)
+        recs = list(Recommendation.objects.filter(user=viewer).order_by('-predicted_score'))
+        self.assertEqual(recs[0].movie_id, self.m2.movie_id)
+        self.assertEqual(recs[0].predicted_score, 5.0)
+
+    def test_item_mode_without_neighbors_falls_back(self):
+        viewer = AppUser.objects.create(username="v", email="v@e.com", password="p")
+        Rating.objects.create(user=viewer, movie=self.m1, score=5)
+        self.assertIsNone(_predict_item_neighbor_scores({self.m1.movie_id: 5.0}))
+
+        def recommended():
+            generate_recommendations(viewer)
+            return list(Recommendation.objects.filter(user=viewer)
+                        .order_by('-predicted_score', 'movie_id').values_list('movie_id', 'predicted_score'))
+
+        with override_settings(RECOMMENDER_MODE='hybrid'):
+            user_based = recommended()
+        with override_settings(RECOMMENDER_MODE='item'):
+            self.assertEqual(recommended(), user_based)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class FactorModelTests(TestCase):
+    """Offline ALS training and memory-mapped scoring ('mf' mode)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            AppUser.objects.create(username=f"f{i}", email=f"f{i}@e.com", password="p")
+            for i in range(4)
+        ]
+        cls.movies = [
+            Movie.objects.create(title=f"F{i}", genre=f"G{i}", description="D")
+            for i in range(4)
+        ]
+        # Users 0/1 like movies 0-2, users 2/3 only like movie 3
+        for user, movie, score in [(0, 0, 5), (0, 1, 5), (1, 0, 5), (1, 1, 5), (1, 2, 5),
+                                   (2, 0, 1), (2, 1, 1), (2, 3, 5), (3, 0, 1), (3, 2, 1), (3, 3, 5)]:
+            Rating.objects.create(user=cls.users[user], movie=cls.movies[movie], score=score)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+    def test_train_and_score_from_memmap(self):
+        path = os.path.join(self.tmp, 'factors')
+        with override_settings(RECOMMENDER_FACTORS_PATH=path, RECOMMENDER_MODE='mf'):
+            call_command('train_factors', '--factors', '3', '--iterations', '15', stdout=StringIO())
+            model = get_factor_model()
+            self.assertIsInstance(model.movie_factors, np.memmap)
+            self.assertIs(get_factor_model(), model)  # cached per process
+
+            scores = model.score_unseen(self.users[0].user_id, {self.movies[0].movie_id})
+            self.assertNotIn(self.movies[0].movie_id, scores)
+            self.assertGreater(scores[self.movies[2].movie_id], scores[self.movies[3].movie_id])
+            as_dict = dict(scores.items())
+            self.assertEqual(len(as_dict), 3)
+            self.assertEqual(scores.top(2), sorted(as_dict, key=lambda m: (-as_dict[m], m))[:2])
+            self.assertEqual(len(scores.top(10)), 3)
+            self.assertIsNone(scores.get(self.movies[0].movie_id))
+
+            generate_recommendations(self.users[0])
+            top = Recommendation.objects.filter(user=self.users[0]).order_by('-predicted_score').first()
+            self.assertEqual(top.movie_id, self.movies[2].movie_id)
+
+    def test_missing_artifact_falls_back(self):
+        with override_settings(RECOMMENDER_FACTORS_PATH=os.path.join(self.tmp, 'none'),
+                               RECOMMENDER_MODE='mf'):
+            self.assertIsNone(get_factor_model())
+            self.assertTrue(generate_recommendations(self.users[0]))
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class CandidateGenerationTests(TestCase):
+    """Phase 1 only scores a bounded candidate pool"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="c", email="c@e.com", password="p")
+        cls.critic = AppUser.objects.create(username="k", email="k@e.com", password="p")
+        cls.seen = Movie.objects.create(title="Seen", genre="Western", description="D")
+        Rating.objects.create(user=cls.user, movie=cls.seen, score=5)
+        cls.westerns = [
+            Movie.objects.create(title=f"W{i}", genre="Western", description="D" * 500)
+            for i in range(6)
+        ]
+        # Critic rates two westerns highly, so they top the genre list
+        Rating.objects.create(user=cls.critic, movie=cls.westerns[4], score=5)
+        Rating.objects.create(user=cls.critic, movie=cls.westerns[5], score=4)
+
+    def test_genre_pool_is_bounded(self):
+        with mock.patch('movies.recommender.CANDIDATES_PER_GENRE', 2):
+            generate_recommendations(self.user)
+
+        personalised = Recommendation.objects.filter(user=self.user, predicted_score=5.0)
+        self.assertEqual(
+            set(personalised.values_list('movie_id', flat=True)),
+            {self.westerns[4].movie_id, self.westerns[5].movie_id},
+        )
+
+    def test_genre_candidates_walk_the_leaderboard_index(self):
+        bit = Genre.objects.get(name__iexact="western").bit
+        with CaptureQueriesContext(connection) as ctx:
+            ids = DatabaseSource(self.user.user_id).genre_candidates([bit], {self.seen.movie_id})
+        self.assertEqual(ids[:2], [self.westerns[4].movie_id, self.westerns[5].movie_id])
+        self.assertEqual(len(ids), 6)
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + ctx.captured_queries[0]['sql'])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('leaderboard_avg_idx', plan)
+        self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_query_count_does_not_grow_with_catalog(self):
+        for i in range(15):
+            Movie.objects.create(title=f"X{i}", genre="Western", description="D")
+        with CaptureQueriesContext(connection) as small:
+            generate_recommendations(self.user)
+        for i in range(15, 60):
+            Movie.objects.create(title=f"X{i}", genre="Western", description="D")
+        with CaptureQueriesContext(connection) as large:
+            generate_recommendations(self.user)
+        self.assertEqual(len(small), len(large))
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class RebuildRecommendationsTests(TestCase):
+    """Batch rebuild from an in-memory snapshot matches the per-user path"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            AppUser.objects.create(username=f"b{i}", email=f"b{i}@e.com", password="p")
+            for i in range(5)
+        ]
+        genres = ["Drama", "Comedy", "Drama", "Horror", "Comedy", "Drama", "Sci-Fi"]
+        cls.movies = [
+            Movie.objects.create(title=f"B{i}", genre=g, description="D")
+            for i, g in enumerate(genres)
+        ]
+        for user, movie, score in [(0, 0, 5), (0, 1, 2), (1, 0, 4), (1, 2, 5), (1, 3, 1),
+                                   (2, 1, 3), (2, 4, 4), (3, 5, 5), (3, 0, 2)]:
+            Rating.objects.create(user=cls.users[user], movie=cls.movies[movie], score=score)
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.checkpoint = os.path.join(self.tmp, 'ckpt.json')
+
+    def _lists(self):
+        lists = defaultdict(set)
+        for user_id, movie_id, score in Recommendation.objects.values_list('user_id', 'movie_id', 'predicted_score'):
+            lists[user_id].add((movie_id, score))
+        return dict(lists)
+
+    def test_batch_matches_per_user_generation(self):
+        for user in self.users:
+            generate_recommendations(user)
+        expected = self._lists()
+        Recommendation.objects.all().delete()
+
+        out = StringIO()
+        call_command('rebuild_recommendations', '--workers', '1', '--shard-size', '2',
+                     '--chunk-size', '1', '--checkpoint', self.checkpoint, '--force', stdout=out)
+
+        self.assertEqual(self._lists(), expected)
+        self.assertIn('users/s', out.getvalue())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resume_skips_checkpointed_shards(self):
+        first, second = self.users[0].user_id, self.users[1].user_id
+        with open(self.checkpoint, 'w') as fh:
+            json.dump({'done': [[first, second]]}, fh)
+
+        call_command('rebuild_recommendations', '--workers', '1', '--resume',
+                     '--checkpoint', self.checkpoint, stdout=StringIO())
+
+        rebuilt = set(Recommendation.objects.values_list('user_id', flat=True))
+        self.assertEqual(rebuilt, {u.user_id for u in self.users[2:]})
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class GenreIndexTests(TestCase):
+    """Multi-genre tokens, bitsets and vectorised content scores"""
+
+    def test_movie_saves_maintain_vocabulary_and_mask(self):
+        movie = Movie.objects.create(title="T", genre="Action, Comedy", description="D")
+        action, comedy = Genre.objects.get(name="action"), Genre.objects.get(name="comedy")
+        self.assertEqual(movie.genre_mask, (1 << action.bit) | (1 << comedy.bit))
+        self.assertEqual(set(movie.genres.values_list('name', flat=True)), {"action", "comedy"})
+
+        movie.genre = "comedy | Drama"
+        movie.save()
+        movie.refresh_from_db()
+        self.assertEqual(set(movie.genres.values_list('name', flat=True)), {"comedy", "drama"})
+        self.assertFalse(movie.genre_mask & (1 << action.bit))
+
+        self.assertEqual(tokenize_genres(" Sci-Fi/ sci-fi ;Horror"), ["sci-fi", "horror"])
+
+    def test_multi_genre_movies_match_single_genre_profile(self):
+        user = AppUser.objects.create(username="g", email="g@e.com", password="p")
+        seen = Movie.objects.create(title="Seen", genre="Action", description="D")
+        combo = Movie.objects.create(title="Combo", genre="Action, Comedy", description="D")
+        Rating.objects.create(user=user, movie=seen, score=4)
+
+        profile = _calculate_genre_preferences(DatabaseSource(user.user_id).user_ratings())
+        scores = _predict_content_scores([(combo.movie_id, combo.genre_mask)], profile)
+        self.assertEqual(scores, {combo.movie_id: 4.0})
+
+        generate_recommendations(user)
+        rec = Recommendation.objects.get(user=user, movie=combo)
+        self.assertEqual(rec.predicted_score, 4.0)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class RecommendationFreshnessTests(TestCase):
+    """Regeneration is skipped while ratings, catalog and algorithm are unchanged"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="f", email="f@e.com", password="p")
+        cls.other = AppUser.objects.create(username="f2", email="f2@e.com", password="p")
+        cls.movies = [
+            Movie.objects.create(title=f"F{i}", genre="Drama", description="D") for i in range(3)
+        ]
+        Rating.objects.create(user=cls.user, movie=cls.movies[0], score=4)
+        Rating.objects.create(user=cls.other, movie=cls.movies[1], score=5)
+
+    def test_fresh_list_is_not_recomputed(self):
+        self.assertTrue(generate_recommendations(self.user))
+        state = RecommendationState.objects.get(user=self.user)
+
+        with mock.patch('movies.recommender.compute_recommendations') as compute:
+            self.assertFalse(generate_recommendations(self.user))
+        compute.assert_not_called()
+        self.assertEqual(RecommendationState.objects.get(user=self.user).generated_at, state.generated_at)
+
+    def test_rating_catalog_and_algorithm_changes_make_list_stale(self):
+        generate_recommendations(self.user)
+
+        Rating.objects.create(user=self.user, movie=self.movies[1], score=2)
+        self.assertTrue(generate_recommendations(self.user))
+
+        # Another user's rating does not touch this user's watermark
+        Rating.objects.create(user=self.other, movie=self.movies[2], score=3)
+        self.assertFalse(generate_recommendations(self.user))
+
+        Movie.objects.create(title="New", genre="Drama", description="D")
+        self.assertTrue(generate_recommendations(self.user))
+
+        with mock.patch('movies.freshness.ALGORITHM_VERSION', 'next'):
+            self.assertTrue(generate_recommendations(self.user))
+
+    @override_settings(RECOMMENDER_MODE='item')
+    def test_neighbor_rebuild_makes_list_stale(self):
+        call_command('build_item_neighbors', '--workers', '1', stdout=StringIO())
+        generate_recommendations(self.user)
+        self.assertFalse(generate_recommendations(self.user))
+
+        call_command('build_item_neighbors', '--workers', '1', stdout=StringIO())
+        self.assertTrue(generate_recommendations(self.user))
+
+    def test_factor_retrain_makes_list_stale(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(RECOMMENDER_FACTORS_PATH=os.path.join(tmp, 'factors'), RECOMMENDER_MODE='mf'):
+            call_command('train_factors', '--factors', '2', '--iterations', '2', stdout=StringIO())
+            generate_recommendations(self.user)
+            self.assertFalse(generate_recommendations(self.user))
+
+            call_command('train_factors', '--factors', '2', '--iterations', '2', stdout=StringIO())
+            self.assertTrue(generate_recommendations(self.user))
+
+    def test_api_reports_staleness(self):
+        client = APIClient()
+        s = client.session
+        s['user_id'] = self.user.user_id
+        s.save()
+
+        freshness = client.get('/api/recommendations/mine/').json()['freshness']
+        self.assertFalse(freshness['is_stale'])
+        self.assertIsNotNone(freshness['generated_at'])
+
+        Rating.objects.filter(user=self.user).first().delete()
+        freshness = client.get('/api/recommendations/mine/').json()['freshness']
+        self.assertTrue(freshness['is_stale'])
+
+    def test_batch_rebuild_skips_fresh_users(self):
+        generate_recommendations(self.user)
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as tmp:
+            call_command('rebuild_recommendations', '--workers', '1',
+                         '--checkpoint', os.path.join(tmp, 'ckpt.json'), stdout=out)
+        self.assertIn('for 1 users', out.getvalue())
+        self.assertTrue(RecommendationState.objects.filter(user=self.other).exists())
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class LeaderboardTests(TestCase):
+    """Materialised movie leaderboard feeding the fallback phases and statistics"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            AppUser.objects.create(username=f"l{i}", email=f"l{i}@e.com", password="p")
+            for i in range(3)
+        ]
+        cls.one_vote, cls.solid, cls.other = [
+            Movie.objects.create(title=t, genre="Drama", description="D") for t in ("One", "Solid", "Other")
+        ]
+        Rating.objects.create(user=cls.users[0], movie=cls.one_vote, score=5)
+        for user, score in zip(cls.users, (5, 4, 4)):
+            Rating.objects.create(user=user, movie=cls.solid, score=score)
+
+    def _snapshot(self):
+        return set(MovieRatingStats.objects.values_list('movie_id', 'rating_count', 'rating_sum', 'average'))
+
+    def test_incremental_updates_match_rebuild(self):
+        rating = Rating.objects.get(user=self.users[1], movie=self.solid)
+        rating.score = 2
+        rating.save()
+        Rating.objects.create(user=self.users[1], movie=self.other, score=3)
+        Rating.objects.get(user=self.users[0], movie=self.one_vote).delete()
+
+        incremental = self._snapshot()
+        self.assertFalse(MovieRatingStats.objects.filter(movie=self.one_vote).exists())
+        rebuild_movie_rating_stats()
+        self.assertEqual(incremental, self._snapshot())
+
+    def test_row_created_concurrently_is_added_to(self):
+        Rating.objects.create(user=self.users[0], movie=self.other, score=2)
+        # another writer created the row after this one looked for it
+        with mock.patch.object(MovieRatingStats.objects, 'select_for_update',
+                               return_value=MovieRatingStats.objects.none()):
+            Rating.objects.create(user=self.users[1], movie=self.other, score=5)
+
+        self.assertEqual(
+            MovieRatingStats.objects.values_list('rating_count', 'rating_sum', 'average').get(movie=self.other),
+            (2, 7.0, 3.5),
+        )
+
+    def test_min_ratings_keeps_single_vote_off_the_chart(self):
+        self.assertEqual(leaderboard().first().movie_id, self.one_vote.movie_id)
+
+        with override_settings(LEADERBOARD_MIN_RATINGS=2):
+            ids = list(leaderboard().values_list('movie_id', flat=True))
+            self.assertEqual(ids, [self.solid.movie_id])
+            self.assertEqual(
+                DatabaseSource(self.users[2].user_id).top_rated(set(), 10),
+                [(self.solid.movie_id, 13 / 3)],
+            )
+
+            admin = AppUser.objects.create(username="adm", email="adm@e.com", password="p", is_admin=True)
+            client = APIClient()
+            s = client.session
+            s['user_id'] = admin.user_id
+            s.save()
+            data = client.get('/api/admin/statistics/').json()
+            self.assertEqual([m['movie_id'] for m in data['top_movies_highest_avg']], [self.solid.movie_id])
+            self.assertEqual(data['top_movies_most_ratings'][0]['num_ratings'], 3)
+
+    def test_cold_start_does_not_aggregate_rating_table(self):
+        newcomer = AppUser.objects.create(username="new", email="new@e.com", password="p")
+        with CaptureQueriesContext(connection) as ctx:
+            generate_recommendations(newcomer)
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'AVG(' in q['sql'].upper()])
+        self.assertEqual(
+            Recommendation.objects.get(user=newcomer, movie=self.solid).predicted_score, round(13 / 3, 2)
+        )
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class MovieRatingCountersTests(TestCase):
+    """Denormalised Movie.rating_count / rating_sum"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            AppUser.objects.create(username=f"c{i}", email=f"c{i}@e.com", password="p")
+            for i in range(3)
+        ]
+        cls.movie = Movie.objects.create(title="C", genre="Drama", description="D")
+
+    def test_counters_follow_create_edit_delete(self):
+        ratings = [Rating.objects.create(user=u, movie=self.movie, score=s) for u, s in zip(self.users, (4, 2, 5))]
+        ratings[1].score = 3
+        ratings[1].save()
+        ratings[2].delete()
+
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.rating_count, self.movie.rating_sum), (2, 7.0))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.movie.average_rating, 3.5)
+
+    def test_admin_edit_does_not_clobber_counters(self):
+        admin = AppUser.objects.create(username="ca", email="ca@e.com", password="p", is_admin=True)
+        client = APIClient()
+        s = client.session
+        s['user_id'] = admin.user_id
+        s.save()
+
+        stale = Movie.objects.get(pk=self.movie.pk)
+        Rating.objects.create(user=self.users[0], movie=self.movie, score=5)
+        # The view loaded the row before the rating landed
+        with mock.patch.object(Movie.objects, 'get', return_value=stale):
+            client.put(f'/api/admin/movies/{self.movie.movie_id}/edit/', {'title': 'New', 'genre': 'G', 'description': 'D'})
+
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.title, self.movie.rating_count), ('New', 1))
+
+    def test_movie_list_queries_do_not_grow_with_catalog(self):
+        for i in range(5):
+            movie = Movie.objects.create(title=f"L{i}", genre="Drama", description="D")
+            Rating.objects.create(user=self.users[0], movie=movie, score=i % 5 + 1)
+
+        with CaptureQueriesContext(connection) as small:
+            self.client.get('/api/movies/')
+        for i in range(10):
+            Movie.objects.create(title=f"X{i}", genre="Drama", description="D")
+        with CaptureQueriesContext(connection) as large:
+            data = self.client.get('/api/movies/').json()
+
+        self.assertEqual(len(small), len(large))
+        rated = next(m for m in data['movies'] if m['title'] == 'L3')
+        self.assertEqual((rated['average_rating'], rated['rating_count']), (4.0, 1))
+
+    def test_check_command_reports_and_fixes_drift(self):
+        Rating.objects.create(user=self.users[0], movie=self.movie, score=4)
+        call_command('check_movie_counters', stdout=StringIO())
+
+        Movie.objects.filter(pk=self.movie.pk).update(rating_count=7)
+        with self.assertRaises(CommandError):
+            call_command('check_movie_counters', stdout=StringIO())
+
+        call_command('check_movie_counters', '--fix', stdout=StringIO())
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.rating_count, self.movie.rating_sum), (1, 4.0))
+
+    def test_check_command_covers_the_leaderboard(self):
+        Rating.objects.create(user=self.users[0], movie=self.movie, score=4)
+        MovieRatingStats.objects.filter(movie=self.movie).update(average=1.0)
+        with self.assertRaises(CommandError):
+            call_command('check_movie_counters', stdout=StringIO())
+
+        MovieRatingStats.objects.filter(movie=self.movie).delete()
+        with self.assertRaises(CommandError):
+            call_command('check_movie_counters', stdout=StringIO())
+
+        call_command('check_movie_counters', '--fix', stdout=StringIO())
+        self.assertEqual(
+            MovieRatingStats.objects.values_list('rating_count', 'rating_sum', 'average').get(movie=self.movie),
+            (1, 4.0, 4.0),
+        )
+        call_command('check_movie_counters', stdout=StringIO())
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk the catalog in the same order as the full list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = AppUser.objects.create(username="k", email="k@e.com", password="p")
+        years = [2001, None, 1999, 2001, None, 2010, 1999, 2005, 2001]
+        for i, year in enumerate(years):
+            # repeated titles and years exercise the movie_id tie-break
+            movie = Movie.objects.create(title=f"T{i % 4}", genre="Drama", description="D", year=year)
+            if i % 3:
+                Rating.objects.create(user=user, movie=movie, score=(i % 3) + 2)
+
+    def _ids(self, data):
+        return [m['id'] for m in data['movies']]
+
+    def test_forward_and_backward_walks_match_full_order(self):
+        for sort in ('title', 'year', 'rating'):
+            expected = self._ids(self.client.get(f'/api/movies/?sort={sort}').json())
+
+            forward, pages, cursor = [], [], ''
+            while True:
+                data = self.client.get(f'/api/movies/?sort={sort}&limit=2&cursor={cursor}').json()
+                forward.extend(self._ids(data))
+                pages.append(data)
+                if not data['next_cursor']:
+                    break
+                cursor = data['next_cursor']
+            self.assertEqual(forward, expected, sort)
+            self.assertIsNone(pages[0]['prev_cursor'])
+
+            backward, cursor = [], pages[-1]['prev_cursor']
+            while cursor:
+                data = self.client.get(f'/api/movies/?sort={sort}&limit=2&cursor={cursor}').json()
+                backward = self._ids(data) + backward
+                cursor = data['prev_cursor']
+            self.assertEqual(backward + self._ids(pages[-1]), expected, sort)
+
+    def test_search_pages_and_bad_cursors(self):
+        data = self.client.get('/api/movies/search/?q=T1&sort=year&limit=1').json()
+        self.assertEqual(data['count'], 1)
+        self.assertTrue(data['next_cursor'])
+
+        self.assertEqual(self.client.get('/api/movies/?cursor=garbage').status_code, 400)
+        self.assertEqual(self.client.get('/api/movies/?limit=x').status_code, 400)
+        wrong_sort = self.client.get(f"/api/movies/?sort=title&cursor={data['next_cursor']}")
+        self.assertEqual(wrong_sort.status_code, 400)
+
+    def test_deep_pages_do_not_use_offset(self):
+        first = self.client.get('/api/movies/?limit=3').json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(f"/api/movies/?limit=3&cursor={first['next_cursor']}")
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries).upper()
+        self.assertNotIn('OFFSET', sql)
+
+    def test_rating_sort_keys_on_the_stored_average(self):
+        movie = Movie.objects.order_by('movie_id')[1]
+        rating = Rating.objects.get(movie=movie)
+        rating.score = 5
+        rating.save()
+        Rating.objects.create(user=AppUser.objects.create(username="k2", email="k2@e.com", password="p"),
+                              movie=movie, score=4.5)
+        stored = dict(Movie.objects.values_list('movie_id', 'avg_rating'))
+        self.assertEqual(stored[movie.movie_id], 4.75)
+        rebuild_movie_counters()
+        self.assertEqual(dict(Movie.objects.values_list('movie_id', 'avg_rating')), stored)
+
+        first = self.client.get('/api/movies/?sort=rating&limit=2').json()
+        self.assertEqual(first['movies'][0]['id'], movie.movie_id)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(f"/api/movies/?sort=rating&limit=2&cursor={first['next_cursor']}")
+        [page_sql] = [q['sql'].split(' FROM ', 1)[1] for q in ctx.captured_queries if 'ORDER BY' in q['sql']]
+        self.assertIn('ORDER BY "movie"."avg_rating" DESC, "movie"."movie_id" ASC', page_sql)
+        self.assertNotIn('rating_sum', page_sql)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class FullTextSearchTests(TestCase):
+    """q goes through the FTS5 index (tsvector + GIN on Postgres)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.space = Movie.objects.create(title='Space Odyssey', director='Kubrick', genre='Sci-Fi',
+                                         description='A voyage to Jupiter')
+        cls.voyage = Movie.objects.create(title='Voyage Home', director='Nimoy', genre='Sci-Fi',
+                                          description='Whales')
+        cls.drama = Movie.objects.create(title='Quiet Days', director='Someone', genre='Drama',
+                                         description='A space to breathe')
+
+    def _titles(self, query):
+        return [m['title'] for m in self.client.get(f'/api/movies/search/?q={query}').json()['movies']]
+
+    def test_matches_all_fields_with_prefixes(self):
+        self.assertEqual(self._titles('jupiter'), ['Space Odyssey'])
+        self.assertEqual(self._titles('kubr'), ['Space Odyssey'])
+        self.assertEqual(set(self._titles('sci')), {'Space Odyssey', 'Voyage Home'})
+        self.assertEqual(self._titles('voyage whales'), ['Voyage Home'])
+        self.assertEqual(self._titles('"OR NEAR('), [])
+
+    def test_title_hits_rank_above_description_hits(self):
+        self.assertEqual(self._titles('space'), ['Space Odyssey', 'Quiet Days'])
+        self.assertEqual(self._titles('voyage'), ['Voyage Home', 'Space Odyssey'])
+
+        data = self.client.get('/api/movies/search/?q=space&sort=title').json()
+        self.assertEqual([m['title'] for m in data['movies']], ['Quiet Days', 'Space Odyssey'])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.drama.title = 'Loud Nights'
+        self.drama.save()
+        self.assertEqual(self._titles('loud'), ['Loud Nights'])
+        self.assertEqual(self._titles('quiet'), [])
+
+        Movie.objects.filter(pk=self.drama.pk).update(rating_count=3)
+        self.voyage.delete()
+        self.assertEqual(self._titles('voyage'), ['Space Odyssey'])
+
+    def test_relevance_pages(self):
+        first = self.client.get('/api/movies/search/?q=space&limit=1').json()
+        second = self.client.get(f"/api/movies/search/?q=space&limit=1&cursor={first['next_cursor']}").json()
+        self.assertEqual(
+            [m['title'] for m in first['movies'] + second['movies']], ['Space Odyssey', 'Quiet Days']
+        )
+        self.assertIsNone(second['next_cursor'])
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class FuzzySearchTests(TestCase):
+    """?fuzzy=1 tolerates typos and partial titles via trigram similarity"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for title, director in [('Interstellar', 'Nolan'), ('Inception', 'Nolan'),
+                                ('The Matrix', 'Wachowski'), ('Amelie', 'Jeunet')]:
+            Movie.objects.create(title=title, director=director, genre='G', description='D')
+
+    def setUp(self):
+        # catalog versions restart with every test database, drop other classes' index
+        trigrams._cache.update(index=None, version=None)
+
+    def _titles(self, query):
+        data = self.client.get(f'/api/movies/search/?q={query}&fuzzy=1').json()
+        return [m['title'] for m in data['movies']]
+
+    def test_typos_and_substrings(self):
+        self.assertEqual(self._titles('intersteller'), ['Interstellar'])
+        self.assertEqual(self._titles('matrx'), ['The Matrix'])
+        self.assertEqual(self._titles('stell'), ['Interstellar'])
+        self.assertEqual(self._titles('wachowsky'), ['The Matrix'])
+        self.assertEqual(self._titles('zzz'), [])
+
+    def test_ranked_by_similarity(self):
+        self.assertEqual(self._titles('incept')[0], 'Inception')
+        index = TrigramIndex([(1, 'Inception', None), (2, 'Interception', None)])
+        scores = index.search('inception')
+        self.assertEqual(scores[1], 1.0)
+        self.assertLess(scores[2], 1.0)
+
+    def test_index_rebuilt_after_catalog_change(self):
+        self.assertEqual(self._titles('amelie'), ['Amelie'])
+        Movie.objects.filter(title='Amelie').update(title='Amelia')
+        # .update() bypasses signals, so the cached index is still served
+        self.assertEqual(self._titles('amelie'), ['Amelia'])
+
+        Movie.objects.create(title='Amelie Returns', genre='G', description='D')
+        self.assertEqual(self._titles('amelie returns'), ['Amelie Returns'])
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class SearchRatingInSqlTests(TestCase):
+    """rating_min and sort=rating run as one annotated query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [AppUser.objects.create(username=f"s{i}", email=f"s{i}@e.com", password="p") for i in range(3)]
+        rng = random.Random(7)
+        for i in range(12):
+            movie = Movie.objects.create(title=f"Film {i:02d}", genre="G", description="D",
+                                         year=rng.choice([None, 1990, 2000, 2010]))
+            for user in users[:rng.randint(0, 3)]:
+                Rating.objects.create(user=user, movie=movie, score=rng.choice([1, 2.5, 3, 4, 4.5, 5]))
+
+    def _reference(self, rating_min, sort_by):
+        # the previous Python implementation
+        movies = [m for m in Movie.objects.all() if m.average_rating >= rating_min]
+        if sort_by == 'year':
+            movies.sort(key=lambda m: m.year or 0, reverse=True)
+        elif sort_by == 'rating':
+            movies.sort(key=lambda m: m.average_rating, reverse=True)
+        else:
+            movies.sort(key=lambda m: m.title.lower())
+        return [m.movie_id for m in movies]
+
+    def test_results_match_python_filtering(self):
+        for rating_min in (0, 2.5, 3.5, 4.5):
+            for sort_by in ('title', 'year', 'rating'):
+                with self.subTest(rating_min=rating_min, sort=sort_by):
+                    data = self.client.get(f'/api/movies/search/?rating_min={rating_min}&sort={sort_by}').json()
+                    self.assertEqual([m['id'] for m in data['movies']], self._reference(rating_min, sort_by))
+
+    def test_query_count_is_constant_and_pages_work(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/movies/search/?rating_min=1&sort=rating').json()
+        self.assertEqual(len(ctx), 1)
+
+        paged, cursor = [], ''
+        while True:
+            page = self.client.get(f'/api/movies/search/?rating_min=1&sort=rating&limit=4&cursor={cursor}').json()
+            paged.extend(m['id'] for m in page['movies'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(paged, [m['id'] for m in data['movies']])
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class AutocompleteTests(TestCase):
+    """Prefix suggestions from the in-memory title index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [AppUser.objects.create(username=f"a{i}", email=f"a{i}@e.com", password="p") for i in range(3)]
+        cls.movies = {}
+        for title, raters in [('The Matrix', 1), ('Matrix Reloaded', 3), ('Amélie', 0),
+                              ('Inception', 2), ('Interstellar', 0)]:
+            movie = Movie.objects.create(title=title, genre='G', description='D')
+            for user in users[:raters]:
+                Rating.objects.create(user=user, movie=movie, score=4)
+            cls.movies[title] = movie
+
+    def setUp(self):
+        autocomplete._cache.update(index=None, version=None, built_at=0.0)
+
+    def _titles(self, prefix, **params):
+        query = '&'.join(f'{k}={v}' for k, v in params.items())
+        data = self.client.get(f'/api/movies/autocomplete/?prefix={prefix}&{query}').json()
+        return [r['title'] for r in data['results']]
+
+    def test_prefixes_rank_by_rating_count(self):
+        self.assertEqual(self._titles('matr'), ['Matrix Reloaded', 'The Matrix'])
+        self.assertEqual(self._titles('in'), ['Inception', 'Interstellar'])
+        self.assertEqual(self._titles('inte'), ['Interstellar'])
+        self.assertEqual(self._titles('ame'), ['Amélie'])
+        self.assertEqual(self._titles('m', limit=1), ['Matrix Reloaded'])
+        self.assertEqual(self._titles(''), [])
+
+    def test_admin_changes_rebuild_index(self):
+        self.assertEqual(self._titles('inter'), ['Interstellar'])
+        admin = AppUser.objects.create(username="aa", email="aa@e.com", password="p", is_admin=True)
+        client = APIClient()
+        s = client.session
+        s['user_id'] = admin.user_id
+        s.save()
+
+        client.post('/api/admin/movies/add/', {'title': 'Interview', 'genre': 'G', 'description': 'D'})
+        self.assertEqual(set(self._titles('inter')), {'Interstellar', 'Interview'})
+
+        client.delete(f"/api/admin/movies/{self.movies['Interstellar'].movie_id}/delete/")
+        self.assertEqual(self._titles('inter'), ['Interview'])
+
+    def test_lookup_needs_one_version_query(self):
+        self._titles('ma')
+        with CaptureQueriesContext(connection) as ctx:
+            self._titles('mat')
+        self.assertEqual(len(ctx), 1)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class SearchFacetsTests(TestCase):
+    """?facets=1 adds genre / decade / rating counts from one grouped query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = AppUser.objects.create(username="fa", email="fa@e.com", password="p")
+        for title, genre, year, score in [
+            ('Alpha', 'Action, Comedy', 1994, 5),
+            ('Beta', 'Action', 1999, 3.5),
+            ('Gamma', 'Drama', 2004, None),
+            ('Delta', 'Comedy', None, 1),
+        ]:
+            movie = Movie.objects.create(title=title, genre=genre, year=year, description='Space')
+            if score is not None:
+                Rating.objects.create(user=user, movie=movie, score=score)
+
+    def test_facet_counts(self):
+        data = self.client.get('/api/movies/search/?facets=1').json()
+        facets = data['facets']
+        self.assertEqual(facets['genres'], [
+            {'name': 'action', 'count': 2}, {'name': 'comedy', 'count': 2}, {'name': 'drama', 'count': 1},
+        ])
+        self.assertEqual(facets['decades'], [
+            {'decade': 1990, 'count': 2}, {'decade': 2000, 'count': 1}, {'decade': None, 'count': 1},
+        ])
+        self.assertEqual(facets['ratings'], [
+            {'bucket': '4-5', 'count': 1}, {'bucket': '3-4', 'count': 1},
+            {'bucket': '1-2', 'count': 1}, {'bucket': 'unrated', 'count': 1},
+        ])
+        self.assertNotIn('facets', self.client.get('/api/movies/search/').json())
+
+    def test_facets_follow_filters_and_pages(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/movies/search/?q=space&rating_min=3&facets=1&limit=1').json()
+        self.assertEqual(len(data['movies']), 1)
+        self.assertEqual(sum(g['count'] for g in data['facets']['decades']), 2)
+        self.assertEqual(data['facets']['genres'][0], {'name': 'action', 'count': 2})
+        # page + grouped facets + genre names
+        self.assertEqual(len(ctx), 3)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class RatingQueryPlanTests(TestCase):
+    """EXPLAIN every hot rating query; fail if one stops using its index"""
+
+    # name -> (queryset factory, index the plan must use; None = any index)
+    HOT_QUERIES = {
+        'create_rating duplicate check': (
+            lambda: Rating.objects.filter(user_id=1, movie_id=1), None),
+        'movie_detail user rating': (
+            lambda: Rating.objects.filter(user_id=1, movie_id=1).values_list('score', 'rating_id'), None),
+        'co-raters of a movie': (
+            lambda: Rating.objects.filter(movie_id=1).exclude(user_id=1).values_list('user_id', 'score'),
+            'rating_movie_score_idx'),
+        'movie scores': (
+            lambda: Rating.objects.filter(movie_id=1).values_list('score', flat=True), 'rating_movie_score_idx'),
+        'rating history': (
+            lambda: Rating.objects.filter(user_id=1).select_related('movie').order_by('-created_at'),
+            'rating_user_created_idx'),
+        'user ratings for recommender': (
+            lambda: Rating.objects.filter(user_id=1).values_list('movie_id', 'score', 'movie__genre_mask'),
+            'rating_user_created_idx'),
+    }
+
+    def test_hot_queries_use_indexes(self):
+        for name, (make_queryset, index) in self.HOT_QUERIES.items():
+            with self.subTest(query=name):
+                plan = make_queryset().explain()
+                rating_steps = [line for line in plan.splitlines() if ' rating ' in f'{line} ']
+                self.assertTrue(rating_steps, plan)
+                for line in rating_steps:
+                    self.assertNotIn('SCAN rating', line, plan)
+                    self.assertIn('INDEX', line, plan)
+                if index:
+                    self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_duplicate_rating_is_rejected(self):
+        user = AppUser.objects.create(username="qp", email="qp@e.com", password="p")
+        movie = Movie.objects.create(title="QP", genre="G", description="D")
+        Rating.objects.create(user=user, movie=movie, score=3)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Rating.objects.create(user=user, movie=movie, score=4)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class BulkRatingTests(TestCase):
+    """POST /api/ratings/bulk/ writes a whole watch history at once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="bk", email="bk@e.com", password="p")
+        cls.other = AppUser.objects.create(username="bo", email="bo@e.com", password="p")
+        cls.movies = [Movie.objects.create(title=f"B{i}", genre="Drama", description="D") for i in range(30)]
+        for movie in cls.movies[:10]:
+            Rating.objects.create(user=cls.other, movie=movie, score=3)
+        Rating.objects.create(user=cls.user, movie=cls.movies[0], score=2)
+        Rating.objects.create(user=cls.user, movie=cls.movies[1], score=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        s = self.client.session
+        s['user_id'] = self.user.user_id
+        s.save()
+
+    def _post(self, items):
+        return self.client.post('/api/ratings/bulk/', {'ratings': items}, format='json')
+
+    def test_existing_ratings_are_locked_inside_the_transaction(self):
+        depths = []
+        select_for_update = Rating.objects.select_for_update
+
+        def locked(*args, **kwargs):
+            depths.append(len(connection.atomic_blocks))
+            return select_for_update(*args, **kwargs)
+
+        outer = len(connection.atomic_blocks)  # the TestCase's own transaction
+        with mock.patch.object(Rating.objects, 'select_for_update', side_effect=locked):
+            resp = self._post([{'movie_id': self.movies[0].movie_id, 'rating': 4}])
+        self.assertEqual(resp.json()['updated'], 1)
+        self.assertEqual(len(depths), 1)
+        self.assertGreater(depths[0], outer)
+
+    def test_per_item_results_and_derived_data(self):
+        m = self.movies
+        resp = self._post([
+            {'movie_id': m[0].movie_id, 'rating': 4},       # updated
+            {'movie_id': m[1].movie_id, 'rating': 5},       # unchanged
+            {'movie_id': m[2].movie_id, 'rating': 1},       # created
+            {'movie_id': m[2].movie_id, 'rating': 3},       # duplicate
+            {'movie_id': 999999, 'rating': 3},              # unknown movie
+            {'movie_id': m[3].movie_id, 'rating': 9},       # out of range
+            {'movie_id': 'x', 'rating': 3},
+        ])
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([r['status'] for r in data['results']],
+                         ['updated', 'unchanged', 'created', 'error', 'error', 'error', 'error'])
+        self.assertEqual((data['created'], data['updated'], data['errors']), (1, 1, 4))
+        self.assertEqual(RecommendationJob.objects.filter(user=self.user).count(), 1)
+
+        # Derived tables match a full rebuild
+        pairs = set(UserPairStats.objects.values_list('user_a', 'user_b', 'sum_abs_diff', 'overlap_count'))
+        leaderboard_rows = set(MovieRatingStats.objects.values_list('movie_id', 'rating_count', 'rating_sum'))
+        rebuild_user_pair_stats()
+        rebuild_movie_rating_stats()
+        self.assertEqual(pairs, set(UserPairStats.objects.values_list('user_a', 'user_b', 'sum_abs_diff', 'overlap_count')))
+        self.assertEqual(leaderboard_rows, set(MovieRatingStats.objects.values_list('movie_id', 'rating_count', 'rating_sum')))
+        call_command('check_movie_counters', stdout=StringIO())
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def run(movies):
+            RecommendationJob.objects.all().delete()
+            with CaptureQueriesContext(connection) as ctx:
+                self._post([{'movie_id': mv.movie_id, 'rating': 4} for mv in movies])
+            return len(ctx)
+
+        # all co-rated by `other`, whose pair row with the user already exists
+        self.assertEqual(run(self.movies[2:4]), run(self.movies[4:10]))
+
+    def test_rejects_bad_payloads(self):
+        self.assertEqual(self._post([]).status_code, 400)
+        self.assertEqual(self.client.post('/api/ratings/bulk/', {'ratings': 'x'}, format='json').status_code, 400)
+        self.client.session.flush()
+        self.assertEqual(APIClient().post('/api/ratings/bulk/', {'ratings': []}, format='json').status_code, 401)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class RatingUpsertTests(TestCase):
+    """PUT /api/movies/<id>/my-rating/ writes the rating row exactly once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="up", email="up@e.com", password="p")
+        cls.other = AppUser.objects.create(username="uo", email="uo@e.com", password="p")
+        cls.movie = Movie.objects.create(title="U", genre="Drama", description="D")
+        Rating.objects.create(user=cls.other, movie=cls.movie, score=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        s = self.client.session
+        s['user_id'] = self.user.user_id
+        s.save()
+
+    def _put(self, score, movie_id=None):
+        return self.client.put(f'/api/movies/{movie_id or self.movie.movie_id}/my-rating/',
+                               {'rating': score}, format='json')
+
+    def test_insert_then_update(self):
+        resp = self._put(4)
+        self.assertEqual(resp.status_code, 201)
+        rating_id = resp.json()['rating']['rating_id']
+
+        resp = self._put(5)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['rating']['rating_id'], rating_id)
+        self.assertEqual(Rating.objects.get(user=self.user, movie=self.movie).score, 5)
+
+        self.movie.refresh_from_db()
+        self.assertEqual((self.movie.rating_count, self.movie.rating_sum), (2, 7.0))
+        pair = UserPairStats.objects.get()
+        self.assertEqual((pair.sum_abs_diff, pair.overlap_count), (3.0, 1))
+        self.assertEqual(MovieRatingStats.objects.get(movie=self.movie).rating_count, 2)
+        self.assertTrue(RecommendationJob.objects.filter(user=self.user).exists())
+
+    def test_one_write_to_rating_table(self):
+        for score in (3, 1):
+            with CaptureQueriesContext(connection) as ctx:
+                self._put(score)
+            writes = [
+                q['sql'] for q in ctx.captured_queries
+                if re.match(r'\s*(INSERT INTO|UPDATE|DELETE FROM)\s+"?rating"?\s', q['sql'], re.I)
+            ]
+            self.assertEqual(len(writes), 1, writes)
+            self.assertIn('ON CONFLICT', writes[0])
+
+    def test_every_write_path_locks_the_user(self):
+        other_movie = Movie.objects.create(title="U2", genre="Drama", description="D")
+        requests = {
+            'upsert': lambda: self._put(4),
+            'create': lambda: self.client.post(f'/api/ratings/{other_movie.movie_id}/', {'rating': 3}),
+            'edit': lambda: self.client.put(f'/api/ratings/{rating_id()}/edit/', {'rating': 5}),
+            'bulk': lambda: self.client.post('/api/ratings/bulk/', {'ratings': [
+                {'movie_id': other_movie.movie_id, 'rating': 1}]}, format='json'),
+            'delete': lambda: self.client.delete(f'/api/ratings/{rating_id()}/delete/'),
+        }
+
+        def rating_id():
+            return Rating.objects.get(user=self.user, movie=self.movie).rating_id
+
+        for name, send in requests.items():
+            with self.subTest(path=name):
+                with mock.patch.object(AppUser.objects, 'select_for_update',
+                                       wraps=AppUser.objects.select_for_update) as lock:
+                    self.assertLess(send().status_code, 300)
+                self.assertTrue(lock.called)
+
+    def test_validation(self):
+        self.assertEqual(self._put(7).status_code, 400)
+        self.assertEqual(self._put(3, movie_id=999999).status_code, 404)
+        self.assertFalse(Rating.objects.filter(user=self.user).exists())
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class RatingEventLogTests(TestCase):
+    """Every rating write appends a RatingEvent; consumers resume from their offset"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="ev", email="ev@e.com", password="p")
+        cls.m1 = Movie.objects.create(title="E1", genre="Drama", description="D")
+        cls.m2 = Movie.objects.create(title="E2", genre="Drama", description="D")
+
+    def setUp(self):
+        self.client = APIClient()
+        s = self.client.session
+        s['user_id'] = self.user.user_id
+        s.save()
+
+    def _write_history(self):
+        self.client.post(f'/api/ratings/{self.m1.movie_id}/', {'rating': 3})
+        rating = Rating.objects.get(user=self.user, movie=self.m1)
+        self.client.put(f'/api/ratings/{rating.rating_id}/edit/', {'rating': 5})
+        self.client.post(f'/api/ratings/{self.m2.movie_id}/', {'rating': 2})
+        self.client.delete(f'/api/ratings/{rating.rating_id}/delete/')
+
+    def test_create_update_delete_are_logged(self):
+        self._write_history()
+        self.assertEqual(
+            list(RatingEvent.objects.order_by('event_id').values_list('kind', 'movie_id', 'old_score', 'new_score')),
+            [
+                ('create', self.m1.movie_id, None, 3.0),
+                ('update', self.m1.movie_id, 3.0, 5.0),
+                ('create', self.m2.movie_id, None, 2.0),
+                ('delete', self.m1.movie_id, 5.0, None),
+            ],
+        )
+
+    def test_consumer_catches_up_from_its_offset(self):
+        counts = defaultdict(int)
+
+        def handler(batch):
+            for event in batch:
+                counts[event.movie_id] += (event.new_score is not None) - (event.old_score is not None)
+
+        self.client.post(f'/api/ratings/{self.m1.movie_id}/', {'rating': 3})
+        self.assertEqual(events.catch_up('counts', handler, batch_size=2), 1)
+        self._write_history()  # m1 already rated: the first POST is rejected
+        self.assertEqual(events.catch_up('counts', handler, batch_size=2), 3)
+        self.assertEqual(events.catch_up('counts', handler), 0)
+
+        self.assertEqual(dict(counts), {self.m1.movie_id: 0, self.m2.movie_id: 1})
+        self.assertEqual(events.consumer_position('counts'), RatingEvent.objects.latest('event_id').event_id)
+
+    def test_failed_derived_update_rolls_back_the_write(self):
+        self.client.post(f'/api/ratings/{self.m1.movie_id}/', {'rating': 3})
+        rating = Rating.objects.get(user=self.user, movie=self.m1)
+
+        with mock.patch('movies.aggregates.record_rating_events', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.client.put(f'/api/ratings/{rating.rating_id}/edit/', {'rating': 5})
+            with self.assertRaises(RuntimeError):
+                self.client.delete(f'/api/ratings/{rating.rating_id}/delete/')
+
+        rating.refresh_from_db()
+        self.assertEqual(rating.score, 3.0)
+        self.assertEqual(list(RatingEvent.objects.values_list('kind', flat=True)), ['create'])
+        self.m1.refresh_from_db()
+        self.assertEqual((self.m1.rating_count, self.m1.rating_sum), (1, 3.0))
+
+    def _event(self, event_id):
+        return RatingEvent.objects.create(event_id=event_id, kind='create', user_id=self.user.user_id,
+                                          movie_id=self.m2.movie_id, new_score=4)
+
+    @override_settings(RATING_EVENT_GAP_TIMEOUT_SECONDS=30)
+    def test_consumer_stops_at_gaps(self):
+        self._write_history()
+        last = RatingEvent.objects.latest('event_id').event_id
+        self._event(last + 2)  # last + 1 is still in flight
+        seen = []
+
+        def handler(batch):
+            seen.extend(event.event_id for event in batch)
+
+        self.assertEqual(events.catch_up('gaps', handler), 4)
+        self.assertEqual(events.consume('gaps', handler), 0)
+        self.assertEqual(events.consumer_position('gaps'), last)
+
+        # the missing event commits: both are read, in order
+        self._event(last + 1)
+        self.assertEqual(events.consume('gaps', handler), 2)
+        self.assertEqual(seen[-2:], [last + 1, last + 2])
+
+        # a gap that never fills is skipped once the timeout has passed
+        self._event(last + 4)
+        start = timezone.now()
+        with mock.patch('movies.events.timezone.now', return_value=start):
+            self.assertEqual(events.consume('gaps', handler), 0)
+        with mock.patch('movies.events.timezone.now', return_value=start + timedelta(seconds=29)):
+            self.assertEqual(events.consume('gaps', handler), 0)
+        with mock.patch('movies.events.timezone.now', return_value=start + timedelta(seconds=30)):
+            self.assertEqual(events.consume('gaps', handler), 1)
+        self.assertEqual(seen[-1], last + 4)
+        self.assertIsNone(RatingEventConsumer.objects.get(name='gaps').blocked_since)
+
+    def test_failed_handler_keeps_position(self):
+        self._write_history()
+
+        def handler(batch):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            events.consume('broken', handler)
+        self.assertEqual(events.consumer_position('broken'), 0)
+        self.assertFalse(RatingEventConsumer.objects.filter(name='broken').exists())
+
+
+@override_settings(
+    DATABASES=SQLITE_DB,
+    RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS=30,
+    RECOMMENDATION_REFRESH_MAX_DELAY_SECONDS=120,
+)
+class DebouncedRefreshTests(TestCase):
+    """A burst of rating writes becomes one refresh, run after the window"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="db", email="db@e.com", password="p")
+        cls.other = AppUser.objects.create(username="do", email="do@e.com", password="p")
+        cls.movies = [Movie.objects.create(title=f"D{i}", genre="Drama", description="D") for i in range(6)]
+        Rating.objects.create(user=cls.other, movie=cls.movies[5], score=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        s = self.client.session
+        s['user_id'] = self.user.user_id
+        s.save()
+
+    def _run_worker(self, at):
+        with mock.patch('movies.jobs.timezone.now', return_value=at):
+            return call_command('process_recommendation_jobs', '--once', stdout=StringIO())
+
+    def test_burst_is_coalesced_and_debounced(self):
+        start = timezone.now()
+        for i, movie in enumerate(self.movies[:5]):
+            with mock.patch('movies.jobs.timezone.now', return_value=start + timedelta(seconds=10 * i)):
+                self.client.post(f'/api/ratings/{movie.movie_id}/', {'rating': 4})
+
+        job = RecommendationJob.objects.get(user=self.user)
+        self.assertEqual(job.run_after, start + timedelta(seconds=70))
+
+        data = self.client.get('/api/recommendations/mine/').json()
+        self.assertTrue(data['freshness']['refresh_pending'])
+
+        # Still inside the window of the last write: nothing runs
+        self._run_worker(start + timedelta(seconds=60))
+        self.assertEqual(RecommendationJob.objects.get(user=self.user).status, 'pending')
+
+        with mock.patch('movies.jobs.generate_recommendations', wraps=generate_recommendations) as gen:
+            self._run_worker(start + timedelta(seconds=71))
+        self.assertEqual(gen.call_count, 1)
+        self.assertFalse(RecommendationJob.objects.exists())
+
+        data = self.client.get('/api/recommendations/mine/').json()
+        self.assertFalse(data['freshness']['refresh_pending'])
+        self.assertIsNone(data['freshness']['refresh_due_at'])
+        self.assertFalse(data['freshness']['is_stale'])
+
+    def test_max_delay_bounds_postponement(self):
+        self.client.post(f'/api/ratings/{self.movies[0].movie_id}/', {'rating': 4})
+        job = RecommendationJob.objects.get(user=self.user)
+        # keeps getting pushed back, but it was created long ago
+        RecommendationJob.objects.filter(pk=job.pk).update(
+            created_at=timezone.now() - timedelta(seconds=121),
+            run_after=timezone.now() + timedelta(seconds=30),
+        )
+        self._run_worker(timezone.now())
+        self.assertFalse(RecommendationJob.objects.exists())
+
+
+@override_settings(
+    DATABASES=SQLITE_DB,
+    RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS=0,
+    RECOMMENDATION_JOB_MAX_ATTEMPTS=3,
+    RECOMMENDATION_JOB_RETRY_BACKOFF_SECONDS=10,
+    RECOMMENDATION_JOB_TIMEOUT_SECONDS=600,
+)
+class RecommendationJobRetryTests(TestCase):
+    """Failed and abandoned jobs are retried with backoff, a bounded number of times"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AppUser.objects.create(username="jr", email="jr@e.com", password="p")
+        cls.movie = Movie.objects.create(title="J", genre="Drama", description="D")
+
+    def setUp(self):
+        logger = logging.getLogger('movies.jobs')
+        self.addCleanup(setattr, logger, 'disabled', logger.disabled)
+        logger.disabled = True
+
+    def _process(self, at, fail=False):
+        side_effect = RuntimeError("boom") if fail else None
+        with mock.patch('movies.jobs.timezone.now', return_value=at), \
+                mock.patch('movies.jobs.generate_recommendations', side_effect=side_effect) as gen:
+            process_pending_jobs()
+        return gen.call_count
+
+    def test_failures_back_off_then_give_up(self):
+        enqueue_recommendation_refresh(self.user.user_id)
+        start = timezone.now()
+
+        self.assertEqual(self._process(start, fail=True), 1)
+        job = RecommendationJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.error), ('pending', 1, 'boom'))
+        self.assertEqual(job.run_after, start + timedelta(seconds=10))
+
+        # not due before the backoff, even once the debounce cap has passed
+        self.assertEqual(self._process(start + timedelta(seconds=9), fail=True), 0)
+        self.assertEqual(self._process(start + timedelta(seconds=10), fail=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 2))
+        self.assertEqual(job.run_after, start + timedelta(seconds=30))
+
+        self.assertEqual(self._process(start + timedelta(seconds=30), fail=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertEqual(self._process(start + timedelta(hours=1)), 0)
+
+    def test_newer_pending_job_replaces_the_retry(self):
+        enqueue_recommendation_refresh(self.user.user_id)
+        job = claim_jobs()[0]
+        enqueue_recommendation_refresh(self.user.user_id)  # rated again while running
+        with mock.patch('movies.jobs.generate_recommendations', side_effect=RuntimeError("boom")):
+            self.assertFalse(run_job(job))
+        self.assertEqual(list(RecommendationJob.objects.values_list('status', 'attempts')), [('pending', 0)])
+
+    def test_stuck_running_job_is_requeued(self):
+        enqueue_recommendation_refresh(self.user.user_id)
+        start = timezone.now()
+        with mock.patch('movies.jobs.timezone.now', return_value=start):
+            claim_jobs()  # the worker dies without finishing the job
+
+        self.assertEqual(self._process(start + timedelta(seconds=599)), 0)
+        self.assertEqual(RecommendationJob.objects.get().status, 'running')
+
+        later = start + timedelta(seconds=601)
+        self.assertEqual(self._process(later), 0)
+        job = RecommendationJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.started_at), ('pending', 1, None))
+        self.assertEqual(self._process(later + timedelta(seconds=10)), 1)
+        self.assertFalse(RecommendationJob.objects.exists())
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class LoadMovielensTests(TestCase):
+    """load_movielens streams MovieLens CSVs in chunks and rebuilds derived data"""
+
+    MOVIES = (
+        "movieId,title,genres\n"
+        "1,Toy Story (1995),Adventure|Animation|Children\n"
+        "2,\"Shawshank Redemption, The (1994)\",Crime|Drama\n"
+        "3,Babylon 5,(no genres listed)\n"
+    )
+    RATINGS = (
+        "userId,movieId,rating,timestamp\n"
+        "1,1,4.0,964982703\n"
+        "1,2,5.0,964981247\n"
+        "2,1,3.5,964982224\n"
+        "2,3,2.0,964983815\n"
+        "3,2,4.5,964982931\n"
+    )
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self._write(self.MOVIES, self.RATINGS)
+
+    def _write(self, movies, ratings):
+        for name, body in (('movies.csv', movies), ('ratings.csv', ratings)):
+            with open(os.path.join(self.tmp, name), 'w', encoding='utf-8') as fh:
+                fh.write(body)
+
+    def _load(self, *args):
+        out = StringIO()
+        call_command('load_movielens', self.tmp, '--chunk-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def _id(self, kind, external_id):
+        return ExternalId.objects.get(source='ml', kind=kind, external_id=external_id).internal_id
+
+    def test_loads_movies_users_and_ratings(self):
+        admin = AppUser.objects.create(username="root", email="root@e.com", password="p", is_admin=True)
+        existing = Movie.objects.create(title="Ours", genre="Drama", description="D")
+
+        output = self._load()
+        self.assertIn('rows/s', output)
+
+        # External ids never land on existing rows
+        self.assertFalse(Rating.objects.filter(user=admin).exists())
+        existing.refresh_from_db()
+        self.assertEqual((existing.title, existing.rating_count), ("Ours", 0))
+        self.assertNotIn(existing.pk, [self._id('movie', ext) for ext in (1, 2, 3)])
+        self.assertNotIn(admin.pk, [self._id('user', ext) for ext in (1, 2, 3)])
+
+        toy = Movie.objects.get(pk=self._id('movie', 1))
+        self.assertEqual((toy.title, toy.year, toy.genre), ('Toy Story', 1995, 'Adventure, Animation, Children'))
+        self.assertEqual(Movie.objects.get(pk=self._id('movie', 2)).title, 'Shawshank Redemption, The')
+        babylon = Movie.objects.get(pk=self._id('movie', 3))
+        self.assertEqual((babylon.year, babylon.genre), (None, ''))
+        self.assertEqual(set(toy.genres.values_list('name', flat=True)), {'adventure', 'animation', 'children'})
+
+        user1 = AppUser.objects.get(pk=self._id('user', 1))
+        self.assertEqual(user1.username, 'ml_1')
+        self.assertFalse(user1.password.startswith('pbkdf2'))
+        self.assertEqual(Rating.objects.get(user_id=self._id('user', 2), movie=toy).score, 3.5)
+
+        toy.refresh_from_db()
+        self.assertEqual((toy.rating_count, toy.rating_sum), (2, 7.5))
+        self.assertEqual(MovieRatingStats.objects.get(movie_id=self._id('movie', 2)).rating_count, 2)
+        call_command('check_movie_counters', stdout=StringIO())
+
+        # pair stats are opt-in
+        self.assertFalse(UserPairStats.objects.exists())
+        self._load('--rebuild-pairs')
+        self.assertTrue(UserPairStats.objects.filter(
+            user_a_id=self._id('user', 1), user_b_id=self._id('user', 2),
+        ).exists())
+
+    def test_reimport_updates_in_place(self):
+        self._load()
+        self._write(
+            self.MOVIES.replace('Toy Story (1995)', 'Toy Story (1996)'),
+            self.RATINGS.replace('2,1,3.5', '2,1,1.0'),
+        )
+        self._load()
+
+        self.assertEqual(Movie.objects.count(), 3)
+        self.assertEqual(AppUser.objects.count(), 3)
+        self.assertEqual(Rating.objects.count(), 5)
+        toy = self._id('movie', 1)
+        self.assertEqual(Movie.objects.get(pk=toy).year, 1996)
+        self.assertEqual(Rating.objects.get(user_id=self._id('user', 2), movie_id=toy).score, 1.0)
+        self.assertEqual(MovieRatingStats.objects.get(movie_id=toy).rating_sum, 5.0)
+
+    def test_refuses_clashing_usernames(self):
+        AppUser.objects.create(username="ml_1", email="taken@e.com", password="p")
+        with self.assertRaises(IntegrityError):
+            self._load()
+
+    def test_missing_files(self):
+        with self.assertRaises(CommandError):
+            call_command('load_movielens', os.path.join(self.tmp, 'nope'), stdout=StringIO())
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class NdjsonExportTests(TestCase):
+    """Admin exports stream NDJSON from a server-side iterator"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = AppUser.objects.create(username="ex", email="ex@e.com", password="p", is_admin=True)
+        cls.user = AppUser.objects.create(username="eu", email="eu@e.com", password="p")
+        cls.movies = [Movie.objects.create(title=f"X{i}", genre="Drama", description="D", year=2000 + i) for i in range(5)]
+        cls.ratings = [Rating.objects.create(user=cls.user, movie=m, score=i + 1) for i, m in enumerate(cls.movies)]
+        Rating.objects.filter(pk=cls.ratings[0].pk).update(created_at=timezone.now().date() - timedelta(days=30))
+
+    def _login(self, user):
+        self.client = APIClient()
+        s = self.client.session
+        s['user_id'] = user.user_id
+        s.save()
+
+    def _export(self, path):
+        resp = self.client.get(path)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        body = b''.join(resp.streaming_content).decode()
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_exports_every_row_in_id_order(self):
+        self._login(self.admin)
+        with mock.patch('movies.exports.EXPORT_CHUNK_SIZE', 2):
+            rows = self._export('/api/admin/export/ratings/')
+            chunks = list(exports.stream_ndjson('ratings'))
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [2, 2, 1])
+        self.assertEqual([r['rating_id'] for r in rows], [r.rating_id for r in self.ratings])
+        self.assertEqual(rows[1], {
+            'rating_id': self.ratings[1].rating_id, 'user_id': self.user.user_id,
+            'movie_id': self.movies[1].movie_id, 'score': 2.0,
+            'created_at': self.ratings[1].created_at.isoformat(),
+        })
+        movies = self._export('/api/admin/export/movies/')
+        self.assertEqual(movies[0]['rating_count'], 1)
+        users = self._export('/api/admin/export/users/')
+        self.assertNotIn('password', users[0])
+
+    def test_since_filters(self):
+        self._login(self.admin)
+        rows = self._export(f'/api/admin/export/ratings/?since={self.ratings[2].rating_id}')
+        self.assertEqual([r['rating_id'] for r in rows], [r.rating_id for r in self.ratings[3:]])
+        since = (timezone.now().date() - timedelta(days=1)).isoformat()
+        rows = self._export(f'/api/admin/export/ratings/?since={since}')
+        self.assertEqual(len(rows), 4)
+        rows = self._export(f'/api/admin/export/movies/?since={self.movies[3].movie_id}')
+        self.assertEqual([r['movie_id'] for r in rows], [self.movies[4].movie_id])
+
+        self.assertEqual(self.client.get('/api/admin/export/movies/?since=2024-01-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/export/ratings/?since=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/export/passwords/').status_code, 404)
+
+    def test_admin_only(self):
+        self.assertEqual(APIClient().get('/api/admin/export/ratings/').status_code, 401)
+        self._login(self.user)
+        self.assertEqual(self.client.get('/api/admin/export/ratings/').status_code, 403)
+
+
+@override_settings(DATABASES=SQLITE_DB)
+class SystemStatsSnapshotTests(TestCase):
+    """Admin statistics are read from one incrementally maintained row"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = AppUser.objects.create(username="sa", email="sa@e.com", password="p", is_admin=True)
+        cls.user = AppUser.objects.create(username="su", email="su@e.com", password="p")
+        cls.m1 = Movie.objects.create(title="S1", genre="Drama", description="D")
+        cls.m2 = Movie.objects.create(title="S2", genre="Drama", description="D")
+        Rating.objects.create(user=cls.user, movie=cls.m1, score=4)
+
+    def setUp(self):
+        self.client = APIClient()
+        s = self.client.session
+        s['user_id'] = self.admin.user_id
+        s.save()
+
+    def _stats(self, query=''):
+        resp = self.client.get('/api/admin/statistics/' + query)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_snapshot_follows_writes_without_rescanning(self):
+        first = self._stats()
+        self.assertEqual((first['total_users'], first['total_movies'], first['total_ratings']), (2, 2, 1))
+        self.assertIsNotNone(first['as_of'])
+
+        # movie and user writes adjust the stored row; rating writes leave it alone
+        other = AppUser.objects.create(username="s3", email="s3@e.com", password="p")
+        with CaptureQueriesContext(connection) as ctx:
+            rating = Rating.objects.create(user=other, movie=self.m2, score=5)
+            Rating.objects.create(user=self.user, movie=self.m2, score=3)
+            rating.score = 1
+            rating.save()
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'system_stats' in q['sql']])
+        m3 = Movie.objects.create(title="S3", genre="Drama", description="D")
+        Movie.objects.filter(pk=self.m1.pk).first().delete()
+        self.assertEqual(self._stats()['total_ratings'], 1)
+
+        # the worker folds the rating events in
+        self.assertEqual(catch_up_system_stats(), 4)
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._stats()
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if 'COUNT(' in q['sql'].upper()])
+        self.assertEqual((data['total_users'], data['total_movies'], data['total_ratings']), (3, 2, 2))
+        self.assertEqual(data['as_of'], first['as_of'])
+        self.assertEqual([m['movie_id'] for m in data['top_movies_most_ratings']], [self.m2.movie_id])
+        self.assertNotIn(m3.movie_id, [m['movie_id'] for m in data['top_movies_highest_avg']])
+
+        fresh = self._stats('?fresh=1')
+        self.assertEqual({k: fresh[k] for k in ('total_users', 'total_movies', 'total_ratings')},
+                         {k: data[k] for k in ('total_users', 'total_movies', 'total_ratings')})
+        self.assertGreater(fresh['as_of'], first['as_of'])
+        # a full refresh skips the events it already counted
+        self.assertEqual(catch_up_system_stats(), 0)
+        self.assertEqual(SystemStats.objects.get().total_ratings, 2)
+
+    def test_worker_refreshes_the_top_lists(self):
+        self._stats()
+        Rating.objects.create(user=self.admin, movie=self.m2, score=5)
+        Rating.objects.create(user=self.user, movie=self.m2, score=5)
+        call_command('process_recommendation_jobs', '--once', stdout=StringIO())
+        data = self._stats()
+        self.assertEqual(data['total_ratings'], 3)
+        self.assertEqual(data['top_movies_most_ratings'][0]['movie_id'], self.m2.movie_id)
+
+    def test_refresh_command(self):
+        call_command('refresh_system_stats', stdout=StringIO())
+        # a write that bypasses the signals is picked up by the periodic refresh
+        Rating.objects.bulk_create([Rating(user=self.admin, movie=self.m2, score=2)])
+        self.assertEqual(SystemStats.objects.get().total_ratings, 1)
+        call_command('refresh_system_stats', stdout=StringIO())
+        self.assertEqual(SystemStats.objects.get().total_ratings, 2)
+        self.assertEqual(self._stats()['top_movies_most_ratings'][0]['num_ratings'], 1)
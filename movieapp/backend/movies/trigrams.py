@@ -0,0 +1,143 @@
+"""
+Fuzzy (typo-tolerant) and substring title / director search.
+
+PostgreSQL: pg_trgm GIN indexes on movie.title and movie.director
+(migration 0012); rows match with the `%` similarity operator or ILIKE and
+are ranked with similarity().
+Other backends (SQLite, tests): a per-process trigram inverted index built
+from the catalog and rebuilt when the catalog version changes.
+
+Trigrams and similarity follow pg_trgm: every word is lower-cased and padded
+with two spaces in front and one behind, and similarity is
+shared / (|a| + |b| - shared).
+"""
+
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+
+from .freshness import current_catalog_version
+from .models import Movie
+from .search import no_matches
+
+# Same default as pg_trgm.similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+# Matches handed to the SQL query (filters, sorting, pagination) on SQLite
+MAX_FUZZY_MATCHES = 200
+
+_WORDS = re.compile(r"\w+")
+
+
+def normalize(text):
+    return ' '.join(_WORDS.findall((text or '').lower()))
+
+
+def trigrams(text):
+    grams = set()
+    for word in _WORDS.findall((text or '').lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Inverted index trigram -> documents, one document per title / director."""
+
+    def __init__(self, rows):
+        self.movie_ids = []
+        self.texts = []
+        self.sizes = []
+        postings = defaultdict(list)
+        for movie_id, *fields in rows:
+            for text in fields:
+                grams = trigrams(text)
+                if not grams:
+                    continue
+                doc = len(self.movie_ids)
+                self.movie_ids.append(movie_id)
+                self.texts.append(normalize(text))
+                self.sizes.append(len(grams))
+                for gram in grams:
+                    postings[gram].append(doc)
+        self.postings = dict(postings)
+
+    def search(self, query, threshold=SIMILARITY_THRESHOLD, limit=MAX_FUZZY_MATCHES):
+        """
+        {movie_id: similarity} of the best `limit` movies whose title or
+        director is similar to `query` or contains it.
+        """
+        query_grams = trigrams(query)
+        if not query_grams:
+            return {}
+        needle = normalize(query)
+
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scores = {}
+        for doc, common in shared.items():
+            similarity = common / (len(query_grams) + self.sizes[doc] - common)
+            if similarity < threshold and needle not in self.texts[doc]:
+                continue
+            movie_id = self.movie_ids[doc]
+            if similarity > scores.get(movie_id, -1.0):
+                scores[movie_id] = similarity
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return dict(best)
+
+
+_cache = {'index': None, 'version': None}
+_cache_lock = threading.Lock()
+
+
+def get_trigram_index():
+    """Per-process TrigramIndex, rebuilt lazily when the catalog changes."""
+    version = current_catalog_version()
+    with _cache_lock:
+        if _cache['version'] != version:
+            _cache['index'] = TrigramIndex(Movie.objects.values_list('movie_id', 'title', 'director'))
+            _cache['version'] = version
+        return _cache['index']
+
+
+def apply_fuzzy_search(queryset, query):
+    """
+    Filter a Movie queryset to titles / directors similar to `query` and
+    annotate `search_rank` with the similarity (higher is closer).
+    """
+    if not trigrams(query):
+        return no_matches(queryset)
+
+    if connection.vendor == 'postgresql':
+        like = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return queryset.filter(
+            RawSQL(
+                "(movie.title %% %s OR movie.director %% %s "
+                "OR movie.title ILIKE %s OR movie.director ILIKE %s)",
+                [query, query, like, like],
+                output_field=BooleanField(),
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                "GREATEST(similarity(movie.title, %s), similarity(coalesce(movie.director, ''), %s))",
+                [query, query],
+                output_field=FloatField(),
+            )
+        )
+
+    scores = get_trigram_index().search(query)
+    if not scores:
+        return no_matches(queryset)
+    return queryset.filter(movie_id__in=list(scores)).annotate(
+        search_rank=Case(
+            *(When(movie_id=movie_id, then=Value(score)) for movie_id, score in scores.items()),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
@@ -12,12 +12,23 @@ from collections import defaultdict
 from django.contrib.auth.hashers import check_password, make_password
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
-from django.db.models import Count, Avg, Q
+from django.db import IntegrityError, transaction
+from django.http import StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import AppUser, Movie, Rating, Recommendation
-from django.db.models import Avg, Count, Q
+from .models import AppUser, Movie, Rating, Recommendation, RecommendationState, SystemStats
+from .aggregates import apply_rating_changes, refresh_system_stats
+from .exports import DATASETS as EXPORT_DATASETS, export_queryset, stream_ndjson
+from .autocomplete import MAX_RESULTS as AUTOCOMPLETE_MAX_RESULTS, get_title_index
+from .facets import compute_facets
+from .freshness import current_watermark, describe_freshness
+from .jobs import enqueue_recommendation_refresh, pending_refresh
+from .ratings import is_duplicate_rating, lock_user_ratings, upsert_rating
+from .pagination import CATALOG_SORTS, SORTS, InvalidCursor, order_for, paginate, wants_page
+from .search import apply_text_search
+from .trigrams import apply_fuzzy_search
+from .recommender import generate_recommendations
 from django.contrib.auth import update_session_auth_hash
 import random
 
@@ -87,178 +98,6 @@ def _create_user(username, email, password):
     )
 
 
-def _calculate_genre_preferences(user_ratings):
-    """
-    Build a per-genre preference profile using the user's historical ratings.
-    """
-    genre_totals = defaultdict(lambda: {"sum": 0.0, "count": 0})
-    for rating in user_ratings:
-        genre = (rating.movie.genre or "").strip().lower()
-        if not genre:
-            continue
-        entry = genre_totals[genre]
-        entry["sum"] += rating.score
-        entry["count"] += 1
-
-    return {
-        genre: bucket["sum"] / bucket["count"]
-        for genre, bucket in genre_totals.items()
-        if bucket["count"] > 0
-    }
-
-
-def _predict_content_scores(candidates, genre_preferences):
-    """
-    Apply the genre profile to unseen movies to estimate a score.
-    """
-    if not genre_preferences:
-        return {}
-
-    scores = {}
-    for movie in candidates:
-        genre = (movie.genre or "").strip().lower()
-        pref = genre_preferences.get(genre)
-        if pref is not None:
-            scores[movie.movie_id] = pref
-    return scores
-
-
-def _predict_collaborative_scores(target_user, user_ratings_map):
-    """
-    Estimate scores using a lightweight user-based collaborative filter.
-    """
-    other_ratings = (
-        Rating.objects.exclude(user=target_user)
-        .select_related("user")
-        .all()
-    )
-
-    ratings_by_user = defaultdict(list)
-    for rating in other_ratings:
-        ratings_by_user[rating.user_id].append(rating)
-
-    similarities = {}
-    for other_id, ratings in ratings_by_user.items():
-        diffs = [
-            abs(r.score - user_ratings_map[r.movie_id])
-            for r in ratings
-            if r.movie_id in user_ratings_map
-        ]
-        if not diffs:
-            continue
-        avg_diff = sum(diffs) / len(diffs)
-        similarities[other_id] = 1 / (1 + avg_diff)
-
-    movie_weights = defaultdict(lambda: {"total": 0.0, "weight": 0.0})
-    for other_id, ratings in ratings_by_user.items():
-        similarity = similarities.get(other_id)
-        if not similarity:
-            continue
-        for rating in ratings:
-            if rating.movie_id in user_ratings_map:
-                continue
-            bucket = movie_weights[rating.movie_id]
-            bucket["total"] += similarity * rating.score
-            bucket["weight"] += similarity
-
-    return {
-        movie_id: bucket["total"] / bucket["weight"]
-        for movie_id, bucket in movie_weights.items()
-        if bucket["weight"] > 0
-    }
-
-def _generate_recommendations(user):
-    """
-    Gera recomendações com 3 níveis de tentativa:
-    1. Híbrido (Se tiver histórico e matches)
-    2. Top Global (Se for user novo ou algoritmo falhar)
-    3. Aleatório (Se o sistema estiver vazio de ratings e precisar de encher chouriços)
-    """
-    
-    # Busca histórico do user
-    user_ratings = list(Rating.objects.filter(user=user).select_related('movie'))
-    
-    # Lista de IDs que o user já viu (para não recomendar repetidos)
-    watched_ids = {r.movie_id for r in user_ratings}
-    
-    top_entries = []
-
-    # --- FASE 1: Tentar Algoritmo Personalizado (Só se o user tiver histórico) ---
-    if user_ratings:
-        user_ratings_map = {r.movie_id: r.score for r in user_ratings}
-        candidates = list(Movie.objects.exclude(movie_id__in=watched_ids))
-        
-        if candidates:
-            genre_preferences = _calculate_genre_preferences(user_ratings)
-            content_predictions = _predict_content_scores(candidates, genre_preferences)
-            collaborative_predictions = _predict_collaborative_scores(user, user_ratings_map)
-
-            combined = []
-            for movie in candidates:
-                collab = collaborative_predictions.get(movie.movie_id)
-                content = content_predictions.get(movie.movie_id)
-                
-                if collab is None and content is None:
-                    continue
-                
-                if collab is None: score = content
-                elif content is None: score = collab
-                else: score = (0.6 * collab) + (0.4 * content)
-
-                combined.append({'movie': movie, 'predicted_score': score})
-            
-            combined.sort(key=lambda x: x['predicted_score'], reverse=True)
-            top_entries = combined[:10]
-
-    # --- FASE 2: Fallback para Top Global (Se Fase 1 falhou ou User é Novo) ---
-    # Se ainda não temos 10 filmes, vamos buscar os melhores da BD
-    if len(top_entries) < 10:
-        needed = 10 - len(top_entries)
-        
-        # CORREÇÃO AQUI: .filter(avg__isnull=False) garante que tem ratings!
-        top_global = Movie.objects.exclude(movie_id__in=watched_ids)\
-            .annotate(avg=Avg('ratings__score'))\
-            .filter(avg__isnull=False)\
-            .order_by('-avg')[:needed]
-        
-        for movie in top_global:
-            # Já sabemos que tem avg, mas por segurança fazemos cast
-            score = float(movie.avg) if movie.avg else 0.0
-            
-            # Evita duplicados caso já tenha vindo da Fase 1 (raro mas possível)
-            if not any(e['movie'].movie_id == movie.movie_id for e in top_entries):
-                top_entries.append({'movie': movie, 'predicted_score': score})
-
-    # --- FASE 3: Fallback Final (Se Fase 2 não chegou - BD com poucos ratings) ---
-    # Se mesmo assim não temos 10 filmes (ex: BD nova, ninguém avaliou nada),
-    # enchemos com filmes aleatórios para não mostrar ecrã vazio.
-    if len(top_entries) < 10:
-        current_ids = {e['movie'].movie_id for e in top_entries}
-        exclude_ids = watched_ids.union(current_ids)
-        
-        needed = 10 - len(top_entries)
-        # Traz quaisquer filmes que faltem
-        fillers = list(Movie.objects.exclude(movie_id__in=exclude_ids)[:needed])
-        
-        for movie in fillers:
-            # Score 0 porque são fillers
-            top_entries.append({'movie': movie, 'predicted_score': 0})
-
-    # --- SALVAR ---
-    if top_entries:
-        Recommendation.objects.filter(user=user).delete()
-        Recommendation.objects.bulk_create([
-            Recommendation(
-                user=user,
-                movie=entry['movie'],
-                predicted_score=round(entry['predicted_score'], 2),
-            )
-            for entry in top_entries
-        ])
-        return True
-    
-    return False
-
 @api_view(['GET'])
 def user_list(request):
     """
@@ -409,15 +248,24 @@ def create_rating(request, movie_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
     
-    # save the new rating
-    rating = Rating.objects.create(
-        score=rating_int,
-        movie_id=movie_id,
-        user_id=user_id,
-    )
+    # save the new rating (the unique (user, movie) constraint catches concurrent duplicates)
+    try:
+        with transaction.atomic():
+            rating = Rating.objects.create(
+                score=rating_int,
+                movie_id=movie_id,
+                user_id=user_id,
+            )
+    except IntegrityError as error:
+        if not is_duplicate_rating(error):
+            raise
+        return Response(
+            {'error': 'You have already rated this movie'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-    user = AppUser.objects.get(user_id=user_id)
-    _generate_recommendations(user)
+    # recommendations are rebuilt by the background worker
+    enqueue_recommendation_refresh(user_id)
 
     return Response(
         {
@@ -432,6 +280,165 @@ def create_rating(request, movie_id):
         status=status.HTTP_201_CREATED,
     )
 
+MAX_BULK_RATINGS = 500
+
+
+def _parse_rating_value(value):
+    """Rating as an int in 1..5, or (None, error message)"""
+    if value is None:
+        return None, 'Rating is required'
+    try:
+        value = int(value)
+    except (ValueError, TypeError):
+        return None, 'Rating must be a valid integer'
+    if not (1 <= value <= 5):
+        return None, 'Rating must be between 1 and 5'
+    return value, None
+
+
+@api_view(['POST'])
+def bulk_create_ratings(request):
+    """
+    POST /api/ratings/bulk/ -> Create or update many ratings of the logged in user.
+    Body: {"ratings": [{"movie_id": 1, "rating": 4}, ...]}
+    Returns one result per item, in order: created, updated, unchanged or error.
+    """
+    error_response, user_id = _check_user_logged_in(request)
+    if error_response:
+        return error_response
+
+    items = request.data.get('ratings')
+    if not isinstance(items, list) or not items:
+        return Response(
+            {'error': 'ratings must be a non-empty list'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(items) > MAX_BULK_RATINGS:
+        return Response(
+            {'error': f'At most {MAX_BULK_RATINGS} ratings per request'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # 1. Validate the whole batch in memory
+    results, valid = [], {}
+    for index, item in enumerate(items):
+        movie_id = item.get('movie_id') if isinstance(item, dict) else None
+        result = {'index': index, 'movie_id': movie_id}
+        results.append(result)
+        try:
+            movie_id = int(movie_id)
+        except (ValueError, TypeError):
+            result.update(status='error', error='movie_id must be an integer')
+            continue
+        score, error = _parse_rating_value(item.get('rating'))
+        if error:
+            result.update(status='error', error=error)
+        elif movie_id in valid:
+            result.update(status='error', error='Duplicate movie in batch')
+        else:
+            valid[movie_id] = (index, score)
+
+    # 2. One query for the movies
+    known_movies = set(Movie.objects.filter(movie_id__in=list(valid)).values_list('movie_id', flat=True))
+    for movie_id in set(valid) - known_movies:
+        results[valid.pop(movie_id)[0]].update(status='error', error='Movie not found')
+
+    # 3. In one transaction: lock and read the user's existing ratings, then
+    # write everything (bulk writes skip the model signals)
+    changes = []
+    try:
+        with transaction.atomic():
+            lock_user_ratings(user_id)
+            existing = {
+                r.movie_id: r
+                for r in Rating.objects.select_for_update().filter(user_id=user_id, movie_id__in=list(valid))
+            }
+
+            to_create, to_update = [], []
+            for movie_id, (index, score) in valid.items():
+                rating = existing.get(movie_id)
+                if rating is None:
+                    to_create.append(Rating(user_id=user_id, movie_id=movie_id, score=score))
+                    changes.append((movie_id, None, score))
+                    results[index]['status'] = 'created'
+                elif rating.score == score:
+                    results[index]['status'] = 'unchanged'
+                else:
+                    changes.append((movie_id, rating.score, score))
+                    rating.score = score
+                    to_update.append(rating)
+                    results[index]['status'] = 'updated'
+
+            Rating.objects.bulk_create(to_create)
+            Rating.objects.bulk_update(to_update, ['score'])
+            apply_rating_changes(user_id, changes)
+    except IntegrityError:
+        return Response(
+            {'error': 'Ratings changed concurrently, please retry'},
+            status=status.HTTP_409_CONFLICT,
+        )
+
+    # recommendations are rebuilt once by the background worker
+    if changes:
+        enqueue_recommendation_refresh(user_id)
+
+    summary = defaultdict(int)
+    for result in results:
+        summary[result['status']] += 1
+    return Response(
+        {
+            'created': summary['created'],
+            'updated': summary['updated'],
+            'unchanged': summary['unchanged'],
+            'errors': summary['error'],
+            'results': results,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(['PUT'])
+def upsert_my_rating(request, movie_id):
+    """
+    PUT /api/movies/<id>/my-rating/ -> Create or replace the user's rating (1-5).
+    One INSERT ... ON CONFLICT DO UPDATE per call (see ratings.py).
+    """
+    error_response, user_id = _check_user_logged_in(request)
+    if error_response:
+        return error_response
+
+    score, error = _parse_rating_value(request.data.get('rating'))
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = upsert_rating(user_id, movie_id, score)
+    if result is None:
+        return Response(
+            {'error': 'Movie not found'},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    rating_id, created_at, old_score = result
+
+    # recommendations are rebuilt by the background worker
+    if old_score != score:
+        enqueue_recommendation_refresh(user_id)
+
+    created = old_score is None
+    return Response(
+        {
+            'message': 'Rating created successfully' if created else 'Rating updated successfully',
+            'rating': {
+                'rating_id': rating_id,
+                'score': score,
+                'created_at': created_at,
+                'movie_id': movie_id,
+                'user_id': user_id,
+            },
+        },
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+    )
+
+
 @api_view(['GET'])
 def get_movie_ratings(request, movie_id):
     """
@@ -538,12 +545,14 @@ def edit_rating(request, rating_id):
             status=status.HTTP_400_BAD_REQUEST,
         )
     
-    # update the rating
-    rating.score = rating_int
-    rating.save()
+    # update the rating; the signal handlers update the derived tables and
+    # the event log in the same transaction
+    with transaction.atomic():
+        rating.score = rating_int
+        rating.save()
 
-    user = AppUser.objects.get(user_id=user_id)
-    _generate_recommendations(user)
+    # recommendations are rebuilt by the background worker
+    enqueue_recommendation_refresh(user_id)
 
     return Response(
         {
@@ -584,11 +593,13 @@ def delete_rating(request, rating_id):
             status=status.HTTP_403_FORBIDDEN,
         )
     
-    # delete the rating
-    rating.delete()
+    # delete the rating (locked, so post_delete sees the committed score)
+    with transaction.atomic():
+        lock_user_ratings(user_id)
+        Rating.objects.select_for_update().get(rating_id=rating_id).delete()
 
-    user = AppUser.objects.get(user_id=user_id)
-    _generate_recommendations(user)
+    # recommendations are rebuilt by the background worker
+    enqueue_recommendation_refresh(user_id)
 
     return Response(
         {'message': 'Rating deleted successfully'},
@@ -645,6 +656,7 @@ def list_my_recommendations(request):
     """
     Lista as recomendações do utilizador.
     Se a lista estiver vazia, tenta gerar novas automaticamente.
+    Caso contrário serve a última lista gerada até o worker escrever uma nova.
     """
     error_response, user_id = _check_user_logged_in(request)
     if error_response:
@@ -661,7 +673,7 @@ def list_my_recommendations(request):
 
     # 2. Lógica "Lazy Loading": Se não existe nada, chama o Helper!
     if not recommendations.exists():
-        has_generated = _generate_recommendations(user)
+        has_generated = generate_recommendations(user)
         if has_generated:
             # Se gerou, recarrega a query para apanhar os dados novos
             recommendations = Recommendation.objects.filter(user=user).select_related('movie').order_by('-predicted_score')
@@ -678,11 +690,19 @@ def list_my_recommendations(request):
             'movie': movie_data 
         })
 
+    # 4. Quão atual é a lista (o worker pode ainda não a ter refeito)
+    state = RecommendationState.objects.filter(user=user).first()
+    freshness = describe_freshness(state, current_watermark(user_id))
+    refresh = pending_refresh(user_id)
+    freshness['refresh_pending'] = refresh is not None
+    freshness['refresh_due_at'] = refresh['due_at'] if refresh else None
+
     return Response(
         {
             'user_id': user_id,
             'total_recommendations': recommendations.count(),
             'recommendations': data,
+            'freshness': freshness,
         },
         status=status.HTTP_200_OK,
     )
@@ -902,7 +922,8 @@ def admin_edit_movie(request, movie_id):
     movie.year = year if year not in [None, ""] else None
     movie.description = description
     movie.poster_url = poster_url if poster_url not in [None, ""] else None
-    movie.save()
+    # rating_count / rating_sum / avg_rating are left out: rating writes update them with F()
+    movie.save(update_fields=['title', 'director', 'genre', 'year', 'description', 'poster_url', 'genre_mask'])
 
     return Response(
         {
@@ -953,11 +974,45 @@ def admin_delete_movie(request, movie_id):
         status=status.HTTP_200_OK,
     )
 
+@api_view(['GET'])
+def admin_export(request, dataset):
+    """
+    Admin endpoint streaming a whole table as NDJSON (one JSON object per line).
+    GET /api/admin/export/<ratings|movies|users>/?since=<id or, for ratings, YYYY-MM-DD>
+    """
+    error_response, user_id = _check_user_logged_in(request)
+    if error_response:
+        return error_response
+
+    error_response, user = _check_user_is_admin(user_id)
+    if error_response:
+        return error_response
+
+    if dataset not in EXPORT_DATASETS:
+        return Response(
+            {'error': f"Unknown export '{dataset}'. Available: {', '.join(EXPORT_DATASETS)}"},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+
+    since = request.query_params.get('since')
+    # validate before the response starts streaming
+    try:
+        export_queryset(dataset, since)
+    except ValueError:
+        return Response(
+            {'error': 'since must be an id' + (' or a YYYY-MM-DD date' if dataset == 'ratings' else '')},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    return StreamingHttpResponse(stream_ndjson(dataset, since), content_type='application/x-ndjson')
+
+
 @api_view(['GET'])
 def system_statistics(request):
     """
     Admin endpoint to retrieve system statistics (number of users, movies, ratings, 
     top movies with most ratings and top movies with most average rating).
+    Served from the SystemStats snapshot; ?fresh=1 recomputes it first.
     """
 
     # check if user is logged in
@@ -970,49 +1025,22 @@ def system_statistics(request):
     if error_response:
         return error_response
     
-    # statistics
-    total_users = AppUser.objects.count()
-    total_movies = Movie.objects.count()
-    total_ratings = Rating.objects.count()
-
-    # top movies with most ratings
-    top_movies_most_ratings = Movie.objects.annotate(
-        num_ratings=Count('ratings')
-    ).order_by('-num_ratings')[:5]
-
-    top_movies_most_ratings_data = []
-    for movie in top_movies_most_ratings:
-        top_movies_most_ratings_data.append({
-            'movie_id': movie.movie_id,
-            'title': movie.title,
-            'genre': movie.genre,
-            'description': movie.description,
-            'num_ratings': movie.num_ratings,
-        })
-
-    # top movies with highest average rating
-    top_movies_highest_avg = Movie.objects.annotate(
-        avg_rating=Avg('ratings__score')
-    ).filter(avg_rating__isnull=False).order_by('-avg_rating')[:5]
-
-    top_movies_highest_avg_data = []
-    for movie in top_movies_highest_avg:
-        top_movies_highest_avg_data.append({
-            'movie_id': movie.movie_id,
-            'title': movie.title,
-            'genre': movie.genre,
-            'description': movie.description,
-            'avg_rating': movie.avg_rating,
-        })
-        
+    # statistics (one row, kept up to date by the write paths)
+    stats = None
+    if request.query_params.get('fresh') not in ('1', 'true'):
+        stats = SystemStats.objects.filter(pk=1).first()
+    if stats is None:
+        stats = refresh_system_stats()
 
     return Response(
         {
-            'total_users': total_users,
-            'total_movies': total_movies,
-            'total_ratings': total_ratings,
-            'top_movies_most_ratings': top_movies_most_ratings_data,
-            'top_movies_highest_avg': top_movies_highest_avg_data,
+            'total_users': stats.total_users,
+            'total_movies': stats.total_movies,
+            'total_ratings': stats.total_ratings,
+            'top_movies_most_ratings': stats.top_movies_most_ratings,
+            'top_movies_highest_avg': stats.top_movies_highest_avg,
+            'as_of': stats.refreshed_at,
+            'totals_as_of': stats.updated_at,
         },
         status=status.HTTP_200_OK,
     )
@@ -1225,13 +1253,40 @@ def user_recommendation_history(request):
 def movie_list(request):
     """
     GET /api/movies/ -> List all movies
+    Query params (optional):
+        ?sort=title|year|rating
+        &limit=50&cursor=<token>   (keyset pagination, see pagination.py)
     """
-    movies = Movie.objects.all().order_by('title')
+    sort_by = request.GET.get('sort', 'title')
+    if sort_by not in CATALOG_SORTS:
+        sort_by = 'title'
+
+    if wants_page(request.GET):
+        return _movie_page_response(Movie.objects.all(), sort_by, request)
+
+    movies = order_for(Movie.objects.all(), sort_by)
     data = [_serialize_movie(m) for m in movies]
     
     return Response({
         'movies': data,
-        'total': movies.count(),
+        'total': len(data),
+    })
+
+
+def _movie_page_response(movies, sort_by, request, extra=None):
+    """One keyset page of `movies` with opaque next/prev cursors"""
+    try:
+        page, next_cursor, prev_cursor = paginate(movies, sort_by, request.GET)
+    except InvalidCursor as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    data = [_serialize_movie(m) for m in page]
+    return Response({
+        'movies': data,
+        'count': len(data),
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        **(extra or {}),
     })
 
 
@@ -1269,21 +1324,26 @@ def movie_search(request):
     """
     GET /api/movies/search/ -> Search movies
     Query params: 
-        ?q=query          (searches title, director)
+        ?q=query          (full-text: title, director, genre, description)
+        &fuzzy=1          (q matched by trigram similarity on title / director)
         &genre=action
         &year_min=2000
         &year_max=2024
         &rating_min=3.5
-        &sort=title|year|rating
+        &sort=relevance|title|year|rating   (relevance is the default when q is given)
+        &limit=50&cursor=<token>   (keyset pagination, see pagination.py)
+        &facets=1         (genre / decade / rating bucket counts of all matches)
     """
     movies = Movie.objects.all()
     
-    # Text search (title or director)
+    # Text search (full-text index, ranked; see search.py)
     query = request.GET.get('q', '').strip()
     if query:
-        movies = movies.filter(
-            Q(title__icontains=query) | Q(director__icontains=query)
-        )
+        if request.GET.get('fuzzy') in ('1', 'true'):
+            movies = apply_fuzzy_search(movies, query)
+        else:
+            movies = apply_text_search(movies, query)
+    default_sort = 'relevance' if query else 'title'
     
     # Genre filter
     genre = request.GET.get('genre', '').strip()
@@ -1305,51 +1365,53 @@ def movie_search(request):
         except ValueError:
             pass
     
-    # Rating filter (filter in Python after loading)
+    # Rating filter (in SQL, on the averages stored with each movie)
     rating_min = request.GET.get('rating_min')
     if rating_min:
         try:
-            rating_min = float(rating_min)
-            movies_list = list(movies)
-            movies_list = [m for m in movies_list if m.average_rating >= rating_min]
-            
-            # Apply sorting
-            sort_by = request.GET.get('sort', 'title')
-            if sort_by == 'year':
-                movies_list.sort(key=lambda m: m.year or 0, reverse=True)
-            elif sort_by == 'rating':
-                movies_list.sort(key=lambda m: m.average_rating, reverse=True)
-            else:
-                movies_list.sort(key=lambda m: m.title.lower())
-            
-            data = [_serialize_movie(m) for m in movies_list]
-            return Response({
-                'movies': data,
-                'count': len(data),
-            })
+            movies = movies.filter(avg_rating__gte=float(rating_min))
         except ValueError:
             pass
     
-    # Sorting (without rating filter)
-    sort_by = request.GET.get('sort', 'title')
-    if sort_by == 'year':
-        movies = movies.order_by('-year')
-    elif sort_by == 'rating':
-       
-        movies_list = list(movies)
-        movies_list.sort(key=lambda m: m.average_rating, reverse=True)
-        data = [_serialize_movie(m) for m in movies_list]
-        return Response({
-            'movies': data,
-            'count': len(data),
-        })
-    else:
-        movies = movies.order_by('title')
-    
-    data = [_serialize_movie(m) for m in movies]
+    # Facets over every match (one grouped query), not just the current page
+    extra = {}
+    if request.GET.get('facets') in ('1', 'true'):
+        extra['facets'] = compute_facets(movies)
+
+    # Sorting (in SQL; same orders as the keyset pages)
+    sort_by = request.GET.get('sort', default_sort)
+    if sort_by not in SORTS or (sort_by == 'relevance' and not query):
+        sort_by = 'title'
+    if wants_page(request.GET):
+        return _movie_page_response(movies, sort_by, request, extra)
+
+    data = [_serialize_movie(m) for m in order_for(movies, sort_by)]
     return Response({
         'movies': data,
         'count': len(data),
+        **extra,
+    })
+
+
+@api_view(['GET'])
+def movie_autocomplete(request):
+    """
+    GET /api/movies/autocomplete/?prefix=inter&limit=10
+    Title suggestions from the in-memory index (see autocomplete.py),
+    most rated first.
+    """
+    prefix = request.GET.get('prefix', '')
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_RESULTS))
+
+    index = get_title_index()
+    results = [index.describe(movie_id) for movie_id in index.complete(prefix, limit)]
+    return Response({
+        'prefix': prefix,
+        'results': results,
     })
 
 